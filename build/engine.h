@@ -0,0 +1,58 @@
+/* Generated by Cython 0.29.37 */
+
+#ifndef __PYX_HAVE__engine
+#define __PYX_HAVE__engine
+
+#include "Python.h"
+struct Material;
+
+/* "engine.pyx":18
+ *     void PyEval_SetProfile(Py_tracefunc, PyObject *)
+ * 
+ * cdef public class Material[object Material, type MaterialType]:             # <<<<<<<<<<<<<<
+ *     cdef public str name
+ *     "Material name"
+ */
+struct Material {
+  PyObject_HEAD
+  PyObject *name;
+  double durability;
+  double absorption;
+  double density;
+  double strength;
+  double ricochet;
+  double deflecting;
+  bool crumbly;
+};
+
+#ifndef __PYX_HAVE_API__engine
+
+#ifndef __PYX_EXTERN_C
+  #ifdef __cplusplus
+    #define __PYX_EXTERN_C extern "C"
+  #else
+    #define __PYX_EXTERN_C extern
+  #endif
+#endif
+
+#ifndef DL_IMPORT
+  #define DL_IMPORT(_T) _T
+#endif
+
+__PYX_EXTERN_C DL_IMPORT(PyTypeObject) MaterialType;
+
+__PYX_EXTERN_C struct MapData *mapDataRef(PyObject *);
+__PYX_EXTERN_C Vector *vectorRef(PyObject *);
+
+#endif /* !__PYX_HAVE_API__engine */
+
+/* WARNING: the interface of the module init function changed in CPython 3.5. */
+/* It now returns a PyModuleDef instance instead of a PyModule instance. */
+
+#if PY_MAJOR_VERSION < 3
+PyMODINIT_FUNC initengine(void);
+#else
+PyMODINIT_FUNC PyInit_engine(void);
+#endif
+
+#endif /* !__PYX_HAVE__engine */
@@ -4,13 +4,20 @@
 #include <Milsim/AABB.hxx>
 
 #include <Milsim/Fundamentals.hxx>
+#include <Milsim/Pool.hxx>
+#include <Milsim/Philox.hxx>
+#include <Milsim/Recorder.hxx>
+#include <Milsim/Histogram.hxx>
 
 #include <unordered_map>
 #include <utility>
 #include <cstdint>
 #include <vector>
+#include <memory>
+#include <limits>
+#include <array>
+#include <atomic>
 #include <chrono>
-#include <list>
 #include <map>
 
 #include <Python.hxx>
@@ -20,34 +27,59 @@
 
 #include <engine.h>
 
-struct Object {
+// Projectiles in flight are kept as a structure of arrays: the same index `i`
+// refers to the same object in every array. Dead objects are swap-removed,
+// so the position of an object inside the arrays is not stable; use `handle`
+// to refer to the object from the outside.
+class ObjectStore {
 private:
-    static uint64_t gidx;
+    static constexpr uint32_t nil = UINT32_MAX;
 
-    PyObject * _object; uint64_t _index; uint32_t _model;
-    int _thrower; double _timestamp, _v0;
+    // `_slot[id]` is the array index of the object with the given handle id,
+    // `_generation[id]` is bumped every time this id is released.
+    std::vector<uint32_t> _slot, _generation, _free;
+
+    uint64_t _total;
 
 public:
-    double mass, ballistic, area;
-    Vector3d position, velocity;
+    std::vector<PyObject *> object;
+    std::vector<uint64_t>   index, handle;
+    std::vector<uint32_t>   model;
+    std::vector<uint8_t>    hooks;
+    std::vector<int>        thrower;
+    std::vector<double>     timestamp, v0, mass, ballistic, area;
+    std::vector<Vector3d>   position, velocity;
+
+    inline ObjectStore() : _total(0) {}
+    inline ~ObjectStore() { clear(); }
 
-    inline static void     flush() { gidx = 0;    }
-    inline static uint64_t total() { return gidx; }
+    ObjectStore(const ObjectStore &) = delete;
+    ObjectStore & operator=(const ObjectStore &) = delete;
 
-    inline Object(PyObject * o, const uint32_t model, const int i, const Vector3d & r, const Vector3d & v, const double t) :
-    _object(o), _model(model), _thrower(i), _timestamp(t), _v0(v.abs()), position(r), velocity(v)
-    { Py_INCREF(o); _index = gidx++; }
+    inline size_t   size()  const { return object.size(); }
+    inline bool     empty() const { return object.empty(); }
+    inline uint64_t total() const { return _total; }
 
-    inline ~Object() { Py_DECREF(_object); }
+    inline void flush() { _total = 0; }
 
-    inline double energy() const { return 0.5 * mass * velocity.norm(); }
+    inline double energy(size_t i) const { return 0.5 * mass[i] * velocity[i].norm(); }
+
+    size_t push(PyObject *, const uint32_t model, const int thrower, const Vector3d & r, const Vector3d & v, const double t);
+    void erase(size_t i);
+    void clear();
 
-    inline PyObject * object()    const { return _object;    }
-    inline uint64_t   index()     const { return _index;     }
-    inline uint32_t   model()     const { return _model;     }
-    inline int        thrower()   const { return _thrower;   }
-    inline double     timestamp() const { return _timestamp; }
-    inline double     v0()        const { return _v0;        }
+    // Returns the array index of the object with the given handle or -1.
+    int64_t find(uint64_t h) const;
+
+    void reserve(size_t n);
+};
+
+// Cartridge registered with the engine, see `Engine::enroll`.
+// Bit `1 << kind` of `hooks` is set when hits of the kind are handled by the cartridge
+// itself (`on_block_hit`, `on_player_hit`).
+struct Cartridge {
+    PyOwnedRef object; uint32_t model; uint8_t hooks;
+    double mass, ballistic, area, muzzle, deviation, grouping;
 };
 
 struct Player {
@@ -90,46 +122,317 @@ struct Player {
     }
 };
 
+// Uniform grid over the XY plane used as a broad phase for `Player::intersect`.
+// It is rebuilt from the player positions at the beginning of every step.
+class PlayerGrid {
+private:
+    static constexpr int cellSize = 8, side = 512 / cellSize;
+
+    // Every hitbox (of any posture and rotated around the vertical axis) lies within
+    // `radius` horizontally and within [-below, above] vertically from the player position.
+    static constexpr double radius = 1.5, below = 1.5, above = 1.5;
+
+    struct Bounds { double x1, y1, z1, x2, y2, z2; int cx, cy; };
+
+    std::vector<uint32_t> start, count; std::vector<uint16_t> cell; std::vector<Bounds> bounds;
+
+    static inline int clamp(double x) { return int(std::clamp(x, 0.0, 511.0)) / cellSize; }
+
+public:
+    inline PlayerGrid() : start(side * side + 1, 0), count(side * side, 0) {}
+
+    void build(const std::vector<Player> &);
+
+    // Calls `f(k)` once for every player `k` whose bounds overlap the segment from `A` to `B`.
+    template<typename F> inline void query(const Vector3d & A, const Vector3d & B, F && f) const {
+        using namespace std;
+
+        if (bounds.empty()) return;
+
+        auto x1 = min(A.x, B.x), y1 = min(A.y, B.y), z1 = min(A.z, B.z);
+        auto x2 = max(A.x, B.x), y2 = max(A.y, B.y), z2 = max(A.z, B.z);
+
+        int cx1 = clamp(x1), cy1 = clamp(y1), cx2 = clamp(x2), cy2 = clamp(y2);
+
+        for (int cy = cy1; cy <= cy2; cy++)
+            for (int cx = cx1; cx <= cx2; cx++) {
+                auto c = cy * side + cx;
+
+                for (auto j = start[c]; j < start[c + 1]; j++) {
+                    auto k = cell[j]; auto & b = bounds[k];
+
+                    // A player spanning several cells is reported only from the first common one.
+                    if (cx != max(cx1, b.cx) || cy != max(cy1, b.cy)) continue;
+
+                    if (x2 < b.x1 || b.x2 < x1 || y2 < b.y1 || b.y2 < y1 || z2 < b.z1 || b.z2 < z1) continue;
+
+                    f(k);
+                }
+            }
+    }
+};
+
+// Two-level occupancy of the map: 8×8×8 bricks and 64×64×64 bricks (whole columns).
+// Building a block marks its bricks as occupied, while destroying one recomputes them,
+// so a brick may be spuriously occupied but never spuriously empty.
+// Everything outside of the map is empty.
+class Occupancy {
+private:
+    static constexpr int side1 = 512 / 8, height1 = 64 / 8, side2 = 512 / 64;
+
+    std::vector<uint8_t> level1; std::vector<uint16_t> level2;
+
+    static inline bool inside(int bx, int by, int bz)
+    { return 0 <= bx && bx < side1 && 0 <= by && by < side1 && 0 <= bz && bz < height1; }
+
+    static inline size_t index1(int bx, int by, int bz) { return bx + by * side1 + bz * side1 * side1; }
+    static inline size_t index2(int bx, int by)         { return (bx >> 3) + (by >> 3) * side2; }
+
+    // Returns the time (in blocks per unit of `v`) needed to come closer than `margin` to the boundary
+    // of the box of the given size containing the voxel (X, Y, Z) and sets `n` to the normal of this face.
+    template<int S, int H> static inline double leave(const Vector3d & r, const Vector3d & v, int X, int Y, int Z, Vector3d & n, const double margin) {
+        // The voxel (X, Y, Z) spans [X, X + 1) × [Y, Y + 1) × (Z − 1, Z].
+        const double x1 = std::floor(X / double(S)) * S + margin,     x2 = x1 + S - 2 * margin;
+        const double y1 = std::floor(Y / double(S)) * S + margin,     y2 = y1 + S - 2 * margin;
+        const double z1 = std::floor(Z / double(H)) * H - 1 + margin, z2 = z1 + H - 2 * margin;
+
+        double tx = v.x > 0 ? (x2 - r.x) / v.x : v.x < 0 ? (x1 - r.x) / v.x : INFINITY;
+        double ty = v.y > 0 ? (y2 - r.y) / v.y : v.y < 0 ? (y1 - r.y) / v.y : INFINITY;
+        double tz = v.z > 0 ? (z2 - r.z) / v.z : v.z < 0 ? (z1 - r.z) / v.z : INFINITY;
+
+        if (tx <= ty && tx <= tz) { n = Vector3d(-sign(v.x), 0, 0); return tx; }
+        if (ty <= tz)             { n = Vector3d(0, -sign(v.y), 0); return ty; }
+
+        n = Vector3d(0, 0, -sign(v.z)); return tz;
+    }
+
+public:
+    inline Occupancy() : level1(side1 * side1 * height1, 0), level2(side2 * side2, 0) {}
+
+    void build(MapData *);
+
+    // Must be called whenever a voxel becomes solid.
+    inline void mark(int x, int y, int z) {
+        int bx = x >> 3, by = y >> 3, bz = z >> 3; if (!inside(bx, by, bz)) return;
+
+        auto & b = level1[index1(bx, by, bz)]; if (b) return;
+
+        b = 1; level2[index2(bx, by)]++;
+    }
+
+    // Same for every voxel of the box [x1, x2) × [y1, y2) × [z1, z2).
+    inline void mark(int x1, int y1, int z1, int x2, int y2, int z2) {
+        for (int z = std::max(z1, 0) & ~7; z < std::min(z2, 64); z += 8)
+            for (int y = std::max(y1, 0) & ~7; y < std::min(y2, 512); y += 8)
+                for (int x = std::max(x1, 0) & ~7; x < std::min(x2, 512); x += 8)
+                    mark(x, y, z);
+    }
+
+    // May be called whenever a voxel stops being solid.
+    void update(MapData *, int x, int y, int z);
+
+    // Voxels [x1, x2) × [y1, y2) × [z1, z2) known to be empty.
+    struct Region {
+        int64_t x1 = 0, y1 = 0, z1 = 0, x2 = 0, y2 = 0, z2 = 0;
+
+        inline bool contains(int64_t X, int64_t Y, int64_t Z) const
+        { return x1 <= X && X < x2 && y1 <= Y && Y < y2 && z1 <= Z && Z < z2; }
+    };
+
+    // Returns the empty brick containing the voxel (X, Y, Z) or an empty region if this brick is occupied.
+    inline Region region(int64_t X, int64_t Y, int64_t Z) const {
+        int64_t bx = X >> 3, by = Y >> 3, bz = Z >> 3;
+
+        bool outside = bx < 0 || bx >= side1 || by < 0 || by >= side1 || bz < 0 || bz >= height1;
+
+        if (outside || level2[index2(bx, by)] == 0) {
+            int64_t x = X & ~63, y = Y & ~63, z = Z & ~63;
+            return {x, y, z, x + 64, y + 64, z + 64};
+        }
+
+        if (level1[index1(bx, by, bz)] == 0) {
+            int64_t x = X & ~7, y = Y & ~7, z = Z & ~7;
+            return {x, y, z, x + 8, y + 8, z + 8};
+        }
+
+        return {};
+    }
+
+    // Returns the time (in blocks per unit of `v`) during which an object at `r` moving with
+    // the velocity `v` stays inside the empty brick containing the voxel (X, Y, Z) and at least
+    // `margin` away from its boundary, or zero if this brick is occupied.
+    inline double empty(const Vector3d & r, const Vector3d & v, int X, int Y, int Z, Vector3d & n, const double margin = 0) const {
+        int bx = X >> 3, by = Y >> 3, bz = Z >> 3; Vector3d m; double τ;
+
+        // The map is aligned to the 64×64×64 bricks, so those outside of it are entirely outside.
+        if (!inside(bx, by, bz) || level2[index2(bx, by)] == 0)
+            τ = leave<64, 64>(r, v, X, Y, Z, m, margin);
+        else if (level1[index1(bx, by, bz)] == 0)
+            τ = leave<8, 8>(r, v, X, Y, Z, m, margin);
+        else return 0;
+
+        // The object is on the boundary of the brick, let the per-voxel traversal handle it.
+        if (!(τ > 1e-9)) return 0;
+
+        n = m; return τ;
+    }
+};
+
 enum class Terminal { flying, ricochet, penetration };
 
-using ObjectQueue    = std::list<Object>;
-using ObjectIterator = ObjectQueue::iterator;
+// Integrator used for the free flight inside of empty bricks. Everywhere else, and with `euler`
+// everywhere, explicit Euler limited by the voxel boundaries is used.
+enum class Integrator { euler, rk4, rk45 };
+
+enum class EventKind : uint8_t { trace, block, player, damage };
 
-struct Voxel {
-    PyOwnedRef object; double durability;
+// Callback invocation recorded while integrating an object, see `Engine::advance`.
+// `value` is the speed relative to the initial one for traces, the kinetic energy
+// for hits and the durability loss of the voxel (X, Y, Z) for damage events.
+struct Event {
+    EventKind kind; bool origin; uint32_t object;
+    int thrower, target, limb, X, Y, Z;
+    double value, area;
+    Vector3d position, velocity;
+};
 
-    inline Voxel() : object(), durability(0) {}
-    inline Voxel(PyObject * o, const double f) : object(o), durability(f) { Py_INCREF(o); }
+using Events = std::vector<Event>;
 
-    inline Material * material() const { return reinterpret_cast<Material *>(static_cast<PyObject *>(object)); }
+// Record of the event buffer filled in the batched mode (see `Engine::batched`).
+// `cartridge` is the index into the table of objects returned along with the records,
+// `value` has the same meaning as in `Event`.
+struct Record {
+    uint64_t handle, index;
+    double x, y, z, vx, vy, vz, value, area;
+    int32_t X, Y, Z, thrower, target;
+    uint32_t cartridge;
+    uint8_t kind; int8_t limb; uint8_t origin, padding[5];
 
-    inline bool isub(double delta) { durability -= delta; return durability <= 0; }
+    // Same layout in the notation of the `struct` module.
+    static constexpr const char * format = "=QQ8d5iIBbB5x";
 };
 
+static_assert(sizeof(Record) == 112);
+
+// Counters of `Engine::step`, those updated from the worker threads are atomic.
+struct Statistics {
+    std::atomic<uint64_t> substeps, tests, ricochets, penetrations;
+
+    // Objects retired by the reason.
+    std::atomic<uint64_t> stopped, outside, slow, timeout;
+
+    // Number of calls into Python made during the step and time spent in them (ns).
+    uint64_t callbacks, elapsed;
+
+    // Duration of `Engine::step` (ns).
+    Histogram<> steps;
+
+    inline Statistics() { reset(); }
+
+    inline void reset() {
+        substeps = tests = ricochets = penetrations = 0;
+        stopped = outside = slow = timeout = 0;
+        callbacks = elapsed = 0; steps.reset();
+    }
+};
+
+// Materials and durability of the voxels are kept in dense 16³ chunks allocated on the first write.
+// Each voxel holds an index into the table of interned materials (0 stands for the default material),
+// its durability is allocated for the whole chunk only once some voxel in the chunk is damaged.
 class VoxelData {
+public:
+    static constexpr int chunkBits = 4, chunkSize = 1 << chunkBits, chunkVolume = chunkSize * chunkSize * chunkSize;
+    static constexpr int nx = 512 / chunkSize, ny = 512 / chunkSize, nz = 64 / chunkSize;
+
+    // At most that many distinct materials besides the default one.
+    static constexpr size_t capacity = 255;
+
 private:
-    Voxel water; std::unordered_map<int, Voxel> data;
+    struct Chunk {
+        std::array<uint8_t, chunkVolume> material {};
+        std::unique_ptr<float[]> durability;
+    };
+
+    std::vector<std::unique_ptr<Chunk>> chunks; size_t allocated, damaged;
+
+    std::vector<PyOwnedRef> table; std::unordered_map<PyObject *, uint8_t> index;
+
+    PyOwnedRef water;
+
+    static inline bool inside(int x, int y, int z)
+    { return 0 <= x && x < 512 && 0 <= y && y < 512 && 0 <= z && z < 64; }
+
+    static inline size_t chunkOf(int x, int y, int z)
+    { return ((z >> chunkBits) * ny + (y >> chunkBits)) * nx + (x >> chunkBits); }
+
+    static inline size_t offsetOf(int x, int y, int z) {
+        constexpr int mask = chunkSize - 1;
+        return ((z & mask) << (2 * chunkBits)) | ((y & mask) << chunkBits) | (x & mask);
+    }
+
+    // Blocks at z = 62 cannot be destroyed.
+    static inline float initial(int z)
+    { return z < 62 ? 1.0f : std::numeric_limits<float>::infinity(); }
+
+    Chunk & chunk(int x, int y, int z);
+
 public:
     PyOwnedRef defaultMaterial;
 
-    inline VoxelData() { water.durability = std::numeric_limits<double>::infinity(); }
+    inline VoxelData() : chunks(nx * ny * nz), allocated(0), damaged(0), table(1) {}
+
+    inline auto & waterMaterial() { return water; }
+
+    // Returns the index of `o` in the table of materials or -1 if there are too many of them.
+    int intern(PyObject * o);
+
+    // Returns false if there are too many materials already.
+    bool set(int x, int y, int z, PyObject * o);
+
+    // Assigns the material with the index `k` (as returned by `intern`).
+    void assign(int x, int y, int z, uint8_t k);
+
+    // Assigns `o` to every voxel of the box [x1, x2) × [y1, y2) × [z1, z2), returns false if there are too many materials already.
+    bool fill(int x1, int y1, int z1, int x2, int y2, int z2, PyObject * o);
+
+    inline bool set(int i, PyObject * o)
+    { int x, y, z; get_xyz(i, &x, &y, &z); return set(x, y, z, o); }
+
+    // Never allocates anything, so these are safe to call from the worker threads.
+    Material * material(int x, int y, int z) const;
+    double durability(int x, int y, int z) const;
+
+    // Subtracts `delta` from the durability and returns whether the voxel is destroyed.
+    bool damage(int x, int y, int z, double delta);
+
+    void erase(int x, int y, int z);
 
-    inline auto & waterMaterial() { return water.object; }
+    // Assigns the material `palette[color]` (or the default one) to every colored voxel of `M`.
+    // It does not touch Python objects, so it can run without the GIL.
+    void apply(const MapData * M, const std::unordered_map<uint32_t, uint8_t> & palette);
 
-    Voxel & set(int i, PyObject * o);
-    Voxel & get(int x, int y, int z);
+    // Calls `f(x, y, z, material, durability)` for every voxel in the allocated chunks.
+    template<typename F> inline void each(F && f) const {
+        for (size_t k = 0; k < chunks.size(); k++) {
+            auto & c = chunks[k]; if (c == nullptr) continue;
 
-    inline Voxel & set(int x, int y, int z, PyObject * o)
-    { return set(get_pos(x, y, z), o); }
+            int x₀ = (k % nx) * chunkSize, y₀ = (k / nx % ny) * chunkSize, z₀ = k / (nx * ny) * chunkSize;
 
-    inline void erase(int x, int y, int z) { data.erase(get_pos(x, y, z)); }
+            for (int i = 0; i < chunkVolume; i++) {
+                int x = x₀ + (i & (chunkSize - 1)), y = y₀ + ((i >> chunkBits) & (chunkSize - 1)), z = z₀ + (i >> (2 * chunkBits));
 
-    inline void clear() { data.clear(); defaultMaterial.retain(nullptr); waterMaterial().retain(nullptr); }
+                auto o = c->material[i] == 0 ? static_cast<PyObject *>(defaultMaterial) : static_cast<PyObject *>(table[c->material[i]]);
+                f(x, y, z, o, c->durability ? c->durability[i] : initial(z));
+            }
+        }
+    }
+
+    void clear();
 
-    // This is only the lower bound.
     inline size_t usage() const {
-        constexpr size_t entrySize = sizeof(int) + sizeof(Voxel);
-        return sizeof(decltype(data)) + entrySize * data.size();
+        return sizeof(VoxelData) + chunks.size() * sizeof(std::unique_ptr<Chunk>)
+             + allocated * sizeof(Chunk) + damaged * chunkVolume * sizeof(float)
+             + table.size() * sizeof(PyOwnedRef) + index.size() * (sizeof(PyObject *) + sizeof(uint8_t));
     }
 };
 
@@ -139,11 +442,30 @@ public:
     MapData * map;
 
     VoxelData vxlData;
-    ObjectQueue objects;
+    ObjectStore objects;
     std::vector<Player> players;
+    PlayerGrid grid;
+    Occupancy occupancy;
 
     PyOwnedRef onTrace, onBlockHit, onPlayerHit, onDestroy;
 
+    Integrator integrator;
+
+    // In the batched mode trace and hit callbacks are not called, instead these events are
+    // appended to `records` to be drained once per step. A player hit stops the object
+    // unless the target has gone, while a block hit never does. Hits handled by the cartridge
+    // (see `Cartridge::hooks`) are the exception: the callback is called right away,
+    // as its outcome decides the rest of the path.
+    bool batched; std::vector<Record> records; std::vector<PyObject *> cartridges;
+
+    // Attributes of the cartridges are read once on registration.
+    std::vector<Cartridge> registry;
+
+    // Inputs are logged while `recorder` is set, `palette` is kept for its snapshot.
+    std::unique_ptr<Recorder> recorder; PyOwnedRef palette;
+
+    Statistics stats;
+
     // Independent variables.
     double   temperature; // °C
     double   pressure;    // Pa
@@ -158,11 +480,51 @@ private:
 
     double _lag, _peak;
 
-    void next(double t1, const double t2, ObjectIterator &);
+    // Every random number drawn by the engine is determined by the seed, the number of steps
+    // made since the seed was set and the index of the object (or `_draws` for the engine stream).
+    uint64_t _seed, _steps, _draws;
+
+    Pool pool; std::vector<Events> buffers; std::vector<uint8_t> survived;
+
+    std::unordered_map<PyObject *, uint32_t> cartridgeIndex, registryIndex; bool stepping;
+
+    template<typename F> inline auto timed(F && f) {
+        using namespace std::chrono;
+
+        const auto T1 = steady_clock::now(); auto retval = f();
+        const auto T2 = steady_clock::now();
+
+        stats.elapsed += duration_cast<nanoseconds>(T2 - T1).count(); stats.callbacks++;
+
+        return retval;
+    }
+
+    // Calls the corresponding callback (or appends a record in the batched mode)
+    // and returns whether the object must be stopped.
+    bool emit(const Event &);
+
+    // Callbacks are not called but recorded into `events` instead, so the outcome of the hits
+    // is not known here: the object keeps flying until `dispatch` stops it.
+    bool next(double t1, const double t2, size_t i, Events & events);
+
+    void advance(const double t1, const double t2);
+    void dispatch(const Events &, int64_t & killed);
+
+    void blockHit(Events &, size_t i, const Vector3d & r, const Vector3d & v, int X, int Y, int Z, double E);
+    void playerHit(Events &, size_t i, const Vector3d & r, const Vector3d & v, int X, int Y, int Z, double E, int target, int limb);
+    void damage(Events &, size_t i, int X, int Y, int Z, double value);
+    void trace(Events &, size_t i, const Vector3d & r, double value);
+
+    Vector3d acceleration(const uint32_t model, const double ballistic, const double mass, const double area, const Vector3d & v) const;
+
+    // Makes one step of `integrator` no longer than `h` and returns its duration.
+    // `hint` is the step size suggested by the error control of the adaptive integrator.
+    double integrate(const uint32_t model, const double ballistic, const double mass, const double area,
+                     const Vector3d & v, const double h, double & hint, Vector3d & dr, Vector3d & dv) const;
 
 public:
-    inline Engine(PyObject * o) : protocol(o), _lag(0.0), _peak(0.0)
-    { srand(time(NULL)); players.reserve(32); }
+    inline Engine(PyObject * o) : protocol(o), integrator(Integrator::euler), batched(false), _lag(0.0), _peak(0.0), stepping(false)
+    { players.reserve(32); objects.reserve(1024); seed(std::random_device{}()); }
 
     inline bool indestructible(int x, int y, int z)
     { return 62 <= z || !get_solid(x, y, z, map); }
@@ -172,7 +534,7 @@ public:
             if (!get_solid(x₀, y₀, z, map))
                 return true;
 
-            if (!vxlData.get(x₀, y₀, z).material()->crumbly)
+            if (!vxlData.material(x₀, y₀, z)->crumbly)
                 return false;
         }
 
@@ -187,15 +549,54 @@ public:
     inline double peak() const { return _peak; }
 
     inline size_t alive() const { return objects.size(); }
-    inline size_t total() const { return Object::total(); }
+    inline size_t total() const { return objects.total(); }
 
     inline size_t usage() const { return vxlData.usage(); }
 
+    // Number of native threads integrating objects besides the calling one.
+    // Callbacks are deferred until all objects are integrated either way (see `advance`).
+    inline size_t workers() const { return pool.size(); }
+    inline void workers(size_t n) { pool.resize(n); }
+
+    // See `VoxelData::apply`, releases the GIL.
+    void apply(const std::unordered_map<uint32_t, uint8_t> & palette);
+
+    inline uint64_t seed() const { return _seed; }
+    inline void seed(uint64_t value) { _seed = value; _steps = _draws = 0; }
+
+    // Stream for the draws not related to any object.
+    inline Philox stream() { return Philox(_seed, Philox::engine, _draws++, _steps); }
+
     void update();
     void clear();
 
-    inline void trace(const uint64_t index, const Vector3d & r, const double value, bool origin)
-    { onTrace(index, r.x, r.y, r.z, value, origin); }
+    inline void trace(size_t i, const Vector3d & r, const double value, bool origin) {
+        emit({
+            .kind = EventKind::trace, .origin = origin, .object = uint32_t(i),
+            .thrower = objects.thrower[i], .target = -1, .limb = -1, .X = 0, .Y = 0, .Z = 0,
+            .value = value, .area = objects.area[i], .position = r, .velocity = {}
+        });
+    }
+
+    // Returns the id of the given cartridge, registering it if necessary, or -1 on error.
+    int64_t enroll(PyObject *);
+
+    // Drops all registered cartridges.
+    inline void release() { registry.clear(); registryIndex.clear(); }
+
+    // Adds an object fired with the given cartridge and returns its index.
+    size_t add(uint32_t id, int thrower, const Vector3d & r, const Vector3d & v, double t);
+
+    // Adds `pellets` objects fired in the direction `n` from a shooter moving with the velocity `u`,
+    // drawing the muzzle velocity deviation and the dispersion of the given cartridge.
+    void fire(uint32_t id, int thrower, const Vector3d & r, const Vector3d & n, const Vector3d & u, double t, size_t pellets);
+
+    // Removes the object with the given index. During `step` the object is only
+    // marked and retired once its current path is integrated.
+    void remove(size_t i);
+
+    // Releases the records and the table of cartridges they refer to.
+    void discard();
 
     void step(const double t1, const double t2);
 };
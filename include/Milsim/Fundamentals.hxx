@@ -71,8 +71,14 @@ template<typename T> inline T sign(T x)
 template<typename T, typename... Ts> inline auto min(T t, Ts... ts) { return std::min({ts...}, t); };
 template<typename T, typename... Ts> inline auto max(T t, Ts... ts) { return std::max({ts...}, t); };
 
+// Every thread has its own generator, so these are safe to use from the worker threads.
+inline std::mt19937 & randgen() {
+    thread_local std::mt19937 retval(std::random_device{}());
+    return retval;
+}
+
 template<typename T> inline T random()
-{ return static_cast<T>(rand()) / static_cast<T>(RAND_MAX); }
+{ return std::uniform_real_distribution<T>(0, 1)(randgen()); }
 
 template<typename T> inline bool randbool(T probability)
 { return random<T>() < probability; }
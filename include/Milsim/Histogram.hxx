@@ -0,0 +1,52 @@
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <array>
+#include <bit>
+
+// Log-linear histogram in the spirit of HdrHistogram: every power of two is split into
+// `1 << bits` buckets, so values are kept with a relative error below 2^-bits over the whole range.
+template<size_t bits = 5> class Histogram {
+private:
+    static constexpr size_t S = 1 << bits, N = (65 - bits) * S;
+
+    std::array<uint64_t, N> buckets; uint64_t _count, _max;
+
+    static constexpr inline size_t index(uint64_t v) {
+        if (v < S) return v;
+
+        size_t e = std::bit_width(v) - bits - 1;
+        return (e + 1) * S + (v >> e) - S;
+    }
+
+    // The largest value that falls into the bucket `i`.
+    static constexpr inline uint64_t value(size_t i) {
+        if (i < S) return i;
+
+        size_t e = i / S - 1;
+        return ((i % S + S + 1) << e) - 1;
+    }
+
+public:
+    inline Histogram() { reset(); }
+
+    inline void reset() { buckets.fill(0); _count = _max = 0; }
+
+    inline void record(uint64_t v) { buckets[index(v)]++; _count++; _max = std::max(_max, v); }
+
+    inline uint64_t count() const { return _count; }
+    inline uint64_t max()   const { return _max;   }
+
+    // Smallest recorded value (up to the bucket precision) such that at least `q` of all values are not greater.
+    inline uint64_t percentile(double q) const {
+        if (_count == 0) return 0;
+
+        uint64_t k = std::max<uint64_t>(1, q * _count), acc = 0;
+
+        for (size_t i = 0; i < N; i++)
+            if ((acc += buckets[i]) >= k) return std::min(value(i), _max);
+
+        return _max;
+    }
+};
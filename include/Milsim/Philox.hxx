@@ -0,0 +1,67 @@
+#pragma once
+
+#include <cstdint>
+#include <numbers>
+#include <array>
+#include <cmath>
+
+// Counter-based generator Philox4×32-10 (Salmon et al., “Parallel Random Numbers: As Easy as 1, 2, 3”, 2011).
+// Its output depends only on the key and the counter, so every object draws the same numbers
+// no matter in which order (or on which thread) objects are integrated.
+class Philox {
+public:
+    using Counter = std::array<uint32_t, 4>;
+    using Key     = std::array<uint32_t, 2>;
+
+    // Independent streams for the same seed.
+    enum Domain : uint32_t { flight = 0, fire = 1, engine = 2 };
+
+private:
+    static constexpr uint32_t M0 = 0xD2511F53, M1 = 0xCD9E8D57;
+    static constexpr uint32_t W0 = 0x9E3779B9, W1 = 0xBB67AE85;
+
+    Key key; Counter counter, block; size_t used;
+
+    static constexpr inline Counter round(const Counter & c, const Key & k) {
+        uint64_t p0 = uint64_t(M0) * c[0], p1 = uint64_t(M1) * c[2];
+
+        return {
+            uint32_t(p1 >> 32) ^ c[1] ^ k[0], uint32_t(p1),
+            uint32_t(p0 >> 32) ^ c[3] ^ k[1], uint32_t(p0)
+        };
+    }
+
+public:
+    static constexpr inline Counter apply(Counter c, Key k) {
+        for (size_t i = 0; i < 10; i++) {
+            c = round(c, k);
+            k[0] += W0; k[1] += W1;
+        }
+
+        return c;
+    }
+
+    // The counter is (index, step, domain and the number of the block drawn).
+    inline Philox(uint64_t seed, Domain domain, uint64_t index, uint32_t step) :
+    key{uint32_t(seed), uint32_t(seed >> 32)},
+    counter{uint32_t(index), uint32_t(index >> 32), step, uint32_t(domain) << 24},
+    used(4) {}
+
+    inline uint32_t next() {
+        if (used == 4) { block = apply(counter, key); counter[3]++; used = 0; }
+
+        return block[used++];
+    }
+
+    // Uniformly distributed on [0, 1) with 53 random bits.
+    inline double uniform() {
+        uint64_t a = next() >> 5, b = next() >> 6;
+        return (a * 67108864.0 + b) / 9007199254740992.0;
+    }
+
+    // Standard normal distribution (Box–Muller transform).
+    inline double gauss() {
+        auto u1 = 1.0 - uniform(), u2 = uniform();
+        return std::sqrt(-2.0 * std::log(u1)) * std::cos(2 * std::numbers::pi * u2);
+    }
+};
@@ -0,0 +1,93 @@
+#pragma once
+
+#include <condition_variable>
+#include <functional>
+#include <cstdint>
+#include <atomic>
+#include <thread>
+#include <vector>
+#include <mutex>
+
+// Fixed-size pool of native threads. `run` distributes `n` tasks between
+// the pool and the calling thread and returns when all of them are done.
+class Pool {
+private:
+    std::vector<std::thread> threads;
+
+    std::mutex mutex; std::condition_variable wake, done;
+
+    std::function<void(size_t)> task;
+    std::atomic<size_t> counter; size_t total, busy;
+
+    uint64_t epoch; bool quit;
+
+    inline void work() { for (size_t k; (k = counter++) < total;) task(k); }
+
+    inline void loop() {
+        uint64_t seen = 0;
+
+        for (;;) {
+            {
+                std::unique_lock lock(mutex);
+                wake.wait(lock, [&]() { return quit || seen != epoch; });
+
+                if (quit) return;
+                seen = epoch;
+            }
+
+            work();
+
+            {
+                std::lock_guard lock(mutex);
+                if (--busy == 0) done.notify_one();
+            }
+        }
+    }
+
+public:
+    inline Pool() : counter(0), total(0), busy(0), epoch(0), quit(false) {}
+    inline ~Pool() { resize(0); }
+
+    Pool(const Pool &) = delete;
+    Pool & operator=(const Pool &) = delete;
+
+    inline size_t size() const { return threads.size(); }
+
+    inline void resize(size_t n) {
+        {
+            std::lock_guard lock(mutex);
+            quit = true;
+        }
+
+        wake.notify_all();
+
+        for (auto & thread : threads) thread.join();
+        threads.clear(); quit = false;
+
+        for (size_t i = 0; i < n; i++)
+            threads.emplace_back(&Pool::loop, this);
+    }
+
+    template<typename F> inline void run(size_t n, F && f) {
+        if (threads.empty()) {
+            for (size_t k = 0; k < n; k++) f(k);
+            return;
+        }
+
+        {
+            std::lock_guard lock(mutex);
+            task = f; counter = 0; total = n; busy = threads.size(); epoch++;
+        }
+
+        wake.notify_all();
+
+        work();
+
+        {
+            std::unique_lock lock(mutex);
+            done.wait(lock, [&]() { return busy == 0; });
+        }
+
+        task = nullptr;
+    }
+};
@@ -0,0 +1,63 @@
+#pragma once
+
+#include <unordered_map>
+#include <cstdint>
+#include <cstdio>
+#include <vector>
+
+#include <Python.hxx>
+
+#include <engine.h>
+
+// Binary log of everything fed into the engine, read back by `milsim.replay`.
+// Each entry is an opcode followed by its fields in the native byte order;
+// materials and cartridges are defined once on the first use and then referred to by number.
+class Recorder {
+public:
+    enum Opcode : uint8_t {
+        seed = 1, integrator, batched, update, material, defaultMaterial, waterMaterial,
+        set, erase, durability, apply, cartridge, add, fire, step, spawn, despawn, animation,
+        dig, smash, remove, flush, trace, fill
+    };
+
+    static constexpr char magic[8] = {'M', 'S', 'R', 'E', 'C', 'O', 'R', 'D'};
+    static constexpr uint32_t version = 1, none = UINT32_MAX;
+
+private:
+    FILE * fp; std::unordered_map<PyObject *, uint32_t> materials;
+    std::vector<PyOwnedRef> retained; std::vector<bool> cartridges;
+
+public:
+    inline Recorder(FILE * fp) : fp(fp) { fwrite(magic, sizeof(magic), 1, fp); put(version); }
+    inline ~Recorder() { fclose(fp); }
+
+    template<typename... Ts> inline void put(const Ts &... ts)
+    { (fwrite(&ts, sizeof(Ts), 1, fp), ...); }
+
+    inline uint32_t intern(PyObject * o) {
+        if (o == nullptr) return none;
+
+        auto [iter, inserted] = materials.try_emplace(o, materials.size());
+
+        if (inserted) {
+            auto M = reinterpret_cast<Material *>(o); retained.emplace_back(Py_NewRef(o));
+
+            Py_ssize_t n = 0; auto name = PyUnicode_AsUTF8AndSize(M->name, &n);
+            if (name == nullptr) { PyErr_Clear(); n = 0; }
+
+            put(Opcode::material, iter->second, M->durability, M->absorption, M->density,
+                M->strength, M->ricochet, M->deflecting, uint8_t(M->crumbly), uint16_t(n));
+            fwrite(name, 1, n, fp);
+        }
+
+        return iter->second;
+    }
+
+    // Whether the cartridge `id` is yet to be defined in the log.
+    inline bool fresh(uint32_t id) {
+        if (cartridges.size() <= id) cartridges.resize(id + 1, false);
+
+        bool retval = !cartridges[id]; cartridges[id] = true;
+        return retval;
+    }
+};
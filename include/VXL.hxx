@@ -1,22 +1,117 @@
 #pragma once
 
+#include <algorithm>
+#include <cstdint>
 #include <vector>
+#include <bit>
 
 #include <vxl_c.h>
 
 #include <Milsim/Vector.hxx>
 
-int traverseNode(int x, int y, int z, MapData *, int destroy);
+// Set of positions on the whole map that is emptied in O(1): a word of bits is valid only if its stamp is the current generation.
+class Visited {
+private:
+    std::vector<uint64_t> bits; std::vector<uint32_t> stamps; uint32_t generation = 0;
 
+public:
+    Visited() : bits(MAP_X * MAP_Y * MAP_Z / 64), stamps(bits.size()) {}
+
+    inline void clear() {
+        if (++generation == 0)
+            { std::fill(stamps.begin(), stamps.end(), 0); generation = 1; }
+    }
+
+    inline bool contains(int i) const
+    { return stamps[i >> 6] == generation && (bits[i >> 6] >> (i & 63)) & 1; }
+
+    inline bool insert(int i) {
+        size_t k = i >> 6; uint64_t m = uint64_t(1) << (i & 63);
+
+        if (stamps[k] != generation) { stamps[k] = generation; bits[k] = 0; }
+        if (bits[k] & m) return false;
+
+        bits[k] |= m; return true;
+    }
+};
+
+// Solid voxels of every column as a word: bit z of `columns[x + y * MAP_X]` is set iff (x, y, z) is solid, so the first
+// solid voxel at or below any z is found in O(1). It is kept in sync by `VxlData` and by the functions below that take it
+// (null if there is none yet), edits of the map that bypass them leave it stale.
+static_assert(MAP_Z <= 64);
+
+class Heightmap {
+private:
+    std::vector<uint64_t> columns;
+
+    static constexpr int area = MAP_X * MAP_Y;
+
+public:
+    Heightmap(const MapData *);
+
+    inline void insert(int i) { columns[i % area] |=   uint64_t(1) << (i / area);  }
+    inline void erase(int i)  { columns[i % area] &= ~(uint64_t(1) << (i / area)); }
+
+    // Reads the voxel (x, y, z) or the whole column (x, y) from the map again.
+    void update(const MapData *, int x, int y, int z);
+    void update(const MapData *, int x, int y);
+
+    // First solid z in [zmin, zmax) of the column (x, y) or `zerr` if there is none.
+    inline int find(int x, int y, int zmin, int zmax, int zerr) const {
+        if (x < 0 || x >= MAP_X || y < 0 || y >= MAP_Y) return zerr;
+
+        zmin = std::max(zmin, 0); zmax = std::min(zmax, MAP_Z);
+        if (zmin >= zmax) return zerr;
+
+        uint64_t m = columns[get_pos(x, y, 0)] >> zmin;
+        if (zmax - zmin < 64) m &= (uint64_t(1) << (zmax - zmin)) - 1;
+
+        return m ? zmin + std::countr_zero(m) : zerr;
+    }
+};
+
+// Number of voxels connected to (x, y, z) or 0 if they reach the ground (z ≥ 62), `destroy` removes them.
+int traverseNode(int x, int y, int z, MapData *, int destroy, Heightmap *);
+
+// Support forest of the map: every solid voxel may lean on one of its neighbours. A chain of such links through
+// solid voxels down to z ≥ 62 proves that the voxel is grounded, so after a removal most neighbours are cleared by
+// walking their chains instead of a flood fill. Links are never trusted on their own: they go stale after removals
+// and edits that bypass `Support`, are checked on every walk and relinked by the flood fill that follows a failed one.
+class Support {
+private:
+    std::vector<uint8_t> link; // 0 if none, otherwise 1 + index in `directions`
+
+    bool grounded(MapData *, int i);
+    int check(MapData *, Heightmap *, int i);
+
+public:
+    Support() : link(MAP_X * MAP_Y * MAP_Z) {}
+
+    // Same as `VXLData.destroy_point`: removes (x, y, z) along with everything that no longer reaches the ground,
+    // returns the number of removed voxels (the rest of them go to the delete queue).
+    int destroy(MapData *, Heightmap *, int x, int y, int z);
+};
+
+// Positions of the voxels removed by the flood fills (other than the removed one itself), dropped once the queue is full.
+// `deleteQueueDrain` takes at most `n` of them as (x, y, z) triples, `deleteQueueOverflow` returns and resets
+// the number of dropped ones.
+size_t deleteQueueDrain(int * out, size_t n);
+size_t deleteQueueSize();
+size_t deleteQueueOverflow();
 void deleteQueueClear();
-int deleteQueuePop();
 
-inline void visit(std::vector<Vector3i> & out, int x, int y, int z, MapData * M) {
-    if (x < 0 || 512 <= x || y < 0 || 512 <= y || z < 0 || 64 <= z)
-        return;
+// Bulk builders writing straight into the geometry and the colors of the map, voxels outside of it are skipped.
+// Colors are packed as in `MapData::colors`.
+
+// Makes the box [x1, x2) × [y1, y2) × [z1, z2) solid and, if `colored`, paints it with `color`.
+void fillBox(MapData *, Heightmap *, int x1, int y1, int z1, int x2, int y2, int z2, bool colored, int color);
 
-    if (!M->geometry[get_pos(x, y, z)])
-        return;
+// Sets the `n` voxels `w` (as (x, y, z) triples) shifted by each of the `m` offsets, in that order.
+// The voxel `w[i]` is painted with `colors[i]` or, if `colors` is null, with `color`.
+void stampPoints(MapData *, Heightmap *, const int * w, size_t n, const int * colors, int color, const int * offsets, size_t m);
 
-    out.emplace_back(x, y, z);
-}
+// Raw image of the map: the geometry bits followed by the (position, color) pairs in the order of positions.
+// Unlike VXL it keeps the colors of the inner voxels.
+size_t mapImageSize(const MapData *);
+void dumpMap(const MapData *, char * out);
+bool loadMap(MapData *, const char * in, size_t size);
@@ -35,32 +35,28 @@ def gap(vxl, x0, y0, z0):
     pass
 
 def bridge1(vxl, x0, y0, z0):
-    for i, j in product(range(scale), range(1, scale - 1)):
-        vxl.set_point(x0 + j, y0 + i, z0, concrete)
+    vxl.fill_box(x0 + 1, y0, z0, x0 + scale - 1, y0 + scale, z0 + 1, concrete)
 
 def stairs1(vxl, x0, y0, z0):
-    for i, j in product(range(scale), range(scale)):
-        vxl.set_point(x0 + j, y0 + i,     z0 - i, concrete)
-        vxl.set_point(x0 + j, y0 + i + 1, z0 - i, concrete)
+    for i in range(scale):
+        vxl.fill_box(x0, y0 + i, z0 - i, x0 + scale, y0 + i + 2, z0 - i + 1, concrete)
 
 def stairsrev1(vxl, x0, y0, z0):
-    for i, j in product(range(scale), range(scale)):
-        vxl.set_point(x0 + j, y0 + i,     z0 + (i - (scale - 1)), concrete)
-        vxl.set_point(x0 + j, y0 + i - 1, z0 + (i - (scale - 1)), concrete)
+    for i in range(scale):
+        z = z0 + (i - (scale - 1))
+        vxl.fill_box(x0, y0 + i - 1, z, x0 + scale, y0 + i + 1, z + 1, concrete)
 
 def bridge2(vxl, x0, y0, z0):
-    for i, j in product(range(scale), range(1, scale - 1)):
-        vxl.set_point(x0 + i, y0 + j, z0, concrete)
+    vxl.fill_box(x0, y0 + 1, z0, x0 + scale, y0 + scale - 1, z0 + 1, concrete)
 
 def stairs2(vxl, x0, y0, z0):
-    for i, j in product(range(scale), range(scale)):
-        vxl.set_point(x0 + i,     y0 + j, z0 - i, concrete)
-        vxl.set_point(x0 + i + 1, y0 + j, z0 - i, concrete)
+    for i in range(scale):
+        vxl.fill_box(x0 + i, y0, z0 - i, x0 + i + 2, y0 + scale, z0 - i + 1, concrete)
 
 def stairsrev2(vxl, x0, y0, z0):
-    for i, j in product(range(scale), range(scale)):
-        vxl.set_point(x0 + i,     y0 + j, z0 + (i - (scale - 1)), concrete)
-        vxl.set_point(x0 + i - 1, y0 + j, z0 + (i - (scale - 1)), concrete)
+    for i in range(scale):
+        z = z0 + (i - (scale - 1))
+        vxl.fill_box(x0 + i - 1, y0, z, x0 + i + 1, y0 + scale, z + 1, concrete)
 
 next1 = {
     stairs1:    [gap],
@@ -100,28 +96,21 @@ def columns():
         yield xmax - 1, ymin
         yield xmax - 1, ymax - 1
 
-def floors():
-    for xmin, xmax, ymin, ymax in boundaries():
-        yield from product(range(xmin, xmax), range(ymin, ymax))
-
 def defaults():
     for x, y in columns():
-        for Δz in range(height * scale):
-            yield (x, y, 62 - Δz), StrongConcrete
+        yield (x, y, 63 - height * scale, x + 1, y + 1, 63), StrongConcrete
 
 def on_map_generation(dirname, seed):
     vxl = VxlData()
 
-    for x, y in product(range(512), range(512)):
-        vxl.set_point(x, y, 63, water)
+    vxl.fill_layer(63, water)
 
     for x, y in columns():
-        for Δz in range(height * scale):
-            vxl.set_point(x, y, 62 - Δz, concrete)
+        vxl.fill_column(x, y, 63 - height * scale, 63, concrete)
 
-    for x, y in floors():
+    for xmin, xmax, ymin, ymax in boundaries():
         for k in range(height + 1):
-            vxl.set_point(x, y, 62 - k * scale, concrete)
+            vxl.fill_box(xmin, ymin, 62 - k * scale, xmax, ymax, 63 - k * scale, concrete)
 
     step = lambda prev, func: {k : rgen.choice(func[v]) for k, v in prev.items()}
 
@@ -1,6 +1,9 @@
 from itertools import product
 from random import randint
 from math import radians
+from array import array
+
+from pyspades.common import make_color
 
 from milsim.types import StaticWeather
 from milsim.vxl import VxlData
@@ -45,67 +48,72 @@ def get_entity_location(team, entity_id):
         return 256 + 146, 256, 63 - height(256 + 146)
 
 def defaults():
-    for x, Δy in product(range(512), range(64)):
+    for x in range(512):
         z = height(x)
 
-        yield (x, 256 - Δy, 63 - z), StrongBricks
-        yield (x, 256 - Δy, z),      StrongBricks
-        yield (x, 256 - Δy, 0),      StrongBricks
-        yield (x, 256 + Δy, 63 - z), StrongBricks
-        yield (x, 256 + Δy, z),      StrongBricks
-        yield (x, 256 + Δy, 0),      StrongBricks
+        yield (x, 256 - 63, 63 - z, x + 1, 256 + 64, 64 - z), StrongBricks
+        yield (x, 256 - 63, z,      x + 1, 256 + 64, z + 1),  StrongBricks
+        yield (x, 256 - 63, 0,      x + 1, 256 + 64, 1),      StrongBricks
 
     for y in range(256 - 64, 256 + 65):
         x1, x2 = wall1(y), wall2(y)
 
         if x1 < x2:
-            for z, Δx in product(range(64), range(8)):
-                yield (x1 + Δx, y, z), StrongBricks
-                yield (x2 - Δx, y, z), StrongBricks
+            yield (x1,     y, 0, x1 + 8, y + 1, 64), StrongBricks
+            yield (x2 - 7, y, 0, x2 + 1, y + 1, 64), StrongBricks
 
 rgen = RNG(self.seed)
 huef = rgen.uniform(0, 1)
 
+# Drawn before the map is generated, so that these are the same whether the map comes from the cache or not.
+water = rgen.hsvi(0.5, 0.7, hue = huef)
+fog   = rgen.hsvi(0.1, 0.4, hue = huef)
+
 def on_map_generation(dirname, seed):
     vxl = VxlData()
 
-    water = rgen.hsvi(0.5, 0.7, hue = huef)
+    vxl.fill_layer(63, water)
 
-    for x, y in product(range(512), range(512)):
-        vxl.set_point(x, y, 63, water)
+    # Every voxel gets its own color, so these are collected in the order of the random colors.
+    points, colors = array('i'), array('I')
 
-    for x, Δy in product(range(512), range(64)):
+    def paint(x, y, z):
+        points.extend((x, y, z))
+        colors.append(make_color(*rgen.hsvi(hue = huef)))
+
+    for x in range(512):
         z = height(x)
 
-        vxl.set_column_fast(x, 256 - Δy, 63 - z, 63, 0, 0)
-        vxl.set_column_fast(x, 256 + Δy, 63 - z, 63, 0, 0)
+        vxl.fill_box(x, 256 - 63, 63 - z, x + 1, 256 + 64, 64,    None)
+        vxl.fill_box(x, 256 - 63, 0,      x + 1, 256 + 64, z + 1, None)
 
-        vxl.set_column_fast(x, 256 - Δy, 0, z, 0, 0)
-        vxl.set_column_fast(x, 256 + Δy, 0, z, 0, 0)
+    for x, Δy in product(range(512), range(64)):
+        z = height(x)
 
-        vxl.set_point(x, 256 - Δy, 63 - z, rgen.hsvi(hue = huef))
-        vxl.set_point(x, 256 - Δy, z,      rgen.hsvi(hue = huef))
-        vxl.set_point(x, 256 - Δy, 0,      rgen.hsvi(hue = huef))
-        vxl.set_point(x, 256 + Δy, 63 - z, rgen.hsvi(hue = huef))
-        vxl.set_point(x, 256 + Δy, z,      rgen.hsvi(hue = huef))
-        vxl.set_point(x, 256 + Δy, 0,      rgen.hsvi(hue = huef))
+        paint(x, 256 - Δy, 63 - z)
+        paint(x, 256 - Δy, z)
+        paint(x, 256 - Δy, 0)
+        paint(x, 256 + Δy, 63 - z)
+        paint(x, 256 + Δy, z)
+        paint(x, 256 + Δy, 0)
 
     for y in range(256 - 64, 256 + 65):
         x1, x2 = wall1(y), wall2(y)
 
-        for x in range(x1, x2):
-            vxl.set_column_fast(x, y, 1, 63, 0, 0)
+        vxl.fill_box(x1, y, 1, x2, y + 1, 64, None)
 
         if x1 < x2:
             for z, Δx in product(range(64), range(8)):
-                vxl.set_point(x1 + Δx, y, z, rgen.hsvi(hue = huef))
-                vxl.set_point(x2 - Δx, y, z, rgen.hsvi(hue = huef))
+                paint(x1 + Δx, y, z)
+                paint(x2 - Δx, y, z)
+
+    vxl.set_points(points, colors)
 
     return vxl
 
 def on_environment_generation(dirname, seed):
     weather = StaticWeather()
-    weather.clear_sky_fog = rgen.hsvi(0.1, 0.4, hue = huef)
+    weather.clear_sky_fog = fog
 
     return Environment(
         default  = Dirt,
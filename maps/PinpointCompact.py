@@ -1,4 +1,3 @@
-from itertools import product
 
 from pyspades.common import make_color
 
@@ -21,21 +20,16 @@ fog      = rgen.hsvi(0.1, 0.4, hue = huef)
 def on_map_generation(dirname, seed):
     vxl = VxlData()
 
-    for x, y in product(range(512), range(512)):
-        vxl.set_point(x, y, 63, water)
+    vxl.fill_layer(63, water)
 
-    for Δx, Δy in product(range(0, 64), range(-32, 33)):
-        vxl.set_point(256 - 64 - Δx, 256 + Δy, 62, concrete)
-        vxl.set_point(256 + 64 + Δx, 256 + Δy, 62, concrete)
+    vxl.fill_box(256 - 64 - 63, 256 - 32, 62, 256 - 64 + 1,  256 + 33, 63, concrete)
+    vxl.fill_box(256 + 64,      256 - 32, 62, 256 + 64 + 64, 256 + 33, 63, concrete)
 
     for Δx in range(64):
-        for Δy in range(Δx // 2 + 1):
-            vxl.set_point(256 - Δx, 256 + Δy, 62, concrete)
-            vxl.set_point(256 - Δx, 256 - Δy, 62, concrete)
-            vxl.set_point(256 + Δx, 256 + Δy, 62, concrete)
-            vxl.set_point(256 + Δx, 256 - Δy, 62, concrete)
+        Δy = Δx // 2
 
-    vxl.set_point(256, 256, 62, concrete)
+        vxl.fill_box(256 - Δx, 256 - Δy, 62, 256 - Δx + 1, 256 + Δy + 1, 63, concrete)
+        vxl.fill_box(256 + Δx, 256 - Δy, 62, 256 + Δx + 1, 256 + Δy + 1, 63, concrete)
 
     return vxl
 
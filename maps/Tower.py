@@ -69,32 +69,26 @@ CONCRETE = (0xCC, 0xCC, 0xCC)
 STEEL    = (0xAA, 0xAA, 0xAA)
 
 def square(vxl, X, Y, Z, size, color):
-    for i in range(-size, size + 1):
-        vxl.set_point(X + i, Y - size, Z, color)
-        vxl.set_point(X + i, Y + size, Z, color)
-        vxl.set_point(X - size, Y + i, Z, color)
-        vxl.set_point(X + size, Y + i, Z, color)
+    vxl.fill_box(X - size, Y - size, Z, X + size + 1, Y - size + 1, Z + 1, color)
+    vxl.fill_box(X - size, Y + size, Z, X + size + 1, Y + size + 1, Z + 1, color)
+    vxl.fill_box(X - size, Y - size, Z, X - size + 1, Y + size + 1, Z + 1, color)
+    vxl.fill_box(X + size, Y - size, Z, X + size + 1, Y + size + 1, Z + 1, color)
 
-def dotted_square(vxl, X, Y, Z, size, color):
-    for i in range(-size, size + 1):
-        if i % 2 == 0:
-            vxl.set_point(X + i, Y - size, Z, color)
-            vxl.set_point(X + i, Y + size, Z, color)
-            vxl.set_point(X - size, Y + i, Z, color)
-            vxl.set_point(X + size, Y + i, Z, color)
+# every other voxel on the perimeter of the square
+def dots(size):
+    for i in range(-size, size + 1, 2):
+        yield from ((i, -size, 0), (i, size, 0), (-size, i, 0), (size, i, 0))
 
 def stairs(vxl, X, Y, offset, size, color):
     height = 2 * size + 1
 
     for i in range(-size, size + 1):
         # stairs
-        for j in range(-size + 1, size):
-            vxl.set_point(X + i, Y + j, offset - (i + size), color)
+        vxl.fill_box(X + i, Y - size + 1, offset - (i + size), X + i + 1, Y + size, offset - (i + size) + 1, color)
 
-        # wall
-        for k in range(0, height + 1):
-            vxl.set_point(X + i, Y - size, offset - k, color)
-            vxl.set_point(X + i, Y + size, offset - k, color)
+    # wall
+    vxl.fill_box(X - size, Y - size, offset - height, X + size + 1, Y - size + 1, offset + 1, color)
+    vxl.fill_box(X - size, Y + size, offset - height, X + size + 1, Y + size + 1, offset + 1, color)
 
     # platform
     square(vxl, X, Y, offset - height, size + 1, color)
@@ -102,32 +96,30 @@ def stairs(vxl, X, Y, offset, size, color):
     square(vxl, X, Y, offset - height, size + 3, color)
 
     # columns around the stairs
-    for k in range(0, height): dotted_square(vxl, X, Y, offset - k, size + 3, color)
+    vxl.stamp(list(dots(size + 3)), color, [(X, Y, offset - k) for k in range(0, height)])
 
-# first floor & columns under the building
-def basement(vxl, offset):
-    for x, y in product(range(-64, 65), range(-64, 65)):
+# a ring of concrete at the given height and steel columns from below up to `bottom`
+def ring(vxl, Z, bottom):
+    vxl.fill_box(256 - 64, 256 - 64, Z, 256 - 31, 256 + 65, Z + 1, CONCRETE)
+    vxl.fill_box(256 + 32, 256 - 64, Z, 256 + 65, 256 + 65, Z + 1, CONCRETE)
+    vxl.fill_box(256 - 31, 256 - 64, Z, 256 + 32, 256 - 31, Z + 1, CONCRETE)
+    vxl.fill_box(256 - 31, 256 + 32, Z, 256 + 32, 256 + 65, Z + 1, CONCRETE)
+
+    for x, y in product(range(-64, 65, 4), range(-64, 65, 4)):
         if max(abs(x), abs(y)) >= 32:
-            vxl.set_point(256 + x, 256 + y, offset, CONCRETE)
+            vxl.fill_column(256 + x, 256 + y, Z + 1, bottom, STEEL)
 
-            if x % 4 == 0 and y % 4 == 0:
-                for z in range(offset + 1, 63):
-                    vxl.set_point(256 + x, 256 + y, z, STEEL)
+# first floor & columns under the building
+def basement(vxl, offset):
+    ring(vxl, offset, 63)
 
 def floor(vxl, offset, k):
-    for x, y in product(range(-64, 65), range(-64, 65)):
-        if max(abs(x), abs(y)) >= 32:
-            vxl.set_point(256 + x, 256 + y, offset - 8 * k, CONCRETE)
-
-            if x % 4 == 0 and y % 4 == 0:
-                for z in range(offset - 8 * k + 1, offset - 8 * (k - 1)):
-                    vxl.set_point(256 + x, 256 + y, z, STEEL)
+    ring(vxl, offset - 8 * k, offset - 8 * (k - 1))
 
 def on_map_generation(dirname, seed):
     vxl = VxlData()
 
-    for x, y in product(range(512), range(512)):
-        vxl.set_point(x, y, 63, WATER)
+    vxl.fill_layer(63, WATER)
 
     offset = 60
     basement(vxl, offset)
@@ -0,0 +1,132 @@
+from pickle import Pickler, Unpickler, PicklingError, UnpicklingError
+from tempfile import mkstemp
+from hashlib import sha256
+from io import BytesIO
+import mmap
+import os
+
+from twisted.logger import Logger
+
+from milsim.engine import Material
+from milsim.vxl import VxlData
+
+log = Logger()
+
+# Bumped whenever the layout of the entries changes.
+version = 1
+
+# Materials are referred to by their names in the namespace of the map script.
+class MaterialPickler(Pickler):
+    def __init__(self, fout, namespace):
+        Pickler.__init__(self, fout)
+        self.names = {id(v): k for k, v in namespace.items() if isinstance(v, Material)}
+
+    def persistent_id(self, o):
+        if not isinstance(o, Material):
+            return None
+
+        if (name := self.names.get(id(o))) is None:
+            raise PicklingError("material “{}” is not defined at the top level of the map script".format(o.name))
+
+        return name
+
+class MaterialUnpickler(Unpickler):
+    def __init__(self, fin, namespace):
+        Unpickler.__init__(self, fin)
+        self.namespace = namespace
+
+    def persistent_load(self, name):
+        o = self.namespace.get(name)
+
+        if not isinstance(o, Material):
+            raise UnpicklingError("material “{}” is not defined by the map script".format(name))
+
+        return o
+
+def dumps(o, namespace):
+    fout = BytesIO()
+    MaterialPickler(fout, namespace).dump(o)
+
+    return fout.getvalue()
+
+def loads(data, namespace):
+    return MaterialUnpickler(BytesIO(data), namespace).load()
+
+class MapCache:
+    """
+    Generated maps along with the palette and the defaults of their environments,
+    keyed by the source of the map script and the seed. The map is stored as the raw image
+    (see `VxlData.dumps`) and memory-mapped on load. At most `limit` least recently used entries are kept.
+    """
+
+    def __init__(self, dirname, limit = 16):
+        self.dirname = dirname
+        self.limit   = limit
+
+        os.makedirs(dirname, exist_ok = True)
+
+    @staticmethod
+    def key(source, seed):
+        h = sha256("{}:{}:".format(version, seed).encode('utf-8'))
+        h.update(source.encode('utf-8'))
+
+        return h.hexdigest()
+
+    def path(self, key, ext):
+        return os.path.join(self.dirname, key + ext)
+
+    def load(self, key, namespace):
+        """
+        Returns the map, the palette and the defaults or None if there is no such entry.
+        """
+        mappath, envpath = self.path(key, '.map'), self.path(key, '.env')
+
+        try:
+            with open(envpath, 'rb') as fin:
+                palette, defaults = MaterialUnpickler(fin, namespace).load()
+
+            with open(mappath, 'rb') as fin, mmap.mmap(fin.fileno(), 0, access = mmap.ACCESS_READ) as buf:
+                data = VxlData.loads(buf)
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            log.warn("Ignoring the cache entry {key}: {exc}", key = key, exc = exc)
+            return None
+
+        os.utime(mappath)
+
+        return data, palette, defaults
+
+    def store(self, key, namespace, data, palette, defaults):
+        try:
+            env = dumps((palette, defaults), namespace)
+        except (PicklingError, TypeError, AttributeError) as exc:
+            log.info("Map is not cached: {exc}", exc = exc)
+            return
+
+        # The map goes last, so that an entry is never seen without its environment.
+        self.write(self.path(key, '.env'), env)
+        self.write(self.path(key, '.map'), data.dumps())
+
+        self.evict()
+
+    def write(self, path, data):
+        fd, tmppath = mkstemp(dir = self.dirname, suffix = '.tmp')
+
+        with os.fdopen(fd, 'wb') as fout:
+            fout.write(data)
+
+        os.replace(tmppath, path)
+
+    def evict(self):
+        entries = sorted(
+            (entry for entry in os.scandir(self.dirname) if entry.name.endswith('.map')),
+            key = lambda entry: entry.stat().st_mtime, reverse = True
+        )
+
+        for entry in entries[self.limit:]:
+            for ext in '.map', '.env':
+                try:
+                    os.remove(self.path(entry.name[:-len('.map')], ext))
+                except FileNotFoundError:
+                    pass
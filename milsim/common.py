@@ -1,6 +1,8 @@
 from math import atan, atan2, tau, floor
 from itertools import product
 from inspect import signature
+from struct import calcsize
+from re import findall
 import functools
 
 from pyspades.common import Vertex3
@@ -67,6 +69,44 @@ def icons(x, xs):
     yield x
     yield from xs
 
+@functools.cache
+def layout(fmt):
+    """
+    Returns the type code, the offset and the stride (both in items) of every field
+    of the `struct` format `fmt`, pad bytes excluded. Every field has to be aligned to its size.
+    """
+    stride, offset, retval = calcsize(fmt), 0, []
+
+    for count, code in findall(r'(\d*)([a-zA-Z?])', fmt):
+        size = calcsize('=' + code)
+
+        for _ in range(int(count or 1)):
+            if code != 'x':
+                retval.append((code, offset // size, stride // size))
+
+            offset += size
+
+    return retval
+
+def columns(data, fmt):
+    """
+    Splits the buffer of records packed with the `struct` format `fmt` into a `memoryview` per field
+    (see `layout`), without copying.
+    """
+    view = memoryview(data)
+    return [view.cast(code)[offset::stride] for code, offset, stride in layout(fmt)]
+
+def where(column, value):
+    """
+    Yields the indices of the items of a byte column equal to `value`.
+    """
+    data, item = column.tobytes(), bytes((value,))
+    i = data.find(item)
+
+    while i >= 0:
+        yield i
+        i = data.find(item, i + 1)
+
 ilen   = lambda it: sum(1 for o in it)
 iempty = lambda it: next(it, None) is None
 
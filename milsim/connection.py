@@ -1,6 +1,5 @@
 from random import choice, uniform
 from math import floor, copysign
-from itertools import product
 from time import monotonic
 
 from twisted.internet import reactor
@@ -175,10 +174,12 @@ class MilsimConnection(FeatureConnection):
 
             x, y, z = floor3(r)
 
-            for X, Y in product(range(x - 1, x + 2), range(y - 1, y + 2)):
-                if Z := self.protocol.map.get_z(X, Y, zmin = z, zmax = z + 4):
-                    if i := self.protocol.get_item_entity(X, Y, Z):
-                        yield i
+            # Only the columns holding an item within the scanned heights are looked at.
+            for X, Y, zs in self.protocol.item_entities.nearby(x, y, 1):
+                if any(z <= Z < z + 4 for Z in zs):
+                    if Z := self.protocol.map.get_z(X, Y, zmin = z, zmax = z + 4):
+                        if i := self.protocol.get_item_entity(X, Y, Z):
+                            yield i
 
             if vector_collision(r, self.protocol.team_1.base):
                 yield self.protocol.team1_tent_inventory
@@ -226,11 +227,13 @@ class MilsimConnection(FeatureConnection):
         if self.previous_floor_position is not None:
             r1, r2 = self.previous_floor_position, self.floor()
 
-            M = self.protocol.map
-            for x, y, z in cube_line(*r1, *r2):
-                if M.get_solid(x, y, z):
-                    if e := self.protocol.get_tile_entity(x, y, z):
-                        e.on_pressure()
+            # Most of the map has no tile entities around, so the line is not even walked there.
+            if self.protocol.tile_entities.occupied(r1[0], r1[1], r2[0], r2[1]):
+                M = self.protocol.map
+                for x, y, z in cube_line(*r1, *r2):
+                    if M.get_solid(x, y, z):
+                        if e := self.protocol.get_tile_entity(x, y, z):
+                            e.on_pressure()
 
             self.previous_floor_position = r2
 
@@ -699,8 +702,7 @@ class MilsimConnection(FeatureConnection):
         self.protocol.broadcast_contained(contained, save = True)
         self.protocol.update_entities()
 
-        for x, y, z in locs:
-            self.protocol.on_block_build(x, y, z)
+        self.protocol.on_blocks_build(locs)
 
     @register_packet_handler(loaders.BlockLine)
     def on_block_line_recieved(self, contained):
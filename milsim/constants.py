@@ -16,3 +16,8 @@ class HitEffect:
     block    = 0
     headshot = 1
     player   = 2
+
+class EngineEvent:
+    trace  = 0
+    block  = 1
+    player = 2
@@ -0,0 +1,276 @@
+from argparse import ArgumentParser
+from collections import Counter, namedtuple
+from time import perf_counter
+from hashlib import sha1
+from random import Random
+from math import floor
+import os
+
+from pyspades.common import Vertex3
+from pyspades.world import World, Character
+from pyspades.bytes import ByteWriter
+
+from milsim.engine import Engine
+from milsim.constants import EngineEvent, HitEffect
+from milsim.packets import TracerPacket, HitEffectPacket, tracers, hitEffects
+from milsim.common import columns, where
+from milsim.map import MapInfo, RotationInfo
+from milsim.maptools import load_vxl
+from milsim.weapon import Rifle, SMG, Shotgun
+from milsim.types import Environment
+from milsim.builtin import Dirt, Sand, Water
+
+# Synthetic shooters firing as fast as the corresponding weapon allows.
+Preset = namedtuple('Preset', ['cartridge', 'delay'])
+
+presets = {
+    'rifle':   Preset(Rifle.default_magazine.cartridge, Rifle.delay),
+    'smg':     Preset(SMG.default_magazine.cartridge,   SMG.delay),
+    'shotgun': Preset(Shotgun.default_cartridge,        Shotgun.delay),
+}
+
+class Shooter:
+    height = 2.25
+
+    def __init__(self, world, position, preset):
+        self.world_object = world.create_object(Character, position, Vertex3(1, 0, 0))
+        self.preset       = preset
+        self.last_shot    = -preset.delay
+
+    def eye(self):
+        o = self.world_object.position
+        return Vertex3(o.x, o.y, o.z - self.height)
+
+# Stands in for `MilsimProtocol` with the same callbacks, but without a reactor and connections:
+# packets are encoded, but not sent anywhere.
+class HarnessProtocol:
+    def __init__(self, M):
+        self.map     = M
+        self.world   = World()
+        self.players = {}
+        self.count   = Counter()
+        self.engine  = Engine(self)
+
+    def send(self, contained):
+        writer = ByteWriter()
+        contained.write(writer)
+        self.count['bytes'] += len(bytes(writer))
+
+    def onEvents(self, data, cartridges):
+        if not data:
+            return
+
+        handle, index, x, y, z, vx, vy, vz, value, A, X, Y, Z, thrower, target, k, kind, limb, origin = columns(data, self.engine.format)
+
+        packets = tracers(kind, EngineEvent.trace, index, x, y, z, value, origin)
+        self.count['trace'] += len(packets)
+        self.count['bytes'] += sum(map(len, packets))
+
+        packets = hitEffects(kind, EngineEvent.block, HitEffect.block, x, y, z, X, Y, Z)
+        self.count['block'] += len(packets)
+        self.count['bytes'] += sum(map(len, packets))
+
+        for i in where(kind, EngineEvent.player):
+            self.onPlayerHit(
+                cartridges[k[i]], x[i], y[i], z[i], vx[i], vy[i], vz[i],
+                X[i], Y[i], Z[i], thrower[i], value[i], A[i], target[i], limb[i]
+            )
+
+    def onTrace(self, index, x, y, z, value, origin):
+        self.count['trace'] += 1
+        self.send(TracerPacket(index, Vertex3(x, y, z), value, origin = origin))
+
+    def onBlockHit(self, o, x, y, z, vx, vy, vz, X, Y, Z, thrower, E, A):
+        self.count['block'] += 1
+        self.send(HitEffectPacket(x, y, z, X, Y, Z, HitEffect.block))
+
+    def onPlayerHit(self, o, x, y, z, vx, vy, vz, X, Y, Z, thrower, E, A, target, limb):
+        self.count['player'] += 1
+        return True
+
+    def onDestroy(self, player_id, x, y, z):
+        self.count['destroy'] += 1
+
+        if self.map.destroy_point(x, y, z) > 0:
+            del self.engine[x, y, z]
+
+def load(name, dirname = 'maps', seed = None):
+    """
+    Returns the map and its environment given either a VXL file
+    or the name of a map script in `dirname` (with an optional “#seed” suffix).
+    """
+    if name.endswith('.vxl'):
+        return load_vxl(name), Environment(default = Dirt, build = Sand, water = Water)
+
+    rot_info = RotationInfo(name)
+    if seed is not None: rot_info.seed = seed
+
+    info = MapInfo(rot_info, dirname)
+    return info.data, info.environment
+
+def clamp(a, b):
+    return max(0, a), min(512, b)
+
+class Harness:
+    def __init__(self, M, environment, shooters = 16, presets = presets.values(), seed = 0, tickrate = 60):
+        self.protocol = HarnessProtocol(M)
+        self.engine   = self.protocol.engine
+        self.random   = Random(seed)
+        self.dt       = 1 / tickrate
+        self.time     = 0.0
+
+        self.engine.clear()
+        self.engine.seed    = seed
+        self.engine.batched = True
+
+        environment.apply(self.engine)
+        self.engine.update(environment)
+
+        box = environment.size
+        xmin, xmax = clamp(box.xmin, box.xmax)
+        ymin, ymax = clamp(box.ymin, box.ymax)
+
+        presets = list(presets)
+
+        for i in range(shooters):
+            x = self.random.uniform(xmin, xmax)
+            y = self.random.uniform(ymin, ymax)
+            z = M.get_z(floor(x), floor(y)) - 1
+
+            self.protocol.players[i] = Shooter(self.protocol.world, Vertex3(x, y, z), presets[i % len(presets)])
+            self.engine.on_spawn(i)
+
+        self.shots = self.objects = self.steps = self.load = 0
+        self.elapsed, self.events = [], []
+        self.digest = sha1()
+
+    def aim(self, i):
+        shooter = self.protocol.players[i]
+
+        j = self.random.randrange(len(self.protocol.players) - 1)
+        target = self.protocol.players[j + (j >= i)]
+
+        n = target.world_object.position - shooter.world_object.position
+        n.x += self.random.gauss(0, 0.5)
+        n.y += self.random.gauss(0, 0.5)
+        n.z += self.random.gauss(0, 0.5)
+
+        n = n.normal()
+        shooter.world_object.orientation.set(n.x, n.y, n.z)
+
+        return n
+
+    def tick(self):
+        t1, t2 = self.time, self.time + self.dt
+        engine = self.engine
+
+        for i, shooter in self.protocol.players.items():
+            if t1 - shooter.last_shot < shooter.preset.delay:
+                continue
+
+            shooter.last_shot = t1
+
+            o = shooter.preset.cartridge
+            n = self.aim(i) if len(self.protocol.players) > 1 else shooter.world_object.orientation
+
+            engine.fire(i, shooter.eye() + n * 1.2, n, Vertex3(0, 0, 0), t1, engine.register(o), o.pellets)
+
+            self.shots   += 1
+            self.objects += o.pellets
+
+        self.load += engine.alive
+
+        T = perf_counter()
+        engine.step(t1, t2)
+        self.elapsed.append(perf_counter() - T)
+
+        T = perf_counter()
+        data, cartridges = engine.drain()
+        self.digest.update(data)
+        self.protocol.onEvents(data, cartridges)
+        self.events.append(perf_counter() - T)
+
+        self.steps += 1
+        self.time = t2
+
+    def run(self, duration):
+        for _ in range(round(duration / self.dt)):
+            self.tick()
+
+        return self
+
+    def percentile(self, p):
+        T = sorted(self.elapsed)
+        return T[min(len(T) - 1, int(p * len(T)))] if T else 0.0
+
+    def __str__(self):
+        total    = sum(self.elapsed)
+        events   = sum(self.events)
+        substeps = self.engine.substeps
+        count    = self.protocol.count
+
+        return "\n".join([
+            "{shots} shots ({objects} objects) in {duration:.1f} s, {rate:.0f} shots/s".format(
+                shots    = self.shots,
+                objects  = self.objects,
+                duration = self.time,
+                rate     = self.shots / total if total > 0 else 0.0
+            ),
+            "step: mean {mean:.1f} us, p50 {p50:.1f} us, p99 {p99:.1f} us, max {peak:.1f} us".format(
+                mean = total / max(1, self.steps) * 1e+6,
+                p50  = self.percentile(0.50) * 1e+6,
+                p99  = self.percentile(0.99) * 1e+6,
+                peak = max(self.elapsed, default = 0.0) * 1e+6
+            ),
+            "events: mean {mean:.1f} us, with the step {total:.1f} us".format(
+                mean  = events / max(1, self.steps) * 1e+6,
+                total = (total + events) / max(1, self.steps) * 1e+6
+            ),
+            "sub-steps: {total}, {lifetime:.1f} per object, {perstep:.2f} per object and step".format(
+                total    = substeps,
+                lifetime = substeps / max(1, self.objects),
+                perstep  = substeps / max(1, self.load)
+            ),
+            "callbacks: {trace} trace, {block} block, {player} player, {destroy} destroy, {bytes} bytes of packets".format(
+                trace   = count['trace'],
+                block   = count['block'],
+                player  = count['player'],
+                destroy = count['destroy'],
+                bytes   = count['bytes']
+            ),
+            "digest: {}".format(self.digest.hexdigest())
+        ])
+
+def main():
+    parser = ArgumentParser(description = "Throughput benchmark of the ballistic engine")
+    parser.add_argument('map', help = "map name (from the maps directory) or VXL file")
+    parser.add_argument('--maps', default = os.path.join(os.path.dirname(__file__), os.pardir, 'maps'), help = "maps directory")
+    parser.add_argument('--shooters', type = int, default = 16, help = "number of shooters")
+    parser.add_argument('--preset', action = 'append', choices = presets.keys(), help = "weapon preset (all by default)")
+    parser.add_argument('--duration', type = float, default = 60.0, help = "simulated time (s)")
+    parser.add_argument('--seed', type = int, default = 0, help = "random seed")
+    parser.add_argument('--workers', type = int, default = 0, help = "number of worker threads")
+    parser.add_argument('--integrator', default = 'euler', help = "free flight integrator")
+    parser.add_argument('--trace', action = 'store_true', help = "enable trace events")
+    parser.add_argument('--unbatched', action = 'store_true', help = "call the callbacks during the step instead of buffering the events")
+
+    args = parser.parse_args()
+
+    M, environment = load(args.map, args.maps, args.seed)
+
+    harness = Harness(
+        M, environment, shooters = args.shooters, seed = args.seed,
+        presets = map(presets.get, args.preset or presets.keys())
+    )
+
+    harness.engine.workers    = args.workers
+    harness.engine.integrator = args.integrator
+    harness.engine.batched    = not args.unbatched
+
+    if args.trace:
+        harness.engine.on_trace = harness.protocol.onTrace
+
+    print(harness.run(args.duration))
+
+if __name__ == '__main__':
+    main()
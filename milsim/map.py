@@ -1,7 +1,10 @@
+from concurrent.futures import Future, CancelledError, wait, FIRST_COMPLETED
 from itertools import chain, islice, repeat
+from threading import Lock
 from time import monotonic
 from random import randint
 from zlib import crc32
+import sys
 import os
 
 from twisted.logger import Logger
@@ -9,7 +12,10 @@ from twisted.logger import Logger
 from piqueserver.map import MapNotFound
 from piqueserver.config import config
 
-from milsim.types import Environment
+from milsim.types import Environment, Defaults
+from milsim.engine import Throttle, Cancelled
+from milsim.cache import dumps, loads
+from milsim.vxl import VxlData
 
 log = Logger()
 
@@ -41,11 +47,12 @@ class RotationInfo:
         return os.path.join(dirname, self.get_filename(dirname))
 
 class MapInfo:
-    def __init__(self, rot_info, dirname):
+    def __init__(self, rot_info, dirname, cache = None, pool = None, job = None):
         filepath = rot_info.get_filepath(dirname)
 
         try:
-            fin = open(filepath, 'r')
+            with open(filepath, 'r') as fin:
+                source = fin.read()
         except OSError:
             raise MapNotFound(filepath)
 
@@ -57,7 +64,7 @@ class MapInfo:
             author              = "(unknown)",
             version             = "1.0",
             description         = "",
-            seed                = rot_info.seed or seed(),
+            seed                = seed() if rot_info.seed is None else rot_info.seed,
             extensions          = dict(),
             load_dir            = dirname,
             load_path           = filepath,
@@ -71,41 +78,180 @@ class MapInfo:
             on_flag_capture     = None,
             on_block_destroy    = None,
             is_indestructable   = None,
+            cacheable           = True,
             info                = self, # for the backward compatibility reasons
             self                = self
         )
 
         log.info("Loading map “{map_name}”...", map_name = self.name)
 
-        try:
-            exec(
-                compile(fin.read(), rot_info.get_filename(dirname), 'exec'),
-                self.__dict__
-            )
-        finally:
-            fin.close()
+        exec(compile(source, rot_info.get_filename(dirname), 'exec'), self.__dict__)
+
+        # The generation must depend on nothing but the source and the seed, and have no side effects used later,
+        # otherwise the script should set `cacheable = False`: then it is neither cached nor run in a worker process.
+        reusable = self.cacheable and getattr(self.on_map_generation, 'cacheable', True)
+
+        # Only the maps with a fixed seed are worth caching.
+        if cache is not None and rot_info.seed is not None and reusable:
+            key = cache.key(source, self.seed)
+        else:
+            key = None
 
         t1 = monotonic()
 
-        self.data = self.on_map_generation(dirname, self.seed)
-        self.environment = self.on_environment_generation(dirname, self.seed)
+        entry = None if key is None else cache.load(key, self.__dict__)
+        where = "" if entry is None else " (cached)"
+
+        if entry is None and pool is not None and reusable:
+            entry = self.generate_remotely(pool, dirname, job)
+
+            if entry is not None:
+                where = " (in a worker process)"
+
+                if key is not None:
+                    cache.store(key, self.__dict__, *entry)
+
+        if entry is None:
+            self.data = self.on_map_generation(dirname, self.seed)
+            self.environment = self.generate_environment(dirname)
+
+            if key is not None:
+                self.environment.defaults = Defaults(self.environment.defaults)
+                cache.store(key, self.__dict__, self.data, self.environment.palette, self.environment.defaults)
+        else:
+            self.data, palette, defaults = entry
+
+            self.environment = self.generate_environment(dirname)
+            self.environment.palette  = palette
+            self.environment.defaults = defaults
 
         t2 = monotonic()
 
-        log.info('Map loading took {duration:.2f} s', duration = t2 - t1)
+        log.info('Map loading took {duration:.2f} s{where}', duration = t2 - t1, where = where)
+
+    def generate_remotely(self, pool, dirname, job = None):
+        """
+        Returns the map, the palette and the defaults generated by `generate` in the process pool `pool`
+        or None if it failed. Raises `Cancelled` once `job` is cancelled.
+        """
+        rot_info = RotationInfo("{}#{}".format(self.name, self.seed))
+
+        try:
+            if job is None:
+                image, env = pool.submit(generate, rot_info, dirname).result()
+            else:
+                image, env = job.run(pool, generate, rot_info, dirname)
+
+            data = VxlData.loads(image)
+            palette, defaults = loads(env, self.__dict__)
+        except (Cancelled, CancelledError):
+            raise Cancelled() from None
+        except Exception as exc:
+            log.warn("Generation in a worker process failed, falling back: {exc}", exc = exc)
+            return None
+
+        return data, palette, defaults
+
+    def generate_environment(self, dirname):
+        retval = self.on_environment_generation(dirname, self.seed)
 
-        if not isinstance(self.environment, Environment):
+        if not isinstance(retval, Environment):
             raise TypeError(
                 "expected milsim.types.Environment instance, found {}: {}".format(
-                    type(self.environment), self.environment
+                    type(retval), retval
                 )
             )
 
+        return retval
+
     def __getattr__(self, attr):
         raise AttributeError(
             "name “{}” is not defined in the map “{}”".format(attr, self.name)
         )
 
+def generate(rot_info, dirname):
+    """
+    Runs in a worker process, returns the raw image of the map (see `VxlData.dumps`)
+    along with the palette and the defaults of its environment pickled with the materials referred to by name.
+    """
+    info = MapInfo(rot_info, dirname)
+
+    return info.data.dumps(), dumps((info.environment.palette, Defaults(info.environment.defaults)), info.__dict__)
+
+class Job:
+    """
+    Work sent to the process pool on behalf of a pregeneration, so that it can be withdrawn when the pregeneration
+    is abandoned: the throttle cannot stop the thread while it waits for the pool.
+    """
+
+    def __init__(self):
+        self.lock      = Lock()
+        self.future    = None
+        self.withdrawn = Future()
+
+    def run(self, pool, fn, *w):
+        with self.lock:
+            if self.withdrawn.done():
+                raise Cancelled()
+
+            self.future = pool.submit(fn, *w)
+
+        wait((self.future, self.withdrawn), return_when = FIRST_COMPLETED)
+
+        if self.withdrawn.done():
+            raise Cancelled()
+
+        return self.future.result()
+
+    def cancel(self):
+        """
+        Withdraws the work unless the pool has already taken it (a process pool takes the next job as soon as
+        it is submitted, even while the worker is busy), returns whether the pool is still busy with it.
+        """
+        with self.lock:
+            if not self.withdrawn.done():
+                self.withdrawn.set_result(None)
+
+            return self.future is not None and not self.future.cancel() and not self.future.done()
+
+def warm_up():
+    """
+    Does nothing: submitted to a fresh process pool, so that the worker is started and has imported this module
+    before the first map is asked for.
+    """
+
+def pregenerate(rot_info, dirname, cache, pool, throttle, job):
+    """
+    Same as `MapInfo(rot_info, dirname, cache, pool)`, but throttled by `throttle` and cancelled along with `job`.
+    """
+    throttle.install()
+
+    try:
+        return MapInfo(rot_info, dirname, cache, pool, job)
+    finally:
+        sys.setprofile(None)
+
+class Lookahead:
+    """
+    Iterator that allows to look at the next element without taking it.
+    """
+
+    def __init__(self, it):
+        self.it     = iter(it)
+        self.buffer = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.buffer.pop() if self.buffer else next(self.it)
+
+    def peek(self):
+        if not self.buffer:
+            self.buffer.append(next(self.it))
+
+        return self.buffer[-1]
+
 def check_map(map_name, dirname):
     rot_info = RotationInfo(map_name)
 
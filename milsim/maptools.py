@@ -31,6 +31,9 @@ def VXL(filename):
     def retfun(dirname, seed):
         return load_vxl(os.path.join(dirname, filename))
 
+    # Loading the file is as fast as loading the cache entry, while the latter would miss any change to the file.
+    retfun.cacheable = False
+
     return retfun
 
 def Location(x, y, z):
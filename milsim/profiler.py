@@ -0,0 +1,50 @@
+from collections import deque
+from time import perf_counter
+
+def percentile(T, p):
+    return T[min(len(T) - 1, int(p * len(T)))] if T else 0.0
+
+class TickProfiler:
+    """
+    Times the stages of a tick over the last `window` ticks,
+    a tick longer than `budget` (s) is counted as an overrun.
+    """
+
+    def __init__(self, stages, budget, window = 600):
+        self.budget  = budget
+        self.window  = window
+        self.stages  = list(stages)
+
+        self.reset()
+
+    def reset(self):
+        self.samples  = {stage: deque(maxlen = self.window) for stage in self.stages}
+        self.total    = deque(maxlen = self.window)
+        self.ticks    = 0
+        self.overruns = 0
+
+    def start(self):
+        self.T0 = self.T = perf_counter()
+
+    def lap(self, stage):
+        T = perf_counter()
+        self.samples[stage].append(T - self.T)
+        self.T = T
+
+    def stop(self):
+        dt = self.T - self.T0
+        self.total.append(dt)
+
+        self.ticks += 1
+
+        if dt > self.budget:
+            self.overruns += 1
+
+    def summary(self):
+        """
+        Yields the name, p50, p99 and maximum (μs) of every stage and then of the whole tick.
+        """
+        for stage, samples in (*self.samples.items(), ('total', self.total)):
+            T = sorted(samples)
+
+            yield stage, percentile(T, 0.50) * 1e+6, percentile(T, 0.99) * 1e+6, max(T, default = 0.0) * 1e+6
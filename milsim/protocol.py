@@ -1,9 +1,13 @@
-from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from contextlib import contextmanager
 from time import monotonic
 from random import choice
 import os
 
-from twisted.internet import threads
+import enet
+
+from twisted.internet import reactor, threads
 from twisted.logger import Logger
 
 import pyspades.contained as loaders
@@ -16,14 +20,18 @@ from piqueserver.config import config
 from milsim.packets import (
     TracerPacket, HitEffectPacket,
     hasTraceExtension, hasHitEffects,
+    tracers, hitEffects,
     milsim_extensions
 )
 
 from milsim.weapon import ABCWeapon, Rifle, SMG, Shotgun, HEIMagazine
-from milsim.vxl import onDeleteQueue, deleteQueueClear
-from milsim.map import MapInfo, check_rotation
-from milsim.constants import Limb, HitEffect
-from milsim.engine import Engine
+from milsim.vxl import deleteQueueDrain, deleteQueueOverflow, deleteQueueClear
+from milsim.map import MapInfo, Lookahead, Job, pregenerate, warm_up, check_rotation
+from milsim.cache import MapCache
+from milsim.constants import Limb, HitEffect, EngineEvent
+from milsim.engine import Engine, Throttle, Cancelled
+from milsim.profiler import TickProfiler
+from milsim.spatial import ChunkIndex, ColumnIndex
 from milsim.common import *
 
 from milsim.items import Kettlebell, CompassItem, ProtractorItem, RangefinderItem, StunHandgrenadeItem
@@ -60,6 +68,37 @@ def milsim_default_tent_loadout(self):
 
 log = Logger()
 
+section = config.section("profiler")
+
+# Interval (s) between the tick profile log lines, 0 disables them.
+profiler_interval = section.option("interval", 0).get()
+
+cache_section = config.section("cache")
+
+# Generated maps are kept in `config_dir/cache` (see `milsim.cache.MapCache`).
+cache_enabled = cache_section.option("enabled", False).get()
+cache_limit   = cache_section.option("limit", 16).get()
+
+queue_section = config.section("delete_queue")
+
+# Voxels detached by a removal are processed (for the tile and item entities) in chunks of `chunk`
+# until either `entries` of them or `time` (s) per tick is spent.
+queue_entries = queue_section.option("entries", 4096).get()
+queue_time    = queue_section.option("time", 0.002).get()
+queue_chunk   = queue_section.option("chunk", 256).get()
+
+generation_section = config.section("generation")
+
+# Map scripts are run in a separate process (with the given niceness), so that they do not compete for the GIL.
+generation_process = generation_section.option("process", True).get()
+generation_nice    = generation_section.option("nice", 10).get()
+
+pregeneration_section = config.section("pregeneration")
+
+# The next map in rotation is generated in the background using at most `budget` of a single CPU.
+pregeneration_enabled = pregeneration_section.option("enabled", True).get()
+pregeneration_budget  = pregeneration_section.option("budget", 0.25).get()
+
 class MilsimProtocol(FeatureProtocol):
     default_tent_loadout = milsim_default_tent_loadout
 
@@ -71,12 +110,36 @@ class MilsimProtocol(FeatureProtocol):
     def __init__(self, *w, **kw):
         self.map_dir = os.path.join(config.config_dir, 'maps')
 
+        if cache_enabled:
+            self.map_cache = MapCache(os.path.join(config.config_dir, 'cache'), cache_limit)
+        else:
+            self.map_cache = None
+
+        if generation_process:
+            self.start_map_pool()
+            reactor.addSystemEventTrigger('before', 'shutdown', self.stop_map_pool)
+        else:
+            self.map_pool = None
+
+        self._planned_map  = None
+        self.pregeneration = None
+
         self.environment = None
         self.engine      = Engine(self)
         self.time        = monotonic()
 
-        self.tile_entities = {}
-        self.item_entities = {}
+        self.engine.batched = True
+
+        self.profiler = TickProfiler(
+            ('weather', 'engine', 'events', 'queue', 'players', 'feature'),
+            budget = UPDATE_FREQUENCY
+        )
+        self.profiler_time = self.time
+
+        self.tile_entities = ChunkIndex()
+        self.item_entities = ColumnIndex()
+
+        self.deferred_builds = None
 
         self.team1_tent_inventory = Inventory()
         self.team2_tent_inventory = Inventory()
@@ -90,12 +153,81 @@ class MilsimProtocol(FeatureProtocol):
         self.team_spectator.kills = 0 # bugfix
         self.available_proto_extensions.extend(milsim_extensions)
 
+    def start_map_pool(self):
+        self.map_pool = ProcessPoolExecutor(
+            1, mp_context = get_context('spawn'), initializer = os.nice, initargs = (generation_nice,)
+        )
+
+        self.map_pool.submit(warm_up)
+
+    def stop_map_pool(self):
+        self.map_pool.shutdown(wait = False, cancel_futures = True)
+
     def set_map_rotation(self, maps):
         self.maps = check_rotation(maps, self.map_dir)
-        self.map_rotator = self.map_rotator_type(self.maps)
+        self.map_rotator = Lookahead(self.map_rotator_type(self.maps))
+
+        if self.pregeneration is not None:
+            self.pregenerate(self.map_rotator.peek())
+
+    @property
+    def planned_map(self):
+        return self._planned_map
+
+    @planned_map.setter
+    def planned_map(self, rot_info):
+        self._planned_map = rot_info
+
+        if rot_info is not None and pregeneration_enabled:
+            self.pregenerate(rot_info)
+
+    def pregenerate(self, rot_info):
+        """
+        Starts generating the map `rot_info` in the background, the one generated before is abandoned.
+        """
+        if self.pregeneration is not None:
+            if self.pregeneration[0] is rot_info:
+                return
+
+            self.cancel_pregeneration()
+
+        throttle, job = Throttle(pregeneration_budget), Job()
+
+        deferred = threads.deferToThread(pregenerate, rot_info, self.map_dir, self.map_cache, self.map_pool, throttle, job)
+        self.pregeneration = rot_info, throttle, job, deferred
+
+    def cancel_pregeneration(self):
+        if self.pregeneration is not None:
+            rot_info, throttle, job, deferred = self.pregeneration
+            self.pregeneration = None
+
+            throttle.cancel()
+
+            # The worker cannot be interrupted, so it is left to finish the abandoned script
+            # and exit, while a fresh one takes the maps that follow.
+            if job.cancel():
+                log.info("Abandoning the worker busy with “{map_name}”", map_name = rot_info.full_name)
+
+                self.stop_map_pool()
+                self.start_map_pool()
+
+            deferred.addErrback(self.on_pregeneration_error, rot_info)
+
+    def on_pregeneration_error(self, failure, rot_info):
+        if not failure.check(Cancelled):
+            log.failure("Pregeneration of “{map_name}” failed", failure, map_name = rot_info.full_name)
 
     def make_map(self, rot_info):
-        return threads.deferToThread(MapInfo, rot_info, self.map_dir)
+        if self.pregeneration is not None and self.pregeneration[0] is rot_info:
+            _, throttle, _, deferred = self.pregeneration
+            self.pregeneration = None
+
+            throttle.lift()
+            return deferred
+
+        self.cancel_pregeneration()
+
+        return threads.deferToThread(MapInfo, rot_info, self.map_dir, self.map_cache, self.map_pool)
 
     def on_connect(self, peer):
         log.info("{address} connected", address = peer.address)
@@ -188,6 +320,26 @@ class MilsimProtocol(FeatureProtocol):
         if e := self.get_tile_entity(x, y, z + 1):
             e.on_pressure()
 
+    def on_blocks_build(self, locs):
+        self.engine.assign(locs, self.build_material)
+
+        for x, y, z in locs:
+            if e := self.get_tile_entity(x, y, z + 1):
+                e.on_pressure()
+
+    @contextmanager
+    def deferred_build(self):
+        """
+        Blocks built by the BlockAction packets broadcast inside are passed to `on_blocks_build` at once on exit.
+        """
+        self.deferred_builds = []
+
+        try:
+            yield
+        finally:
+            locs, self.deferred_builds = self.deferred_builds, None
+            self.on_blocks_build(locs)
+
     def on_block_destroy(self, x, y, z):
         del self.engine[x, y, z]
 
@@ -196,6 +348,40 @@ class MilsimProtocol(FeatureProtocol):
 
         self.drop_item_entity(x, y, z)
 
+    def drain_delete_queue(self, deadline):
+        if not self.tile_entities and not self.item_entities:
+            deleteQueueClear()
+            return
+
+        # Some of the detached voxels were dropped, so every entity is checked instead.
+        if deleteQueueOverflow() > 0:
+            for (x, y, z), e in list(self.tile_entities.items()):
+                if not self.map.get_solid(x, y, z):
+                    e.on_destroy()
+
+            for x, y, z in list(self.item_entities):
+                self.drop_item_entity(x, y, z)
+
+        n = queue_entries
+
+        while n > 0:
+            w = deleteQueueDrain(min(n, queue_chunk))
+
+            if not w:
+                break
+
+            n -= len(w) // 3
+            it = iter(w)
+
+            for x, y, z in zip(it, it, it):
+                if e := self.get_tile_entity(x, y, z):
+                    e.on_destroy()
+
+                self.drop_item_entity(x, y, z)
+
+            if monotonic() >= deadline:
+                break
+
     def on_map_change(self, M):
         deleteQueueClear()
 
@@ -217,7 +403,13 @@ class MilsimProtocol(FeatureProtocol):
 
         log.info("Environment loading took {duration:.2f} s", duration = t2 - t1)
 
+        if pregeneration_enabled:
+            self.pregenerate(self.planned_map or self.map_rotator.peek())
+
     def on_world_update(self):
+        P = self.profiler
+        P.start()
+
         t = monotonic()
 
         if o := self.environment:
@@ -226,14 +418,18 @@ class MilsimProtocol(FeatureProtocol):
             if o.weather.update(dt):
                 self.update_weather()
 
+        P.lap('weather')
+
         self.engine.step(self.time, t)
-        self.time = t
+        P.lap('engine')
 
-        for x, y, z in islice(onDeleteQueue(), 50):
-            if e := self.get_tile_entity(x, y, z):
-                e.on_destroy()
+        self.onEvents(*self.engine.drain())
+        P.lap('events')
 
-            self.drop_item_entity(x, y, z)
+        self.time = t
+
+        self.drain_delete_queue(t + queue_time)
+        P.lap('queue')
 
         for player in self.living():
             dt = t - player.last_hp_update
@@ -272,8 +468,28 @@ class MilsimProtocol(FeatureProtocol):
 
             player.last_hp_update = t
 
+        P.lap('players')
+
         FeatureProtocol.on_world_update(self)
 
+        P.lap('feature')
+        P.stop()
+
+        if 0 < profiler_interval <= t - self.profiler_time:
+            self.profiler_time = t
+            self.log_profile()
+
+    def log_profile(self):
+        P = self.profiler
+
+        for stage, p50, p99, peak in P.summary():
+            log.info(
+                "Tick profile: {stage} p50={p50:.1f} p99={p99:.1f} max={peak:.1f} us",
+                stage = stage, p50 = p50, p99 = p99, peak = peak
+            )
+
+        log.info("Tick profile: {overruns} of {ticks} tick(s) overran", overruns = P.overruns, ticks = P.ticks)
+
     def broadcast_contained(self, contained, unsequenced = False, sender = None, team = None, save = False, rule = None):
         FeatureProtocol.broadcast_contained(self, contained, unsequenced, sender, team, save, rule)
 
@@ -283,7 +499,10 @@ class MilsimProtocol(FeatureProtocol):
             # This is intentionally not in `connection.on_block_build`, so that `protocol.on_block_build`
             # is called *after* the BlockAction packet has been sent.
             if contained.value == BUILD_BLOCK:
-                self.on_block_build(x, y, z)
+                if self.deferred_builds is None:
+                    self.on_block_build(x, y, z)
+                else:
+                    self.deferred_builds.append((x, y, z))
 
             if contained.value == DESTROY_BLOCK:
                 self.on_block_destroy(x, y, z)
@@ -296,6 +515,40 @@ class MilsimProtocol(FeatureProtocol):
                 for X, Y, Z in grenade_zone(x, y, z):
                     self.on_block_destroy(X, Y, Z)
 
+    def recipients(self, rule):
+        # Same selection as in `broadcast_contained` without `save`.
+        return [
+            player.peer for player in self.connections.values()
+            if player.player_id is not None and player.saved_loaders is None and rule(player)
+        ]
+
+    def broadcast_encoded(self, peers, packets):
+        for data in packets:
+            packet = enet.Packet(data, enet.PACKET_FLAG_RELIABLE)
+
+            for peer in peers:
+                peer.send(0, packet)
+
+    def onEvents(self, data, cartridges):
+        if not data:
+            return
+
+        handle, index, x, y, z, vx, vy, vz, value, A, X, Y, Z, thrower, target, k, kind, limb, origin = columns(data, self.engine.format)
+
+        if peers := self.recipients(hasTraceExtension):
+            self.broadcast_encoded(peers, tracers(kind, EngineEvent.trace, index, x, y, z, value, origin))
+
+        # Hits handled by the cartridges themselves are not buffered: the engine calls `onBlockHit`
+        # and `onPlayerHit` for them right away. The rest of the block hits are only hit effects.
+        if peers := self.recipients(hasHitEffects):
+            self.broadcast_encoded(peers, hitEffects(kind, EngineEvent.block, HitEffect.block, x, y, z, X, Y, Z))
+
+        for i in where(kind, EngineEvent.player):
+            self.onPlayerHit(
+                cartridges[k[i]], x[i], y[i], z[i], vx[i], vy[i], vz[i],
+                X[i], Y[i], Z[i], thrower[i], value[i], A[i], target[i], limb[i]
+            )
+
     def onTrace(self, index, x, y, z, value, origin):
         self.broadcast_contained(
             TracerPacket(index, Vertex3(x, y, z), value, origin = origin),
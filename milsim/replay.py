@@ -0,0 +1,323 @@
+from argparse import ArgumentParser
+from dataclasses import dataclass, field
+from collections import namedtuple
+from struct import Struct, calcsize
+from time import perf_counter
+from hashlib import sha1
+
+from pyspades.common import Vertex3
+from pyspades.world import World, Character
+
+from milsim.engine import Engine, Material
+from milsim.maptools import load_vxl
+
+# Log written by `Engine.record`, see `include/Milsim/Recorder.hxx`.
+magic, version = b'MSRECORD', 1
+
+class Opcode:
+    seed            = 1
+    integrator      = 2
+    batched         = 3
+    update          = 4
+    material        = 5
+    defaultMaterial = 6
+    waterMaterial   = 7
+    set             = 8
+    erase           = 9
+    durability      = 10
+    apply           = 11
+    cartridge       = 12
+    add             = 13
+    fire            = 14
+    step            = 15
+    spawn           = 16
+    despawn         = 17
+    animation       = 18
+    dig             = 19
+    smash           = 20
+    remove          = 21
+    flush           = 22
+    trace           = 23
+    fill            = 24
+
+layout = {
+    Opcode.seed:            '=Q',
+    Opcode.integrator:      '=B',
+    Opcode.batched:         '=B',
+    Opcode.update:          '=6d',
+    Opcode.material:        '=I6d?H',
+    Opcode.defaultMaterial: '=I',
+    Opcode.waterMaterial:   '=I',
+    Opcode.set:             '=3iI',
+    Opcode.erase:           '=3i',
+    Opcode.durability:      '=3id',
+    Opcode.apply:           '=I',
+    Opcode.cartridge:       '=2I6d',
+    Opcode.add:             '=i7dI',
+    Opcode.fire:            '=i10d2I',
+    Opcode.step:            '=2dI',
+    Opcode.spawn:           '=i',
+    Opcode.despawn:         '=i',
+    Opcode.animation:       '=i?',
+    Opcode.dig:             '=4id',
+    Opcode.smash:           '=4id',
+    Opcode.remove:          '=Q',
+    Opcode.flush:           '=',
+    Opcode.trace:           '=?',
+    Opcode.fill:            '=6iI',
+}
+
+layout = {k: Struct(v) for k, v in layout.items()}
+entry  = Struct('=2I')
+player = Struct('=i?6f')
+header = Struct('=8sI')
+
+integrators = ('euler', 'rk4', 'rk45')
+
+Conditions = namedtuple('Conditions', ['temperature', 'pressure', 'humidity', 'wind'])
+
+class Cartridge:
+    def __init__(self, model, effmass, ballistic, area, muzzle, deviation, grouping):
+        self.model     = model
+        self.effmass   = effmass
+        self.ballistic = ballistic
+        self.area      = area
+        self.muzzle    = muzzle
+        self.deviation = deviation
+        self.grouping  = grouping
+
+class ReplayPlayer:
+    def __init__(self, world):
+        self.world_object = world.create_object(Character, Vertex3(0, 0, 0), Vertex3(1, 0, 0))
+
+# Stands in for `MilsimProtocol`: callbacks only keep the map in sync with the engine,
+# everything else that affects the engine (like `remove` in `onEvents`) comes from the log.
+class ReplayProtocol:
+    def __init__(self, M):
+        self.map     = M
+        self.world   = World()
+        self.players = {}
+
+    def onTrace(self, *w):
+        pass
+
+    def onBlockHit(self, *w):
+        pass
+
+    def onPlayerHit(self, o, x, y, z, vx, vy, vz, X, Y, Z, thrower, E, A, target, limb):
+        return target in self.players
+
+    def onDestroy(self, player_id, x, y, z):
+        if player_id in self.players:
+            self.map.destroy_point(x, y, z)
+
+@dataclass
+class Statistics:
+    steps   : int = 0
+    objects : int = 0
+    events  : int = 0
+    elapsed : list = field(default_factory = list)
+    digest  : object = field(default_factory = sha1)
+
+    def percentile(self, p):
+        T = sorted(self.elapsed)
+        return T[min(len(T) - 1, int(p * len(T)))] if T else 0.0
+
+    def __str__(self):
+        total = sum(self.elapsed)
+        mean  = total / self.steps if self.steps > 0 else 0.0
+
+        return "{steps} steps, {objects} objects, {events} events ({digest}), {total:.3f} s in `step`: mean {mean:.1f} us, p50 {p50:.1f} us, p99 {p99:.1f} us, max {peak:.1f} us".format(
+            steps   = self.steps,
+            objects = self.objects,
+            events  = self.events,
+            digest  = self.digest.hexdigest()[:12],
+            total   = total,
+            mean    = mean * 1e+6,
+            p50     = self.percentile(0.50) * 1e+6,
+            p99     = self.percentile(0.99) * 1e+6,
+            peak    = max(self.elapsed, default = 0.0) * 1e+6
+        )
+
+def entries(fin):
+    w = fin.read(header.size)
+
+    if len(w) < header.size or header.unpack(w) != (magic, version):
+        raise ValueError("not an engine log")
+
+    while opcode := fin.read(1):
+        S = layout[opcode[0]]
+        yield opcode[0], S.unpack(fin.read(S.size))
+
+def replay(fin, M, workers = 0, integrator = None):
+    """
+    Feeds the log into a fresh engine against the map `M` (as it was when the recording started),
+    `integrator` overrides the recorded one.
+    """
+    protocol = ReplayProtocol(M)
+    engine   = Engine(protocol)
+    stats    = Statistics()
+
+    engine.clear()
+    engine.workers = workers
+
+    materials, cartridges, palette = {}, {}, {}
+
+    material = materials.get
+
+    for opcode, w in entries(fin):
+        if opcode == Opcode.step:
+            t1, t2, n = w
+
+            for _ in range(n):
+                i, crouch, x, y, z, fx, fy, fz = player.unpack(fin.read(player.size))
+
+                wo = protocol.players[i].world_object
+                wo.position.set(x, y, z)
+                wo.orientation.set(fx, fy, fz)
+
+                engine.set_animation(i, crouch)
+
+            T = perf_counter()
+            engine.step(t1, t2)
+
+            if engine.batched:
+                data, _ = engine.drain()
+                stats.events += len(data) // calcsize(engine.format)
+                stats.digest.update(data)
+
+            stats.elapsed.append(perf_counter() - T)
+            stats.steps += 1
+
+        elif opcode == Opcode.add:
+            i, rx, ry, rz, vx, vy, vz, t, k = w
+            engine.add(i, Vertex3(rx, ry, rz), Vertex3(vx, vy, vz), t, cartridges[k])
+            stats.objects += 1
+
+        elif opcode == Opcode.fire:
+            i, rx, ry, rz, nx, ny, nz, ux, uy, uz, t, k, pellets = w
+            o = cartridges[k]
+            engine.fire(i, Vertex3(rx, ry, rz), Vertex3(nx, ny, nz), Vertex3(ux, uy, uz), t, engine.register(o), pellets)
+            stats.objects += pellets
+
+        elif opcode == Opcode.remove:
+            engine.remove(*w)
+
+        elif opcode == Opcode.set:
+            x, y, z, i = w
+
+            if not M.get_solid(x, y, z):
+                M.set_point(x, y, z, (127, 127, 127))
+
+            if o := material(i): engine[x, y, z] = o
+
+        elif opcode == Opcode.fill:
+            *box, i = w
+            if o := material(i): engine.fill(*box, o)
+
+        elif opcode == Opcode.erase:
+            x, y, z = w
+
+            if M.get_solid(x, y, z):
+                M.remove_point(x, y, z)
+
+            del engine[x, y, z]
+
+        elif opcode == Opcode.durability:
+            # There is no setter for the durability, so the difference is dug out.
+            x, y, z, d = w
+            M0, d0 = engine[x, y, z]
+            engine.dig(-1, x, y, z, (d0 - d) * M0.durability)
+
+        elif opcode == Opcode.dig:
+            engine.dig(*w)
+
+        elif opcode == Opcode.smash:
+            engine.smash(*w)
+
+        elif opcode == Opcode.spawn:
+            i, = w
+
+            if i not in protocol.players:
+                protocol.players[i] = ReplayPlayer(protocol.world)
+
+            engine.on_spawn(i)
+
+        elif opcode == Opcode.despawn:
+            i, = w
+
+            engine.on_despawn(i)
+
+        elif opcode == Opcode.animation:
+            engine.set_animation(*w)
+
+        elif opcode == Opcode.material:
+            i, durability, absorption, density, strength, ricochet, deflecting, crumbly, n = w
+
+            materials[i] = Material(
+                name       = fin.read(n).decode('utf-8'),
+                durability = durability,
+                absorption = absorption,
+                density    = density,
+                strength   = strength,
+                ricochet   = ricochet,
+                deflecting = deflecting,
+                crumbly    = crumbly
+            )
+
+        elif opcode == Opcode.cartridge:
+            k, *attrs = w
+            cartridges[k] = Cartridge(*attrs)
+
+        elif opcode == Opcode.apply:
+            n, = w
+
+            palette.clear()
+
+            for _ in range(n):
+                color, i = entry.unpack(fin.read(entry.size))
+                palette[color] = material(i)
+
+            engine.apply(palette)
+
+        elif opcode == Opcode.defaultMaterial:
+            if o := material(*w): engine.default = o
+
+        elif opcode == Opcode.waterMaterial:
+            if o := material(*w): engine.water = o
+
+        elif opcode == Opcode.update:
+            t, p, φ, wx, wy, wz = w
+            engine.update(Conditions(t, p, φ, Vertex3(wx, wy, wz)))
+
+        elif opcode == Opcode.seed:
+            engine.seed, = w
+
+        elif opcode == Opcode.integrator:
+            engine.integrator = integrator or integrators[w[0]]
+
+        elif opcode == Opcode.batched:
+            engine.batched, = w
+
+        elif opcode == Opcode.trace:
+            engine.on_trace = protocol.onTrace if w[0] else None
+
+        elif opcode == Opcode.flush:
+            engine.flush()
+
+    return stats
+
+def main():
+    parser = ArgumentParser(description = "Replay a log written by `Engine.record`")
+    parser.add_argument('log', help = "engine log")
+    parser.add_argument('vxl', help = "map as it was when the recording started")
+    parser.add_argument('--workers', type = int, default = 0, help = "number of worker threads")
+    parser.add_argument('--integrator', choices = integrators, help = "override the recorded integrator")
+
+    args = parser.parse_args()
+
+    with open(args.log, 'rb') as fin:
+        print(replay(fin, load_vxl(args.vxl), workers = args.workers, integrator = args.integrator))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+from array import array
+
+class ChunkIndex(dict):
+    """
+    Entities keyed by their positions along with the number of them in every chunk
+    of `size × size` columns, so that an area with no entities is told in O(1) per chunk.
+    """
+
+    def __init__(self, size = 8):
+        dict.__init__(self)
+
+        self.shift  = size.bit_length() - 1
+        self.width  = 512 >> self.shift
+        self.counts = array('I', bytes(4 * self.width * self.width))
+
+    def chunk(self, x, y):
+        return (y >> self.shift) * self.width + (x >> self.shift)
+
+    def inserted(self, x, y, z):
+        self.counts[self.chunk(x, y)] += 1
+
+    def removed(self, x, y, z):
+        self.counts[self.chunk(x, y)] -= 1
+
+    def __setitem__(self, k, v):
+        if k not in self:
+            self.inserted(*k)
+
+        dict.__setitem__(self, k, v)
+
+    def __delitem__(self, k):
+        dict.__delitem__(self, k)
+        self.removed(*k)
+
+    def pop(self, k, *w):
+        if k in self:
+            v = dict.pop(self, k)
+            self.removed(*k)
+
+            return v
+        else:
+            return dict.pop(self, k, *w)
+
+    def clear(self):
+        dict.clear(self)
+
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+
+    def occupied(self, x1, y1, x2, y2):
+        """
+        Whether there is any entity in the chunks covering the box from (x1, y1) to (x2, y2).
+        """
+        if not self: return False
+
+        s, w, C = self.shift, self.width, self.counts
+
+        X1, X2 = sorted((x1 >> s, x2 >> s))
+        Y1, Y2 = sorted((y1 >> s, y2 >> s))
+
+        for Y in range(max(Y1, 0), min(Y2, w - 1) + 1):
+            for X in range(max(X1, 0), min(X2, w - 1) + 1):
+                if C[Y * w + X] > 0:
+                    return True
+
+        return False
+
+class ColumnIndex(ChunkIndex):
+    """
+    `ChunkIndex` that also keeps the heights of the entities in every column.
+    """
+
+    def __init__(self, size = 8):
+        ChunkIndex.__init__(self, size)
+        self.columns = {}
+
+    def inserted(self, x, y, z):
+        ChunkIndex.inserted(self, x, y, z)
+        self.columns.setdefault((x, y), set()).add(z)
+
+    def removed(self, x, y, z):
+        ChunkIndex.removed(self, x, y, z)
+
+        zs = self.columns[x, y]
+        zs.discard(z)
+
+        if not zs: del self.columns[x, y]
+
+    def clear(self):
+        ChunkIndex.clear(self)
+        self.columns.clear()
+
+    def nearby(self, x, y, r):
+        """
+        Yields the columns within `r` (along both axes) from (x, y) that have any entity
+        along with the heights of these entities.
+        """
+        if not self.occupied(x - r, y - r, x + r, y + r):
+            return
+
+        for X in range(x - r, x + r + 1):
+            for Y in range(y - r, y + r + 1):
+                if zs := self.columns.get((X, Y)):
+                    yield X, Y, zs
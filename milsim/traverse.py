@@ -0,0 +1,68 @@
+from argparse import ArgumentParser
+from time import perf_counter
+from random import Random
+import os
+
+from milsim.harness import load
+
+def cut(M, z):
+    """
+    Removes the layer `z`, so that everything above it no longer reaches the ground.
+    """
+    for x in range(512):
+        for y in range(512):
+            if M.get_solid(x, y, z):
+                M.remove_point(x, y, z)
+
+def sample(M, random, n, zmax):
+    retval = []
+
+    while len(retval) < n:
+        x, y, z = random.randrange(512), random.randrange(512), random.randrange(zmax)
+
+        if M.get_solid(x, y, z):
+            retval.append((x, y, z))
+
+    return retval
+
+def bench(M, points):
+    nodes = 0
+
+    M.check_node(*points[0]) # allocates the scratch space
+
+    T = perf_counter()
+
+    for x, y, z in points:
+        nodes += M.check_node(x, y, z)
+
+    return perf_counter() - T, nodes
+
+def main():
+    parser = ArgumentParser(description = "Benchmark of the flood fill run by `VxlData.check_node`")
+    parser.add_argument('map', help = "map name (from the maps directory) or VXL file")
+    parser.add_argument('--maps', default = os.path.join(os.path.dirname(__file__), os.pardir, 'maps'), help = "maps directory")
+    parser.add_argument('--cut', type = int, default = 55, help = "layer removed to make the structures above it hang in the air")
+    parser.add_argument('--samples', type = int, default = 100, help = "number of starting voxels")
+    parser.add_argument('--seed', type = int, default = 0, help = "random seed")
+
+    args = parser.parse_args()
+
+    M, _ = load(args.map, args.maps, args.seed)
+    random = Random(args.seed)
+
+    for name, zmax in ('grounded', 62), ('floating', args.cut):
+        if name == 'floating':
+            cut(M, args.cut)
+
+        elapsed, nodes = bench(M, sample(M, random, args.samples, zmax))
+
+        print("{name}: {samples} calls, {nodes} nodes, {call:.1f} us per call, {node:.1f} ns per node".format(
+            name    = name,
+            samples = args.samples,
+            nodes   = nodes,
+            call    = elapsed / args.samples * 1e+6,
+            node    = elapsed / nodes * 1e+9 if nodes > 0 else 0.0
+        ))
+
+if __name__ == '__main__':
+    main()
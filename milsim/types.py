@@ -2,6 +2,8 @@ from typing import Dict, List, Callable, Tuple
 from dataclasses import dataclass, field
 from collections.abc import Iterable
 from collections import deque
+from itertools import chain
+from array import array
 from time import monotonic
 
 from math import pi, exp, log, inf, nan, floor, prod, sin, cos
@@ -89,10 +91,51 @@ class StaticWeather(Weather):
         return self.k
 
 Vector3i = Tuple[int, int, int]
+Box3i    = Tuple[int, int, int, int, int, int]
 
 def void():
     yield from ()
 
+class Defaults:
+    """
+    `Environment.defaults` in a compact form: runs of boxes (x1, y1, z1, x2, y2, z2)
+    or voxels of the same material kept in the original order, so that the overlapping ones are applied as before.
+    """
+
+    def __init__(self, it = ()):
+        self.runs = []
+
+        run, box0, M0 = [], None, None
+
+        for k, M in it:
+            box = len(k) == 6
+
+            if M is not M0 or box is not box0:
+                self.push(box0, run, M0)
+                run, box0, M0 = [], box, M
+
+            run.append(k)
+
+        self.push(box0, run, M0)
+
+    def push(self, box, run, M):
+        if run: self.runs.append((box, array('i', chain.from_iterable(run)), M))
+
+    def __iter__(self):
+        for box, w, M in self.runs:
+            n = 6 if box else 3
+
+            for i in range(0, len(w), n):
+                yield tuple(w[i:i + n]), M
+
+    def apply(self, o):
+        for box, w, M in self.runs:
+            if box:
+                for i in range(0, len(w), 6):
+                    o.fill(*w[i:i + 6], M)
+            else:
+                o.assign(w, M)
+
 @dataclass
 class Environment:
     default  : Material
@@ -100,7 +143,7 @@ class Environment:
     water    : Material
     size     : Box = field(default_factory = Box)
     palette  : Dict[int, Material] = field(default_factory = dict)
-    defaults : Iterable[Tuple[Vector3i, Material]] = field(default_factory = void)
+    defaults : Iterable[Tuple[Vector3i | Box3i, Material]] = field(default_factory = void)
     north    : Vertex3 = Vertex3(1, 0, 0)
     weather  : Weather = field(default_factory = StaticWeather)
 
@@ -110,8 +153,8 @@ class Environment:
 
         o.apply(self.palette)
 
-        for (x, y, z), M in self.defaults:
-            o[x, y, z] = M
+        defaults = self.defaults if isinstance(self.defaults, Defaults) else Defaults(self.defaults)
+        defaults.apply(o)
 
     def ofPolar(self, r, θ):
         n = self.north
@@ -5,7 +5,6 @@ from pyspades.constants import *
 
 from milsim.types import CartridgeBox, BoxMagazine, TubularMagazine, Shotshell
 from milsim.builtin import R762x54mm, HEI762x54mm, Parabellum, Buckshot0000
-from milsim.engine import cone
 from milsim.common import *
 
 class UnderbarrelItem(Item):
@@ -136,10 +135,10 @@ class ABCWeapon(Tool):
 
             engine = self.player.protocol.engine
 
-            for i in range(cartridge.pellets):
-                u = toMeters3(o.velocity * 32)
-                v = n * gauss(mu = cartridge.muzzle, sigma = cartridge.muzzle * cartridge.deviation)
-                engine.add(self.player.player_id, r, u + cone(v, cartridge.grouping), t, cartridge)
+            engine.fire(
+                self.player.player_id, r, n, toMeters3(o.velocity * 32), t,
+                engine.register(cartridge), cartridge.pellets
+            )
 
             self.player.sendWeaponReloadPacket()
 
@@ -2,8 +2,10 @@ from math import floor, fmod, acos, degrees
 from itertools import product, islice
 
 import inspect
+import os
 
 from piqueserver.commands import command, get_player, player_only
+from piqueserver.config import config
 from pyspades.common import Vertex3
 from pyspades.constants import *
 
@@ -72,16 +74,65 @@ class Engine:
             return "Usage: /engine debug (on|off)"
 
     @staticmethod
-    def stats(protocol):
+    def stats(protocol, value = None):
         o = protocol.engine
 
-        return "Total: {total}, alive: {alive}, lag: {lag}, peak: {peak}, usage: {usage}".format(
-            total = o.total,
-            alive = o.alive,
-            lag   = formatMicroseconds(o.lag),
-            peak  = formatMicroseconds(o.peak),
-            usage = formatBytes(o.usage)
-        )
+        if value == 'reset':
+            o.stats = None
+            return "Counters are reset"
+
+        S = o.stats
+        T = S['step']
+        R = S['retired']
+
+        return "\n".join([
+            "Total: {total}, alive: {alive}, lag: {lag}, peak: {peak}, usage: {usage}".format(
+                total = o.total,
+                alive = o.alive,
+                lag   = formatMicroseconds(o.lag),
+                peak  = formatMicroseconds(o.peak),
+                usage = formatBytes(o.usage)
+            ),
+            "Steps: {steps}, p50: {p50}, p99: {p99}, p99.9: {p999}, max: {max}".format(
+                steps = S['steps'],
+                p50   = formatMicroseconds(T['p50']),
+                p99   = formatMicroseconds(T['p99']),
+                p999  = formatMicroseconds(T['p999']),
+                max   = formatMicroseconds(T['max'])
+            ),
+            "Sub-steps: {substeps}, AABB tests: {tests}, ricochets: {ricochets}, penetrations: {penetrations}".format(
+                substeps     = S['substeps'],
+                tests        = S['tests'],
+                ricochets    = S['ricochets'],
+                penetrations = S['penetrations']
+            ),
+            "Callbacks: {callbacks} ({elapsed})".format(
+                callbacks = S['callbacks'],
+                elapsed   = formatMicroseconds(S['elapsed'])
+            ),
+            "Retired: {stopped} stopped, {outside} outside, {slow} slow, {timeout} timed out".format(**R)
+        ])
+
+    @staticmethod
+    def ticks(protocol, value = None):
+        P = protocol.profiler
+
+        if value == 'reset':
+            P.reset()
+            return "Tick profile is reset"
+
+        lines = [
+            "{stage}: p50 {p50}, p99 {p99}, max {peak}".format(
+                stage = stage,
+                p50   = formatMicroseconds(p50),
+                p99   = formatMicroseconds(p99),
+                peak  = formatMicroseconds(peak)
+            ) for stage, p50, p99, peak in P.summary()
+        ]
+
+        lines.append("Overruns: {} of {} tick(s)".format(P.overruns, P.ticks))
+
+        return "\n".join(lines)
 
     @staticmethod
     def flush(protocol):
@@ -90,6 +141,28 @@ class Engine:
 
         return "Removed {} object(s)".format(alive)
 
+    @staticmethod
+    def record(protocol, value = None):
+        o = protocol.engine
+
+        if value is None:
+            return "Recording: {}".format(yn(o.recording))
+        elif value == 'off':
+            o.record(None)
+            return "Recording is stopped"
+        else:
+            # Replay with `python -m milsim.replay NAME.log NAME.vxl`.
+            dirname = os.path.join(config.config_dir, 'replays')
+            os.makedirs(dirname, exist_ok = True)
+
+            filepath = os.path.join(dirname, os.path.basename(value))
+
+            with open(filepath + '.vxl', 'wb') as fout:
+                fout.write(protocol.map.generate())
+
+            o.record(filepath + '.log')
+            return "Recording to {}.log".format(os.path.basename(value))
+
 @command('engine', admin_only = True)
 def engine(connection, subcmd, *w, **kw):
     protocol = connection.protocol
@@ -118,17 +118,18 @@ def sendBuildBlock(connection, color, region):
 
     N = 0
 
-    for x, y, z in region:
-        contained.x = x
-        contained.y = y
-        contained.z = z
+    with protocol.deferred_build():
+        for x, y, z in region:
+            contained.x = x
+            contained.y = y
+            contained.z = z
 
-        protocol.broadcast_contained(contained)
+            protocol.broadcast_contained(contained)
 
-        M.set_point(x, y, z, color)
-        connection.on_block_build(x, y, z)
+            M.set_point(x, y, z, color)
+            connection.on_block_build(x, y, z)
 
-        N += 1
+            N += 1
 
     protocol.broadcast_contained(newSetColor(connection.player_id, connection.color))
 
@@ -1,38 +1,319 @@
 #include <Milsim/Engine.hxx>
 
-template<typename T> Vector3<T> cone(const Vector3<T> & v, const T σ) {
-    static std::random_device rd;
-    static std::mt19937 randgen(rd());
+template<typename T> inline Vector3<T> cone(const Vector3<T> & v, const T α, const T β) {
+    auto n = v.normal(); auto left = Vector3<T>(n.y, -n.x, 0).normal();
+    return v.rot(left, α).rot(n, β);
+}
 
+template<typename T> Vector3<T> cone(const Vector3<T> & v, const T σ) {
     std::normal_distribution gauss(0.0, σ);
     std::uniform_real_distribution uniform(-std::numbers::pi_v<T>, std::numbers::pi_v<T>);
 
-    auto n = v.normal(); auto left = Vector3<T>(n.y, -n.x, 0).normal();
-    auto α = std::fabs(gauss(randgen)), β = uniform(randgen);
+    return cone(v, T(std::fabs(gauss(randgen()))), T(uniform(randgen())));
+}
 
-    return v.rot(left, α).rot(n, β);
+template Vector3<double> cone(const Vector3<double> &, const double);
+
+template<typename T> inline Vector3<T> cone(const Vector3<T> & v, const T σ, Philox & rng) {
+    auto α = std::fabs(σ * rng.gauss()), β = std::numbers::pi_v<T> * (2 * rng.uniform() - 1);
+    return cone(v, T(α), T(β));
 }
 
-Voxel & VoxelData::set(int i, PyObject * o) {
-    int x, y, z; get_xyz(i, &x, &y, &z);
-    if (63 <= z) return water; // ignore z = 63
+VoxelData::Chunk & VoxelData::chunk(int x, int y, int z) {
+    auto & c = chunks[chunkOf(x, y, z)];
+
+    if (c == nullptr) { c = std::make_unique<Chunk>(); allocated++; }
+
+    return *c;
+}
+
+int VoxelData::intern(PyObject * o) {
+    if (o == nullptr || o == defaultMaterial) return 0;
+
+    auto iter = index.find(o);
 
-    auto d = z < 62 ? 1.0 : std::numeric_limits<double>::infinity();
+    if (iter == index.end()) {
+        if (table.size() > capacity) return -1;
 
-    if (o == nullptr) o = defaultMaterial;
+        iter = index.emplace(o, table.size()).first;
+        table.emplace_back(Py_NewRef(o));
+    }
 
-    auto [iter, _] = data.insert_or_assign(i, Voxel(o, d));
     return iter->second;
 }
 
-Voxel & VoxelData::get(int x, int y, int z) {
-    if (63 <= z) return water;
+bool VoxelData::set(int x, int y, int z, PyObject * o) {
+    if (!inside(x, y, z) || 63 <= z) return true; // ignore z = 63
+
+    auto k = intern(o); if (k < 0) return false;
+
+    assign(x, y, z, k);
+
+    return true;
+}
+
+void VoxelData::assign(int x, int y, int z, uint8_t k) {
+    if (!inside(x, y, z) || 63 <= z) return;
+
+    auto & c = chunk(x, y, z); auto i = offsetOf(x, y, z);
 
-    auto i = get_pos(x, y, z); auto iter = data.find(i);
-    return iter == data.end() ? set(i, defaultMaterial) : iter->second;
+    c.material[i] = k;
+    if (c.durability) c.durability[i] = initial(z);
 }
 
-uint64_t Object::gidx = 0;
+bool VoxelData::fill(int x1, int y1, int z1, int x2, int y2, int z2, PyObject * o) {
+    auto k = intern(o); if (k < 0) return false;
+
+    x1 = std::max(x1, 0); x2 = std::min(x2, 512);
+    y1 = std::max(y1, 0); y2 = std::min(y2, 512);
+    z1 = std::max(z1, 0); z2 = std::min(z2, 63); // ignore z = 63
+
+    // Rows are written by runs lying within a single chunk.
+    for (int z = z1; z < z2; z++)
+        for (int y = y1; y < y2; y++)
+            for (int x = x1, n; x < x2; x += n) {
+                n = std::min(x2, (x | (chunkSize - 1)) + 1) - x;
+
+                auto & c = chunk(x, y, z); auto i = offsetOf(x, y, z);
+
+                std::fill_n(c.material.begin() + i, n, k);
+                if (c.durability) std::fill_n(c.durability.get() + i, n, initial(z));
+            }
+
+    return true;
+}
+
+Material * VoxelData::material(int x, int y, int z) const {
+    if (63 <= z) return reinterpret_cast<Material *>(static_cast<PyObject *>(water));
+
+    uint8_t k = 0;
+
+    if (inside(x, y, z))
+        if (auto & c = chunks[chunkOf(x, y, z)]) k = c->material[offsetOf(x, y, z)];
+
+    auto o = k == 0 ? static_cast<PyObject *>(defaultMaterial) : static_cast<PyObject *>(table[k]);
+    return reinterpret_cast<Material *>(o);
+}
+
+double VoxelData::durability(int x, int y, int z) const {
+    if (63 <= z || !inside(x, y, z)) return std::numeric_limits<double>::infinity();
+
+    auto & c = chunks[chunkOf(x, y, z)];
+    return c && c->durability ? c->durability[offsetOf(x, y, z)] : initial(z);
+}
+
+bool VoxelData::damage(int x, int y, int z, double delta) {
+    if (63 <= z || !inside(x, y, z)) return false;
+
+    auto & c = chunk(x, y, z);
+
+    if (c.durability == nullptr) {
+        c.durability = std::make_unique<float[]>(chunkVolume); damaged++;
+
+        auto z₀ = z & ~(chunkSize - 1);
+
+        for (int i = 0; i < chunkVolume; i++)
+            c.durability[i] = initial(z₀ + (i >> (2 * chunkBits)));
+    }
+
+    auto & d = c.durability[offsetOf(x, y, z)]; d -= delta;
+    return d <= 0;
+}
+
+void VoxelData::erase(int x, int y, int z) {
+    if (!inside(x, y, z)) return;
+
+    if (auto & c = chunks[chunkOf(x, y, z)]) {
+        auto i = offsetOf(x, y, z);
+
+        c->material[i] = 0;
+        if (c->durability) c->durability[i] = initial(z);
+    }
+}
+
+void VoxelData::apply(const MapData * M, const std::unordered_map<uint32_t, uint8_t> & palette) {
+    // Neighbouring voxels mostly share the color, so the last lookup is remembered.
+    uint32_t last = UINT32_MAX; uint8_t k = 0;
+
+    for (auto & [i, color] : M->colors) {
+        int x, y, z; get_xyz(i, &x, &y, &z);
+        if (63 <= z) continue;
+
+        if (uint32_t(color & 0xFFFFFF) != last) {
+            last = color & 0xFFFFFF;
+
+            auto iter = palette.find(last);
+            k = iter == palette.end() ? 0 : iter->second;
+        }
+
+        auto & c = chunk(x, y, z); auto j = offsetOf(x, y, z);
+
+        c.material[j] = k;
+        if (c.durability) c.durability[j] = initial(z);
+    }
+}
+
+void VoxelData::clear() {
+    for (auto & c : chunks) c.reset();
+
+    allocated = damaged = 0;
+
+    table.resize(1); index.clear();
+
+    defaultMaterial.retain(nullptr); water.retain(nullptr);
+}
+
+size_t ObjectStore::push(PyObject * o, const uint32_t m, const int i, const Vector3d & r, const Vector3d & v, const double t) {
+    uint32_t id;
+
+    if (_free.empty()) {
+        id = _slot.size();
+        _slot.push_back(nil);
+        _generation.push_back(0);
+    } else {
+        id = _free.back();
+        _free.pop_back();
+    }
+
+    auto k = size(); _slot[id] = k;
+
+    Py_INCREF(o);
+
+    object.push_back(o);
+    index.push_back(_total++);
+    handle.push_back(uint64_t(_generation[id]) << 32 | id);
+    model.push_back(m);
+    hooks.push_back(0);
+    thrower.push_back(i);
+    timestamp.push_back(t);
+    v0.push_back(v.abs());
+    mass.push_back(0);
+    ballistic.push_back(0);
+    area.push_back(0);
+    position.push_back(r);
+    velocity.push_back(v);
+
+    return k;
+}
+
+template<typename T> inline void swapRemove(std::vector<T> & xs, size_t i)
+{ if (i + 1 < xs.size()) xs[i] = std::move(xs.back()); xs.pop_back(); }
+
+void ObjectStore::erase(size_t i) {
+    uint32_t id = handle[i] & nil;
+
+    _slot[id] = nil; _generation[id]++; _free.push_back(id);
+
+    if (i + 1 < size()) _slot[handle.back() & nil] = i;
+
+    Py_DECREF(object[i]);
+
+    swapRemove(object,    i);
+    swapRemove(index,     i);
+    swapRemove(handle,    i);
+    swapRemove(model,     i);
+    swapRemove(hooks,     i);
+    swapRemove(thrower,   i);
+    swapRemove(timestamp, i);
+    swapRemove(v0,        i);
+    swapRemove(mass,      i);
+    swapRemove(ballistic, i);
+    swapRemove(area,      i);
+    swapRemove(position,  i);
+    swapRemove(velocity,  i);
+}
+
+void ObjectStore::clear() {
+    while (!empty()) erase(size() - 1);
+}
+
+int64_t ObjectStore::find(uint64_t h) const {
+    uint32_t id = h & nil, gen = h >> 32;
+
+    if (id >= _slot.size() || _generation[id] != gen)
+        return -1;
+
+    return _slot[id] == nil ? -1 : _slot[id];
+}
+
+void ObjectStore::reserve(size_t n) {
+    object.reserve(n);
+    index.reserve(n);
+    handle.reserve(n);
+    model.reserve(n);
+    hooks.reserve(n);
+    thrower.reserve(n);
+    timestamp.reserve(n);
+    v0.reserve(n);
+    mass.reserve(n);
+    ballistic.reserve(n);
+    area.reserve(n);
+    position.reserve(n);
+    velocity.reserve(n);
+}
+
+void PlayerGrid::build(const std::vector<Player> & players) {
+    const size_t N = players.size();
+
+    bounds.resize(N); cell.clear();
+    std::fill(count.begin(), count.end(), 0);
+
+    for (size_t k = 0; k < N; k++) {
+        auto & b = bounds[k]; b.cx = b.cy = -1;
+
+        if (!players[k].valid()) continue;
+
+        // `Player::intersect` never hits anything for such players anyway.
+        auto r = players[k].position();
+        if (!std::isfinite(r.x) || !std::isfinite(r.y) || !std::isfinite(r.z)) continue;
+
+        b.x1 = r.x - radius; b.y1 = r.y - radius; b.z1 = r.z - below;
+        b.x2 = r.x + radius; b.y2 = r.y + radius; b.z2 = r.z + above;
+        b.cx = clamp(b.x1);  b.cy = clamp(b.y1);
+    }
+
+    auto each = [&](auto && f) {
+        for (size_t k = 0; k < N; k++) {
+            auto & b = bounds[k]; if (b.cx < 0) continue;
+
+            for (int cy = b.cy; cy <= clamp(b.y2); cy++)
+                for (int cx = b.cx; cx <= clamp(b.x2); cx++)
+                    f(cy * side + cx, k);
+        }
+    };
+
+    each([&](int c, size_t) { count[c]++; });
+
+    start[0] = 0;
+    for (int c = 0; c < side * side; c++) start[c + 1] = start[c] + count[c];
+
+    // `count` is reused as the fill cursor of every cell.
+    cell.resize(start[side * side]);
+    each([&](int c, size_t k) { cell[start[c] + --count[c]] = k; });
+}
+
+void Occupancy::build(MapData * M) {
+    std::fill(level1.begin(), level1.end(), 0);
+    std::fill(level2.begin(), level2.end(), 0);
+
+    for (int z = 0; z < 64; z++)
+        for (int y = 0; y < 512; y++)
+            for (int x = 0; x < 512; x++)
+                if (M->geometry[get_pos(x, y, z)]) mark(x, y, z);
+}
+
+void Occupancy::update(MapData * M, int x, int y, int z) {
+    int bx = x >> 3, by = y >> 3, bz = z >> 3; if (!inside(bx, by, bz)) return;
+
+    auto & b = level1[index1(bx, by, bz)]; if (!b) return;
+
+    for (int k = 8 * bz; k < 8 * bz + 8; k++)
+        for (int j = 8 * by; j < 8 * by + 8; j++)
+            for (int i = 8 * bx; i < 8 * bx + 8; i++)
+                if (M->geometry[get_pos(i, j, k)]) return;
+
+    b = 0; level2[index2(bx, by)]--;
+}
 
 void Engine::clear() {
     temperature = 0;
@@ -43,12 +324,22 @@ void Engine::clear() {
 
     update();
 
-    _lag = _peak = 0.0;
+    _lag = _peak = 0.0; stats.reset();
 
     objects.clear();
-    Object::flush();
+    objects.flush();
+
+    discard();
+
+    vxlData.clear(); palette.retain(nullptr);
+
+    recorder.reset(); // a log covers a single map
+}
 
-    vxlData.clear();
+void Engine::apply(const std::unordered_map<uint32_t, uint8_t> & palette) {
+    auto state = PyEval_SaveThread();
+    vxlData.apply(map, palette);
+    PyEval_RestoreThread(state);
 }
 
 void Engine::update() {
@@ -101,26 +392,325 @@ void Engine::step(const double t1, const double t2) {
 
     const auto T1 = steady_clock::now();
 
-    for (auto it = objects.begin(); it != objects.end(); next(t1, t2, it));
+    grid.build(players); stepping = true;
+
+    advance(t1, t2);
+
+    stepping = false; _steps++;
 
     const auto T2 = steady_clock::now();
 
+    stats.steps.record(duration_cast<nanoseconds>(T2 - T1).count());
+
     auto diff = duration_cast<microseconds>(T2 - T1).count();
     _lag  = (_lag + diff) / 2;
     _peak = std::max(_peak, double(diff));
 }
 
-void Engine::next(double t1, const double t2, ObjectIterator & it) {
+void Engine::advance(const double t1, const double t2) {
+    constexpr size_t chunkSize = 16;
+
+    const size_t N = objects.size(), K = (N + chunkSize - 1) / chunkSize;
+
+    if (buffers.size() < K) buffers.resize(K);
+    survived.assign(N, 0);
+
+    auto chunk = [&](size_t k) {
+        auto & events = buffers[k]; events.clear();
+
+        for (size_t i = k * chunkSize; i < std::min(N, (k + 1) * chunkSize); i++)
+            survived[i] = next(t1, t2, i, events);
+    };
+
+    // Integration never touches Python objects: everything that requires the GIL
+    // is recorded into the per-chunk buffers and dispatched below. Without workers the chunks
+    // go the same way, so that the map is not changed in the middle of the step and the result
+    // does not depend on the number of workers.
+    if (pool.size() > 0) {
+        auto state = PyEval_SaveThread();
+        pool.run(K, chunk);
+        PyEval_RestoreThread(state);
+    } else for (size_t k = 0; k < K; k++) chunk(k);
+
+    // Chunks are contiguous ranges of objects, so events are dispatched
+    // ordered by the object index and then by time.
+    int64_t killed = -1;
+
+    for (size_t k = 0; k < K; k++)
+        dispatch(buffers[k], killed);
+
+    // Objects pushed by the callbacks are not in `survived` and stay untouched.
+    // Callbacks may also flush the objects.
+    for (size_t i = std::min(N, objects.size()); i-- > 0;)
+        if (!survived[i]) objects.erase(i);
+}
+
+void Engine::dispatch(const Events & events, int64_t & killed) {
+    for (auto & e : events) {
+        // Once a callback stopped the object, the rest of its path is discarded,
+        // along with the damage that follows the hit.
+        if (e.object == killed || e.object >= objects.size()) continue;
+
+        if (e.kind == EventKind::damage) {
+            if (vxlData.damage(e.X, e.Y, e.Z, e.value))
+                timed([&]() { return onDestroy(e.thrower, e.X, e.Y, e.Z); });
+
+            continue;
+        }
+
+        if (emit(e)) {
+            if (survived[e.object]) stats.stopped++;
+            killed = e.object; survived[e.object] = false;
+        }
+    }
+}
+
+bool Engine::emit(const Event & e) {
+    auto i = e.object; auto & r = e.position, & v = e.velocity;
+
+    if (e.kind == EventKind::trace && onTrace == nullptr) return false;
+
+    if (batched && !(objects.hooks[i] & (1 << uint8_t(e.kind)))) {
+        auto o = objects.object[i];
+
+        auto [iter, inserted] = cartridgeIndex.try_emplace(o, cartridges.size());
+        if (inserted) { Py_INCREF(o); cartridges.push_back(o); }
+
+        records.push_back({
+            .handle = objects.handle[i], .index = objects.index[i],
+            .x = r.x, .y = r.y, .z = r.z, .vx = v.x, .vy = v.y, .vz = v.z,
+            .value = e.value, .area = e.area, .X = e.X, .Y = e.Y, .Z = e.Z,
+            .thrower = e.thrower, .target = e.target, .cartridge = iter->second,
+            .kind = uint8_t(e.kind), .limb = int8_t(e.limb), .origin = e.origin, .padding = {}
+        });
+
+        return e.kind == EventKind::player && size_t(e.target) < players.size() && players[e.target].valid();
+    }
+
+    switch (e.kind) {
+        case EventKind::trace: {
+            timed([&]() { return onTrace(objects.index[i], r.x, r.y, r.z, e.value, e.origin); });
+            return false;
+        }
+
+        case EventKind::block: return Py_True == timed([&]() { return onBlockHit(
+            objects.object[i], r.x, r.y, r.z, v.x, v.y, v.z, e.X, e.Y, e.Z,
+            e.thrower, e.value, e.area
+        ); });
+
+        case EventKind::player: return Py_True == timed([&]() { return onPlayerHit(
+            objects.object[i], r.x, r.y, r.z, v.x, v.y, v.z, e.X, e.Y, e.Z,
+            e.thrower, e.value, e.area, e.target, e.limb
+        ); });
+
+        default: return false;
+    }
+}
+
+// Missing attribute is not an error here.
+static bool callable(PyObject * o, const char * attr) {
+    PyOwnedRef f(o, attr); if (f == nullptr) { PyErr_Clear(); return false; }
+    return PyCallable_Check(f);
+}
+
+int64_t Engine::enroll(PyObject * o) {
+    if (auto iter = registryIndex.find(o); iter != registryIndex.end())
+        return iter->second;
+
+    Cartridge c;
+
+    c.model     = PyGetAttr<uint32_t>(o, "model");
+    c.mass      = PyGetAttr<double>(o, "effmass");
+    c.ballistic = PyGetAttr<double>(o, "ballistic");
+    c.area      = PyGetAttr<double>(o, "area");
+    c.muzzle    = PyGetAttr<double>(o, "muzzle");
+    c.deviation = PyGetAttr<double>(o, "deviation");
+    c.grouping  = PyGetAttr<double>(o, "grouping");
+
+    if (PyErr_Occurred()) return -1;
+
+    c.hooks = callable(o, "on_block_hit")  << uint8_t(EventKind::block)
+            | callable(o, "on_player_hit") << uint8_t(EventKind::player);
+
+    c.object.retain(o);
+
+    auto id = registry.size();
+
+    registry.push_back(std::move(c));
+    registryIndex.emplace(o, id);
+
+    return id;
+}
+
+size_t Engine::add(uint32_t id, int thrower, const Vector3d & r, const Vector3d & v, double t) {
+    auto & c = registry[id]; auto & o = objects;
+
+    auto k = o.push(c.object, c.model, thrower, r, v, t);
+    o.mass[k] = c.mass; o.ballistic[k] = c.ballistic; o.area[k] = c.area; o.hooks[k] = c.hooks;
+
+    trace(k, r, 1.0, true);
+
+    return k;
+}
+
+void Engine::fire(uint32_t id, int thrower, const Vector3d & r, const Vector3d & n, const Vector3d & u, double t, size_t pellets) {
+    // `add` may call back into Python, so nothing is referenced in `registry` across it.
+    const auto & c = registry[id]; const auto μ = c.muzzle, σ = c.muzzle * c.deviation, ε = c.grouping;
+
+    for (size_t k = 0; k < pellets; k++) {
+        // Keyed by the index of the object that is about to be added.
+        Philox rng(_seed, Philox::fire, objects.total(), _steps);
+        add(id, thrower, r, u + cone(n * (μ + σ * rng.gauss()), ε, rng), t);
+    }
+}
+
+void Engine::remove(size_t i) {
+    if (stepping) objects.timestamp[i] = -INFINITY;
+    else objects.erase(i);
+}
+
+void Engine::discard() {
+    for (auto o : cartridges) Py_DECREF(o);
+
+    records.clear(); cartridges.clear(); cartridgeIndex.clear();
+}
+
+void Engine::blockHit(Events & events, size_t i, const Vector3d & r, const Vector3d & v, int X, int Y, int Z, double E) {
+    events.push_back({
+        .kind = EventKind::block, .origin = false, .object = uint32_t(i),
+        .thrower = objects.thrower[i], .target = -1, .limb = -1, .X = X, .Y = Y, .Z = Z,
+        .value = E, .area = objects.area[i], .position = r, .velocity = v
+    });
+}
+
+void Engine::playerHit(Events & events, size_t i, const Vector3d & r, const Vector3d & v, int X, int Y, int Z, double E, int target, int limb) {
+    events.push_back({
+        .kind = EventKind::player, .origin = false, .object = uint32_t(i),
+        .thrower = objects.thrower[i], .target = target, .limb = limb, .X = X, .Y = Y, .Z = Z,
+        .value = E, .area = objects.area[i], .position = r, .velocity = v
+    });
+}
+
+void Engine::damage(Events & events, size_t i, int X, int Y, int Z, double value) {
+    events.push_back({
+        .kind = EventKind::damage, .origin = false, .object = uint32_t(i),
+        .thrower = objects.thrower[i], .target = -1, .limb = -1, .X = X, .Y = Y, .Z = Z,
+        .value = value, .area = objects.area[i], .position = {}, .velocity = {}
+    });
+}
+
+void Engine::trace(Events & events, size_t i, const Vector3d & r, double value) {
+    if (onTrace == nullptr) return;
+
+    events.push_back({
+        .kind = EventKind::trace, .origin = false, .object = uint32_t(i),
+        .thrower = objects.thrower[i], .target = -1, .limb = -1, .X = 0, .Y = 0, .Z = 0,
+        .value = value, .area = objects.area[i], .position = r, .velocity = {}
+    });
+}
+
+Vector3d Engine::acceleration(const uint32_t model, const double ballistic, const double mass, const double area, const Vector3d & v) const {
+    using namespace Fundamentals;
+
+    auto m  = mass;
+    auto u  = wind - v;
+    auto CD = drag(model, ballistic, u.abs() / _mach);
+    auto F  = g<double> * m + u * (0.5 * _density * u.abs() * CD * area);
+
+    return F / m;
+}
+
+double Engine::integrate(const uint32_t model, const double ballistic, const double mass, const double area,
+                         const Vector3d & v, const double h, double & hint, Vector3d & dr, Vector3d & dv) const {
+    using namespace Fundamentals;
+
+    auto a = [&](const Vector3d & u) { return acceleration(model, ballistic, mass, area, u); };
+
+    // Position is integrated in blocks and velocity in m/s, acceleration depends only on velocity.
+    if (integrator == Integrator::rk4) {
+        auto k1 = a(v), v2 = v + k1 * (h / 2);
+        auto k2 = a(v2), v3 = v + k2 * (h / 2);
+        auto k3 = a(v3), v4 = v + k3 * h;
+        auto k4 = a(v4);
+
+        dr = (v + v2 * 2 + v3 * 2 + v4) * (m2b<double> * h / 6);
+        dv = (k1 + k2 * 2 + k3 * 2 + k4) * (h / 6);
+
+        return h;
+    }
+
+    // https://en.wikipedia.org/wiki/Dormand%E2%80%93Prince_method
+    constexpr double A[7][6] = {
+        {},
+        {1.0 / 5},
+        {3.0 / 40, 9.0 / 40},
+        {44.0 / 45, -56.0 / 15, 32.0 / 9},
+        {19372.0 / 6561, -25360.0 / 2187, 64448.0 / 6561, -212.0 / 729},
+        {9017.0 / 3168, -355.0 / 33, 46732.0 / 5247, 49.0 / 176, -5103.0 / 18656},
+        {35.0 / 384, 0, 500.0 / 1113, 125.0 / 192, -2187.0 / 6784, 11.0 / 84},
+    };
+
+    constexpr double B[7] = {35.0 / 384, 0, 500.0 / 1113, 125.0 / 192, -2187.0 / 6784, 11.0 / 84, 0};
+    constexpr double E[7] = {
+        B[0] - 5179.0 / 57600, B[1], B[2] - 7571.0 / 16695, B[3] - 393.0 / 640,
+        B[4] + 92097.0 / 339200, B[5] - 187.0 / 2100, B[6] - 1.0 / 40
+    };
+
+    // Tolerances on the local error of position (block) and velocity (relative).
+    constexpr double εr = 1e-4, εv = 1e-5;
+
+    Vector3d V[7], K[7];
+
+    for (double τ = std::min(h, hint);;) {
+        for (int s = 0; s < 7; s++) {
+            V[s] = v;
+            for (int j = 0; j < s; j++) V[s] += K[j] * (τ * A[s][j]);
+
+            K[s] = a(V[s]);
+        }
+
+        Vector3d δr, δv; dr = dv = Vector3d();
+
+        for (int s = 0; s < 7; s++) {
+            dr += V[s] * (m2b<double> * τ * B[s]); δr += V[s] * (m2b<double> * τ * E[s]);
+            dv += K[s] * (τ * B[s]);              δv += K[s] * (τ * E[s]);
+        }
+
+        auto err = std::max(δr.abs() / εr, δv.abs() / (εv * (1 + v.abs())));
+
+        // https://en.wikipedia.org/wiki/Adaptive_step_size
+        auto factor = std::clamp(0.9 * std::pow(err, -0.2), 0.2, 5.0);
+
+        if (!(err > 1) || τ < 1e-6) { hint = τ * factor; return τ; }
+
+        τ *= factor;
+    }
+}
+
+bool Engine::next(double t1, const double t2, size_t i, Events & events) {
     using namespace Fundamentals;
 
-    Object & o = *it;
+    auto & o = objects;
+
+    // Callbacks may push new objects, so no references into `objects` are held across them.
+    const auto model = o.model[i]; const auto v0 = o.v0[i];
+    const auto mass = o.mass[i], ballistic = o.ballistic[i], area = o.area[i];
+
+    // Energy reported to the callbacks is taken at the beginning of the step.
+    const auto energy = o.energy(i);
+
+    Material * M = nullptr;
+    Vector3d r(o.position[i]), v(o.velocity[i]), n;
 
-    Voxel * voxel = nullptr; Material * M = nullptr;
-    Vector3d r(o.position), v(o.velocity), n;
+    Philox rng(_seed, Philox::flight, o.index[i], _steps);
 
-    uint64_t N = 1;
+    uint64_t N = 1, tests = 0, ricochets = 0, penetrations = 0;
 
-    bool stuck = false;
+    bool stuck = false; double hint = INFINITY;
+
+    // Voxels of an empty brick are not looked up. Callbacks are only called in `dispatch`,
+    // so the map does not change while the object is integrated.
+    Occupancy::Region empty;
 
     while (t1 < t2 && N < 10000 && !stuck) {
         N++;
@@ -133,68 +723,93 @@ void Engine::next(double t1, const double t2, ObjectIterator & it) {
 
         auto state = Terminal::flying;
 
-        if (is_valid_position(X, Y, Z) && get_solid(X, Y, Z, map)) {
-            voxel = &vxlData.get(X, Y, Z); M = voxel->material();
+        if (!empty.contains(X, Y, Z)) empty = occupancy.region(X, Y, Z);
+
+        if (!empty.contains(X, Y, Z) && is_valid_position(X, Y, Z) && get_solid(X, Y, Z, map)) {
+            M = vxlData.material(X, Y, Z);
 
             auto θ = acos(-(v, n) / v.abs());
 
-            state = M->deflecting <= θ && random<double>() < M->ricochet ? Terminal::ricochet
+            state = M->deflecting <= θ && rng.uniform() < M->ricochet ? Terminal::ricochet
                                                                          : Terminal::penetration;
 
             if (state != Terminal::flying) {
                 constexpr double hitEffectThresholdEnergy = 5.0;
 
-                trace(o.index(), r, v.abs() / o.v0(), false);
+                trace(events, i, r, v.abs() / v0);
 
-                if (hitEffectThresholdEnergy <= o.energy())
-                    stuck = Py_True == onBlockHit(
-                        o.object(), r.x, r.y, r.z, v.x, v.y, v.z, X, Y, Z,
-                        o.thrower(), o.energy(), o.area
-                    );
+                if (hitEffectThresholdEnergy <= energy)
+                    blockHit(events, i, r, v, X, Y, Z, energy);
             }
 
-            if (state == Terminal::ricochet) v -= n * (2 * (v, n));
+            if (state == Terminal::ricochet) { v -= n * (2 * (v, n)); ricochets++; }
 
-            if (state == Terminal::penetration) v = cone(v, 0.05);
+            if (state == Terminal::penetration) { v = cone(v, 0.05, rng); penetrations++; }
         }
 
         // `dr` depends only on direction, not the absolute value of `v`
         // That’s why all direction changes need to be made before this point.
-        double x = v.x > 0 ? std::floor(r.x) + 1 : std::ceil(r.x) - 1;
-        double y = v.y > 0 ? std::floor(r.y) + 1 : std::ceil(r.y) - 1;
-        double z = v.z > 0 ? std::floor(r.z) + 1 : std::ceil(r.z) - 1;
+        double dt; Vector3d dr, dv; bool integrated = false;
 
-        double dx = x - r.x, dy = y - r.y, dz = z - r.z;
+        // Inside of an empty brick higher-order integrators take long steps. Euler keeps to the voxel boundaries,
+        // since its error grows with the step: straight to the boundary of a 64³ brick, a 0.5 s shot lands 2 blocks off.
+        if (double τ; integrator != Integrator::euler && state == Terminal::flying && (τ = occupancy.empty(r, v, X, Y, Z, n)) > 0) {
+            dt = std::min(τ / m2b<double>, t2 - t1);
 
-        if (std::abs(dx) < 1e-20) dx = sign(v.x);
-        if (std::abs(dy) < 1e-20) dy = sign(v.y);
-        if (std::abs(dz) < 1e-20) dz = sign(v.z);
+            // Higher-order integrators follow a curved path, so they stop `margin` short of the boundary
+            // and leave crossing it to the straight step above. The path stays within `margin`
+            // from the straight line while the displacement due to the acceleration (a h²/2) is smaller.
+            constexpr double margin = 1.0; // block
 
-        double idt; std::tie(idt, n) = max(
-            [](auto & w1, auto & w2){ return w1.first < w2.first; },
-            std::pair(m2b<double> * v.x / dx, Vector3d(-sign(v.x), 0, 0)),
-            std::pair(m2b<double> * v.y / dy, Vector3d(0, -sign(v.y), 0)),
-            std::pair(m2b<double> * v.z / dz, Vector3d(0, 0, -sign(v.z)))
-        );
+            Vector3d m; auto a = acceleration(model, ballistic, mass, area, v).abs();
 
-        double dt = std::min(idt < 1e-9 ? INFINITY : 1 / idt, t2 - t1);
-        auto dr = v * (m2b<double> * dt);
+            auto h = std::min({
+                occupancy.empty(r, v, X, Y, Z, m, margin) / m2b<double>,
+                std::sqrt(margin / (a * m2b<double>)), t2 - t1
+            });
+
+            if (h > 0) {
+                dt = integrate(model, ballistic, mass, area, v, h, hint, dr, dv);
+                integrated = true; n = Vector3d();
+            }
+        } else {
+            double x = v.x > 0 ? std::floor(r.x) + 1 : std::ceil(r.x) - 1;
+            double y = v.y > 0 ? std::floor(r.y) + 1 : std::ceil(r.y) - 1;
+            double z = v.z > 0 ? std::floor(r.z) + 1 : std::ceil(r.z) - 1;
+
+            double dx = x - r.x, dy = y - r.y, dz = z - r.z;
+
+            if (std::abs(dx) < 1e-20) dx = sign(v.x);
+            if (std::abs(dy) < 1e-20) dy = sign(v.y);
+            if (std::abs(dz) < 1e-20) dz = sign(v.z);
+
+            double idt; std::tie(idt, n) = max(
+                [](auto & w1, auto & w2){ return w1.first < w2.first; },
+                std::pair(m2b<double> * v.x / dx, Vector3d(-sign(v.x), 0, 0)),
+                std::pair(m2b<double> * v.y / dy, Vector3d(0, -sign(v.y), 0)),
+                std::pair(m2b<double> * v.z / dz, Vector3d(0, 0, -sign(v.z)))
+            );
+
+            dt = std::min(idt < 1e-9 ? INFINITY : 1 / idt, t2 - t1);
+        }
+
+        if (!integrated) dr = v * (m2b<double> * dt);
 
         if (state == Terminal::ricochet) v *= 0.6;
 
         if (state == Terminal::penetration) {
             // http://panoptesv.com/RPGs/Equipment/Weapons/Projectile_physics.php
             auto depth = dr.abs() * b2m<double>;
-            auto E₀    = 0.5 * o.mass * v.norm();
+            auto E₀    = 0.5 * mass * v.norm();
             auto drag  = 1;
-            auto xc    = o.mass / (drag * M->density * o.area);
-            auto xmax  = xc * log(1 + (E₀ * drag * M->density) / (M->strength * o.mass));
+            auto xc    = mass / (drag * M->density * area);
+            auto xmax  = xc * log(1 + (E₀ * drag * M->density) / (M->strength * mass));
 
             double ΔE = 0; // energy that will be absorbed by block
 
             if (xmax > depth) {
-                auto ε = exp(-drag * o.area * M->density * depth / o.mass);
-                auto E = E₀ * ε - M->strength * o.mass * (1 - ε) / (drag * M->density);
+                auto ε = exp(-drag * area * M->density * depth / mass);
+                auto E = E₀ * ε - M->strength * mass * (1 - ε) / (drag * M->density);
                 ΔE = E₀ - E;
 
                 v *= std::sqrt(E / E₀);
@@ -203,52 +818,54 @@ void Engine::next(double t1, const double t2, ObjectIterator & it) {
                 v.x = v.y = v.z = 0.0;
             }
 
-            if (voxel->isub(ΔE * (M->durability / M->absorption)))
-                onDestroy(o.thrower(), X, Y, Z);
+            damage(events, i, X, Y, Z, ΔE * (M->durability / M->absorption));
         }
 
         Ray<double> ray(r, dr); Arc<double> arc{}; int target = -1;
 
-        for (size_t i = 0; i < players.size(); i++) {
-            auto & player = players[i];
-            if (!player.valid()) continue;
+        // Callbacks may despawn players or resize `players` after the grid was built.
+        grid.query(r, r + dr, [&](size_t k) {
+            if (k >= players.size() || !players[k].valid()) return;
 
-            auto retval = player.intersect(ray);
-            if (retval < arc) { arc = retval; target = i; }
-        }
+            tests++; auto retval = players[k].intersect(ray);
+            if (retval < arc) { arc = retval; target = k; }
+        });
 
         if (0 <= target) {
             auto w = arc.begin(ray);
 
-            stuck = Py_True == onPlayerHit(
-                o.object(), w.x, w.y, w.z, v.x, v.y, v.z, X, Y, Z,
-                o.thrower(), o.energy(), o.area, target, arc.index
-            );
+            // The trace goes first, so that stopping the object in `dispatch` does not discard it.
+            trace(events, i, w, v.abs() / v0);
 
-            trace(o.index(), w, v.abs() / o.v0(), false);
+            playerHit(events, i, w, v, X, Y, Z, energy, target, arc.index);
         }
 
-        auto m  = o.mass;
-        auto u  = wind - v;
-        auto CD = drag(o.model(), o.ballistic, u.abs() / _mach);
-        auto F  = g<double> * m + u * (0.5 * _density * u.abs() * CD * o.area);
-
-        auto dv = F * (dt / m);
+        if (!integrated) dv = acceleration(model, ballistic, mass, area, v) * dt;
 
         t1 += dt; r += dr; v += dv;
     }
 
-    o.position.set(r); o.velocity.set(v);
+    o.position[i].set(r); o.velocity[i].set(v);
+
+    stats.substeps.fetch_add(N - 1, std::memory_order_relaxed);
+    stats.tests.fetch_add(tests, std::memory_order_relaxed);
+    stats.ricochets.fetch_add(ricochets, std::memory_order_relaxed);
+    stats.penetrations.fetch_add(penetrations, std::memory_order_relaxed);
+
+    if (!stuck) trace(events, i, r, v.abs() / v0);
 
-    if (!stuck) trace(o.index(), r, v.abs() / o.v0(), false);
+    //if (t2 - o.timestamp[i] > 10) printf("%ld: time out\n", o.index[i]);
+    //if (v.abs() <= 1e-3) printf("%ld: speed too low (%f m/s)\n", o.index[i], v.abs());
+    //if (!is_valid_position(r.x, r.y, r.z)) printf("%ld: out of map (%f, %f, %f)\n", o.index[i], r.x, r.y, r.z);
 
-    //if (t2 - o.timestamp() > 10) printf("%ld: time out\n", o.index());
-    //if (o.velocity.abs() <= 1e-3) printf("%ld: speed too low (%f m/s)\n", o.index(), o.velocity.abs());
-    //if (!is_valid_position(o.position.x, o.position.y, o.position.z)) printf("%ld: out of map (%f, %f, %f)\n", o.index, o.position.x, o.position.y, o.position.z);
+    auto P = t2 - o.timestamp[i] <= 10;
+    auto Q = v.abs() > 1e-2;
+    auto R = is_valid_position(r.x, r.y, r.z);
 
-    auto P = t2 - o.timestamp() <= 10;
-    auto Q = o.velocity.abs() > 1e-2;
-    auto R = is_valid_position(o.position.x, o.position.y, o.position.z);
+    if (stuck)   stats.stopped.fetch_add(1, std::memory_order_relaxed);
+    else if (!R) stats.outside.fetch_add(1, std::memory_order_relaxed);
+    else if (!Q) stats.slow.fetch_add(1, std::memory_order_relaxed);
+    else if (!P) stats.timeout.fetch_add(1, std::memory_order_relaxed);
 
-    if (P && Q && R && !stuck) ++it; else it = objects.erase(it);
+    return P && Q && R && !stuck;
 }
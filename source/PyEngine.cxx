@@ -39,6 +39,28 @@ struct PyEngine {
 
 static_assert(std::is_standard_layout_v<PyEngine> == true);
 
+static void PyEngineRecordCartridge(Engine * engine, uint32_t id) {
+    auto R = engine->recorder.get(); auto & c = engine->registry[id];
+
+    if (R->fresh(id))
+        R->put(Recorder::cartridge, id, c.model, c.mass, c.ballistic, c.area, c.muzzle, c.deviation, c.grouping);
+}
+
+static void PyEngineRecordApply(Engine * engine, PyObject * dict) {
+    auto R = engine->recorder.get();
+
+    Py_ssize_t i = 0; PyObject * k, * v; uint32_t n = 0;
+
+    while (PyDict_Next(dict, &i, &k, &v))
+        if (PyObject_TypeCheck(v, &MaterialType)) { R->intern(v); n++; }
+
+    R->put(Recorder::apply, n); i = 0;
+
+    while (PyDict_Next(dict, &i, &k, &v))
+        if (PyObject_TypeCheck(v, &MaterialType))
+            R->put(PyDecode<uint32_t>(k), R->intern(v));
+}
+
 static PyEngine * PyEngineNew(PyTypeObject * type, PyObject * w, PyObject * kw) {
     auto self = (PyEngine *) type->tp_alloc(type, 0); RETZIFZ(self);
 
@@ -62,6 +84,9 @@ static int PyEngineClear(PyEngine * self) {
     if (self->ref == nullptr) return 0;
 
     self->ref->clear();
+    self->ref->workers(0);
+
+    self->ref->release();
 
     self->ref->map = nullptr;
 
@@ -83,8 +108,17 @@ static void PyEngineDealloc(PyEngine * self) {
 static int PyEngineTraverse(PyEngine * self, visitproc visit, void * arg) {
     Py_VISIT(self->ref->protocol);
 
-    for (auto & o : self->ref->objects)
-        Py_VISIT(o.object());
+    for (auto o : self->ref->objects.object)
+        Py_VISIT(o);
+
+    for (auto o : self->ref->cartridges)
+        Py_VISIT(o);
+
+    for (auto & c : self->ref->registry)
+        Py_VISIT(c.object);
+
+    if (self->ref->palette != nullptr)
+        Py_VISIT(self->ref->palette);
 
     if (self->ref->onTrace != nullptr)
         Py_VISIT(self->ref->onTrace);
@@ -107,6 +141,9 @@ static PyObject * PyEngineLag(PyEngine * self, void *)
 static PyObject * PyEnginePeak(PyEngine * self, void *)
 { return PyEncode<double>(self->ref->peak()); }
 
+static PyObject * PyEngineSubsteps(PyEngine * self, void *)
+{ return PyEncode<unsigned long long>(self->ref->stats.substeps); }
+
 static PyObject * PyEngineAlive(PyEngine * self, void *)
 { return PyEncode<size_t>(self->ref->alive()); }
 
@@ -154,6 +191,11 @@ static PyObject * PyEngineUpdate(PyEngine * self, PyObject * E) {
 
     self->ref->update();
 
+    if (auto R = self->ref->recorder.get()) {
+        auto & e = *self->ref;
+        R->put(Recorder::update, e.temperature, e.pressure, e.humidity, e.wind.x, e.wind.y, e.wind.z);
+    }
+
     Py_RETURN_NONE;
 }
 
@@ -166,25 +208,101 @@ static PyObject * PyEngineAdd(PyEngine * self, PyObject * w) {
     auto r = PyDecode<Vector3d>(ro); RETZIFERR();
     auto v = PyDecode<Vector3d>(vo); RETZIFERR();
 
-    auto i = PyGetAttr<uint32_t>(po, "model");   RETZIFERR();
-    auto m = PyGetAttr<double>(po, "effmass");   RETZIFERR();
-    auto b = PyGetAttr<double>(po, "ballistic"); RETZIFERR();
-    auto A = PyGetAttr<double>(po, "area");      RETZIFERR();
+    auto id = self->ref->enroll(po); if (id < 0) return nullptr;
 
-    auto & o = self->ref->objects.emplace_back(po, i, player_id, r, v, timestamp);
-    o.mass = m; o.ballistic = b; o.area = A;
+    if (auto R = self->ref->recorder.get()) {
+        PyEngineRecordCartridge(self->ref, id);
+        R->put(Recorder::add, int32_t(player_id), r.x, r.y, r.z, v.x, v.y, v.z, timestamp, uint32_t(id));
+    }
 
-    self->ref->trace(o.index(), o.position, 1.0, true);
+    auto k = self->ref->add(id, player_id, r, v, timestamp);
+
+    return PyEncode<unsigned long long>(self->ref->objects.handle[k]);
+}
+
+static PyObject * PyEngineRegister(PyEngine * self, PyObject * o) {
+    auto id = self->ref->enroll(o); if (id < 0) return nullptr;
+
+    return PyEncode<long long>(id);
+}
+
+static PyObject * PyEngineFire(PyEngine * self, PyObject * w) {
+    int player_id; PyObject * ro, * no, * uo; double timestamp; unsigned int id; Py_ssize_t pellets;
+
+    if (!PyArg_ParseTuple(w, "iOOOdIn", &player_id, &ro, &no, &uo, &timestamp, &id, &pellets))
+        return nullptr;
+
+    auto r = PyDecode<Vector3d>(ro); RETZIFERR();
+    auto n = PyDecode<Vector3d>(no); RETZIFERR();
+    auto u = PyDecode<Vector3d>(uo); RETZIFERR();
+
+    if (id >= self->ref->registry.size()) {
+        PyErr_SetString(PyExc_ValueError, "unknown cartridge");
+        return nullptr;
+    }
+
+    if (pellets < 0) {
+        PyErr_SetString(PyExc_ValueError, "must be non-negative");
+        return nullptr;
+    }
+
+    if (auto R = self->ref->recorder.get()) {
+        PyEngineRecordCartridge(self->ref, id);
+        R->put(Recorder::fire, int32_t(player_id), r.x, r.y, r.z, n.x, n.y, n.z, u.x, u.y, u.z, timestamp, uint32_t(id), uint32_t(pellets));
+    }
+
+    self->ref->fire(id, player_id, r, n, u, timestamp, pellets);
 
     Py_RETURN_NONE;
 }
 
+static PyObject * PyEngineRemove(PyEngine * self, PyObject * o) {
+    auto handle = PyLong_AsUnsignedLongLong(o); RETZIFERR();
+
+    if (auto R = self->ref->recorder.get())
+        R->put(Recorder::remove, uint64_t(handle));
+
+    auto i = self->ref->objects.find(handle);
+    if (0 <= i) self->ref->remove(i);
+
+    return PyEncode<bool>(0 <= i);
+}
+
+static PyObject * PyEngineDrain(PyEngine * self, PyObject *) {
+    auto & records = self->ref->records; auto & cartridges = self->ref->cartridges;
+
+    PyOwnedRef data(PyBytes_FromStringAndSize(
+        reinterpret_cast<const char *>(records.data()), records.size() * sizeof(Record)
+    )); RETZIFZ(data);
+
+    PyOwnedRef table(PyTuple_New(cartridges.size())); RETZIFZ(table);
+
+    for (size_t k = 0; k < cartridges.size(); k++)
+        PyTuple_SET_ITEM(static_cast<PyObject *>(table), k, PyEncode<PyObject *>(cartridges[k]));
+
+    self->ref->discard();
+
+    return PyTuple_Pack(2, static_cast<PyObject *>(data), static_cast<PyObject *>(table));
+}
+
 static PyObject * PyEngineStep(PyEngine * self, PyObject * w) {
     double t1, t2;
 
     if (!PyArg_ParseTuple(w, "dd", &t1, &t2))
         return nullptr;
 
+    if (auto R = self->ref->recorder.get()) {
+        auto & players = self->ref->players;
+
+        uint32_t n = 0; for (auto & player : players) n += player.valid();
+        R->put(Recorder::step, t1, t2, n);
+
+        for (size_t k = 0; k < players.size(); k++) {
+            auto & P = players[k]; if (!P.valid()) continue;
+            R->put(int32_t(k), uint8_t(P.crouch()), P.p->x, P.p->y, P.p->z, P.f->x, P.f->y, P.f->z);
+        }
+    }
+
     self->ref->step(t1, t2);
 
     Py_RETURN_NONE;
@@ -196,11 +314,11 @@ static PyObject * PyEngineGetitem(PyEngine * self, PyObject * k) {
     if (!PyArg_ParseTuple(k, "iii", &x, &y, &z))
         return nullptr;
 
-    auto & voxel = self->ref->vxlData.get(x, y, z);
+    auto & vxlData = self->ref->vxlData;
 
     auto retval = PyTuple_New(2);
-    PyTuple_SET_ITEM(retval, 0, voxel.object.incref());
-    PyTuple_SET_ITEM(retval, 1, PyFloat_FromDouble(voxel.durability));
+    PyTuple_SET_ITEM(retval, 0, Py_XNewRef(reinterpret_cast<PyObject *>(vxlData.material(x, y, z))));
+    PyTuple_SET_ITEM(retval, 1, PyFloat_FromDouble(vxlData.durability(x, y, z)));
 
     return retval;
 }
@@ -211,30 +329,171 @@ static int PyEngineSetitem(PyEngine * self, PyObject * k, PyObject * o) {
     if (!PyArg_ParseTuple(k, "iii", &x, &y, &z))
         return -1;
 
-    if (o == nullptr)
+    auto R = self->ref->recorder.get();
+
+    if (o == nullptr) {
+        if (R) R->put(Recorder::erase, x, y, z);
+
         self->ref->vxlData.erase(x, y, z);
-    else {
+        self->ref->occupancy.update(self->ref->map, x, y, z);
+    } else {
         if (!PyObject_TypeCheck(o, &MaterialType)) {
             PyErr_SetString(PyExc_TypeError, "must be Material");
             return -1;
         }
 
-        self->ref->vxlData.set(x, y, z, o);
+        if (R) { auto m = R->intern(o); R->put(Recorder::set, x, y, z, m); }
+
+        if (!self->ref->vxlData.set(x, y, z, o)) {
+            PyErr_SetString(PyExc_ValueError, "too many materials");
+            return -1;
+        }
+
+        self->ref->occupancy.mark(x, y, z);
     }
 
     return 0;
 }
 
+// Reads either a buffer of int32 (x, y, z) triples (like `array('i')`) or a sequence of (x, y, z) tuples.
+static bool PyCoordinates(PyObject * o, std::vector<int32_t> & w) {
+    if (PyObject_CheckBuffer(o)) {
+        Py_buffer view; if (PyObject_GetBuffer(o, &view, PyBUF_FORMAT | PyBUF_C_CONTIGUOUS) < 0) return false;
+
+        const char * fmt = view.format ? view.format : "B"; if (*fmt == '@' || *fmt == '=') fmt++;
+
+        bool valid = view.itemsize == sizeof(int32_t) && (strcmp(fmt, "i") == 0 || strcmp(fmt, "l") == 0)
+                  && view.len % (3 * sizeof(int32_t)) == 0;
+
+        if (valid) {
+            w.resize(view.len / sizeof(int32_t));
+            memcpy(w.data(), view.buf, view.len);
+        } else PyErr_SetString(PyExc_TypeError, "must be a buffer of int32 triples");
+
+        PyBuffer_Release(&view); return valid;
+    }
+
+    PyOwnedRef seq(PySequence_Fast(o, "must be a buffer or a sequence of (x, y, z)")); if (seq == nullptr) return false;
+
+    auto n = PySequence_Fast_GET_SIZE(static_cast<PyObject *>(seq)); w.resize(3 * n);
+    auto items = PySequence_Fast_ITEMS(static_cast<PyObject *>(seq));
+
+    for (Py_ssize_t i = 0; i < n; i++)
+        if (!PyArg_ParseTuple(items[i], "iii", &w[3 * i], &w[3 * i + 1], &w[3 * i + 2]))
+            return false;
+
+    return true;
+}
+
+static PyObject * PyEngineAssign(PyEngine * self, PyObject * args) {
+    PyObject * coords, * o, * indices = nullptr;
+
+    if (!PyArg_ParseTuple(args, "OO|O", &coords, &o, &indices))
+        return nullptr;
+
+    std::vector<int32_t> w; if (!PyCoordinates(coords, w)) return nullptr;
+
+    size_t N = w.size() / 3;
+
+    // Either a single material or a sequence of them together with a buffer of indices into it.
+    PyOwnedRef seq(indices == nullptr ? PyTuple_Pack(1, o) : PySequence_Tuple(o)); RETZIFZ(seq);
+
+    auto n = PyTuple_GET_SIZE(static_cast<PyObject *>(seq));
+
+    for (Py_ssize_t i = 0; i < n; i++)
+        if (!PyObject_TypeCheck(PyTuple_GET_ITEM(static_cast<PyObject *>(seq), i), &MaterialType)) {
+            PyErr_SetString(PyExc_TypeError, "must be Material");
+            return nullptr;
+        }
+
+    std::vector<uint8_t> ks(N, 0);
+
+    if (indices != nullptr) {
+        Py_buffer view; if (PyObject_GetBuffer(indices, &view, PyBUF_C_CONTIGUOUS) < 0) return nullptr;
+
+        bool valid = view.itemsize == 1 && size_t(view.len) == N;
+        if (valid) memcpy(ks.data(), view.buf, N);
+
+        PyBuffer_Release(&view);
+
+        if (!valid) {
+            PyErr_SetString(PyExc_ValueError, "expected one byte per voxel");
+            return nullptr;
+        }
+
+        for (auto k : ks) if (k >= n) {
+            PyErr_SetString(PyExc_IndexError, "material index out of range");
+            return nullptr;
+        }
+    }
+
+    std::vector<uint8_t> table(n);
+
+    for (Py_ssize_t i = 0; i < n; i++) {
+        auto k = self->ref->vxlData.intern(PyTuple_GET_ITEM(static_cast<PyObject *>(seq), i));
+
+        if (k < 0) {
+            PyErr_SetString(PyExc_ValueError, "too many materials");
+            return nullptr;
+        }
+
+        table[i] = k;
+    }
+
+    if (auto R = self->ref->recorder.get()) {
+        std::vector<uint32_t> ms(n);
+
+        for (Py_ssize_t i = 0; i < n; i++)
+            ms[i] = R->intern(PyTuple_GET_ITEM(static_cast<PyObject *>(seq), i));
+
+        for (size_t i = 0; i < N; i++)
+            R->put(Recorder::set, w[3 * i], w[3 * i + 1], w[3 * i + 2], ms[ks[i]]);
+    }
+
+    for (size_t i = 0; i < N; i++) {
+        int x = w[3 * i], y = w[3 * i + 1], z = w[3 * i + 2];
+
+        self->ref->vxlData.assign(x, y, z, table[ks[i]]);
+        self->ref->occupancy.mark(x, y, z);
+    }
+
+    Py_RETURN_NONE;
+}
+
+static PyObject * PyEngineFill(PyEngine * self, PyObject * args) {
+    int x1, y1, z1, x2, y2, z2; PyObject * o;
+
+    if (!PyArg_ParseTuple(args, "iiiiiiO!", &x1, &y1, &z1, &x2, &y2, &z2, &MaterialType, &o))
+        return nullptr;
+
+    if (auto R = self->ref->recorder.get()) {
+        auto m = R->intern(o); R->put(Recorder::fill, x1, y1, z1, x2, y2, z2, m);
+    }
+
+    if (!self->ref->vxlData.fill(x1, y1, z1, x2, y2, z2, o)) {
+        PyErr_SetString(PyExc_ValueError, "too many materials");
+        return nullptr;
+    }
+
+    self->ref->occupancy.mark(x1, y1, z1, x2, y2, z2);
+
+    Py_RETURN_NONE;
+}
+
 static PyObject * PyEngineClearMeth(PyEngine * self, PyObject *) {
     self->ref->clear();
 
     PyOwnedRef M(self->ref->protocol, "map"); RETZIFZ(M);
     RETZIFZ(self->ref->map = mapDataRef(M));
 
+    self->ref->occupancy.build(self->ref->map);
+
     Py_RETURN_NONE;
 }
 
 static PyObject * PyEngineFlush(PyEngine * self, PyObject *) {
+    if (auto R = self->ref->recorder.get()) R->put(Recorder::flush);
+
     self->ref->objects.clear();
 
     Py_RETURN_NONE;
@@ -246,13 +505,16 @@ static PyObject * PyEngineDig(PyEngine * self, PyObject * w) {
     if (!PyArg_ParseTuple(w, "iiiid", &player_id, &x, &y, &z, &value))
         return nullptr;
 
+    if (auto R = self->ref->recorder.get())
+        R->put(Recorder::dig, int32_t(player_id), x, y, z, value);
+
     if (self->ref->indestructible(x, y, z))
         Py_RETURN_NONE;
 
-    auto & voxel = self->ref->vxlData.get(x, y, z);
-    auto M = voxel.material();
+    auto & vxlData = self->ref->vxlData;
+    auto M = vxlData.material(x, y, z);
 
-    if (voxel.isub(value / M->durability))
+    if (vxlData.damage(x, y, z, value / M->durability))
         self->ref->onDestroy(player_id, x, y, z);
 
     Py_RETURN_NONE;
@@ -264,18 +526,21 @@ static PyObject * PyEngineSmash(PyEngine * self, PyObject * w) {
     if (!PyArg_ParseTuple(w, "iiiid", &player_id, &x, &y, &z, &ΔE))
         return nullptr;
 
+    if (auto R = self->ref->recorder.get())
+        R->put(Recorder::smash, int32_t(player_id), x, y, z, ΔE);
+
     if (self->ref->indestructible(x, y, z))
         Py_RETURN_NONE;
 
-    auto & voxel = self->ref->vxlData.get(x, y, z);
-    auto M = voxel.material();
+    auto & vxlData = self->ref->vxlData;
+    auto M = vxlData.material(x, y, z);
 
-    if (M->crumbly && randbool<double>(0.5) && self->ref->unstable(x, y, z)) {
+    if (M->crumbly && self->ref->stream().uniform() < 0.5 && self->ref->unstable(x, y, z)) {
         self->ref->onDestroy(player_id, x, y, z);
         Py_RETURN_NONE;
     }
 
-    if (voxel.isub(ΔE * (M->durability / M->absorption)))
+    if (vxlData.damage(x, y, z, ΔE * (M->durability / M->absorption)))
         self->ref->onDestroy(player_id, x, y, z);
 
     Py_RETURN_NONE;
@@ -288,11 +553,33 @@ static PyObject * PyEngineApply(PyEngine * self, PyObject * dict) {
         return nullptr;
     }
 
-    for (auto & [k, v] : self->ref->map->colors) {
-        PyOwnedRef i(PyEncode<unsigned int>(v & 0xFFFFFF));
-        self->ref->vxlData.set(k, PyDict_GetItem(dict, i));
+    self->ref->palette.retain(dict);
+
+    if (self->ref->recorder != nullptr)
+        PyEngineRecordApply(self->ref, dict);
+
+    std::unordered_map<uint32_t, uint8_t> palette;
+
+    Py_ssize_t i = 0; PyObject * k, * v;
+
+    while (PyDict_Next(dict, &i, &k, &v)) {
+        // Other keys never match any color.
+        auto color = PyLong_AsLongLong(k);
+        if (PyErr_Occurred()) { PyErr_Clear(); continue; }
+        if (color < 0 || 0xFFFFFF < color) continue;
+
+        auto index = self->ref->vxlData.intern(v);
+
+        if (index < 0) {
+            PyErr_SetString(PyExc_ValueError, "too many materials");
+            return nullptr;
+        }
+
+        palette.insert_or_assign(color, index);
     }
 
+    self->ref->apply(palette);
+
     Py_RETURN_NONE;
 }
 
@@ -316,6 +603,9 @@ static PyObject * PyEngineOnSpawn(PyEngine * self, PyObject * w) {
     auto p = vectorRef(po); RETZIFZ(p);
     auto f = vectorRef(fo); RETZIFZ(f);
 
+    if (auto R = self->ref->recorder.get())
+        R->put(Recorder::spawn, int32_t(i));
+
     auto & player = self->ref->players[i];
     player.set_position(p);
     player.set_orientation(f);
@@ -331,6 +621,9 @@ static PyObject * PyEngineOnDespawn(PyEngine * self, PyObject * w) {
         return nullptr;
 
     if (i < self->ref->players.size()) { // `PyEngineOnSpawn` is not called for spectators
+        if (auto R = self->ref->recorder.get())
+            R->put(Recorder::despawn, int32_t(i));
+
         auto & player = self->ref->players[i];
         player.set_crouch(false);
         player.set_position(nullptr);
@@ -349,22 +642,202 @@ static PyObject * PyEngineSetAnimation(PyEngine * self, PyObject * w) {
     if (!PyArg_ParseTuple(w, "ip", &i, &crouch))
         return nullptr;
 
+    if (auto R = self->ref->recorder.get())
+        R->put(Recorder::animation, int32_t(i), uint8_t(crouch));
+
     self->ref->players[i].set_crouch(crouch);
 
     Py_RETURN_NONE;
 }
 
+// Starts logging the inputs into the given file (or stops with `None`). The log begins with a snapshot
+// of the current state: environment, materials, voxels that differ from the palette and the players.
+// Objects in flight are not captured and the generator is restarted with the same seed.
+static PyObject * PyEngineRecord(PyEngine * self, PyObject * o) {
+    auto engine = self->ref; engine->recorder.reset();
+
+    if (o == Py_None) Py_RETURN_NONE;
+
+    PyObject * path; if (!PyUnicode_FSConverter(o, &path)) return nullptr;
+
+    auto fp = fopen(PyBytes_AS_STRING(path), "wb"); Py_DECREF(path);
+    if (fp == nullptr) return PyErr_SetFromErrnoWithFilenameObject(PyExc_OSError, o);
+
+    auto R = (engine->recorder = std::make_unique<Recorder>(fp)).get();
+
+    engine->seed(engine->seed());
+
+    R->put(Recorder::seed, engine->seed());
+    R->put(Recorder::integrator, uint8_t(engine->integrator));
+    R->put(Recorder::batched, uint8_t(engine->batched));
+    R->put(Recorder::trace, uint8_t(engine->onTrace != nullptr));
+    R->put(Recorder::update, engine->temperature, engine->pressure, engine->humidity, engine->wind.x, engine->wind.y, engine->wind.z);
+
+    auto & vxlData = engine->vxlData;
+
+    auto m1 = R->intern(vxlData.defaultMaterial); R->put(Recorder::defaultMaterial, m1);
+    auto m2 = R->intern(vxlData.waterMaterial());  R->put(Recorder::waterMaterial, m2);
+
+    std::unordered_map<uint32_t, PyObject *> palette;
+
+    if (engine->palette != nullptr) {
+        PyEngineRecordApply(engine, engine->palette);
+
+        Py_ssize_t i = 0; PyObject * k, * v;
+        while (PyDict_Next(engine->palette, &i, &k, &v))
+            palette.insert_or_assign(PyDecode<uint32_t>(k), v);
+    }
+
+    if (auto M = engine->map) vxlData.each([&](int x, int y, int z, PyObject * o, double d) {
+        if (!get_solid(x, y, z, M)) return;
+
+        PyObject * expected = vxlData.defaultMaterial;
+
+        if (auto iter = M->colors.find(get_pos(x, y, z)); iter != M->colors.end())
+            if (auto jter = palette.find(iter->second & 0xFFFFFF); jter != palette.end())
+                expected = jter->second;
+
+        if (o != expected)
+            { auto m = R->intern(o); R->put(Recorder::set, x, y, z, m); }
+
+        if (z < 62 && d < 1.0)
+            R->put(Recorder::durability, x, y, z, d);
+    });
+
+    for (size_t k = 0; k < engine->players.size(); k++) {
+        auto & P = engine->players[k]; if (!P.valid()) continue;
+
+        R->put(Recorder::spawn, int32_t(k));
+        R->put(Recorder::animation, int32_t(k), uint8_t(P.crouch()));
+    }
+
+    Py_RETURN_NONE;
+}
+
 static PyObject * PyEngineGetOnTrace(PyEngine * self, void *) {
     auto newref = self->ref->onTrace.incref();
     return newref == nullptr ? Py_NewRef(Py_None) : newref;
 }
 
 static int PyEngineSetOnTrace(PyEngine * self, PyObject * o, void *) {
+    if (auto R = self->ref->recorder.get())
+        R->put(Recorder::trace, uint8_t(PyCallable_Check(o)));
+
     self->ref->onTrace.retain(PyCallable_Check(o) ? o : nullptr);
 
     return 0;
 }
 
+static PyObject * PyEngineGetWorkers(PyEngine * self, void *)
+{ return PyEncode<size_t>(self->ref->workers()); }
+
+static int PyEngineSetWorkers(PyEngine * self, PyObject * o, void *) {
+    auto n = PyLong_AsSsize_t(o); RETERRIFERR();
+
+    if (n < 0) {
+        PyErr_SetString(PyExc_ValueError, "must be non-negative");
+        return -1;
+    }
+
+    self->ref->workers(n);
+    return 0;
+}
+
+static constexpr std::pair<Integrator, const char *> integrators[] = {
+    {Integrator::euler, "euler"}, {Integrator::rk4, "rk4"}, {Integrator::rk45, "rk45"}
+};
+
+static PyObject * PyEngineGetIntegrator(PyEngine * self, void *) {
+    for (auto & [k, name] : integrators)
+        if (k == self->ref->integrator) return PyUnicode_FromString(name);
+
+    Py_RETURN_NONE;
+}
+
+static int PyEngineSetIntegrator(PyEngine * self, PyObject * o, void *) {
+    auto name = PyUnicode_AsUTF8(o); RETERRIFZ(name);
+
+    for (auto & [k, value] : integrators)
+        if (strcmp(name, value) == 0) {
+            if (auto R = self->ref->recorder.get())
+                R->put(Recorder::integrator, uint8_t(k));
+
+            self->ref->integrator = k; return 0;
+        }
+
+    PyErr_SetString(PyExc_ValueError, "must be 'euler', 'rk4' or 'rk45'");
+    return -1;
+}
+
+static PyObject * PyEngineGetBatched(PyEngine * self, void *)
+{ return PyEncode<bool>(self->ref->batched); }
+
+static int PyEngineSetBatched(PyEngine * self, PyObject * o, void *) {
+    auto b = PyObject_IsTrue(o); if (b < 0) return -1;
+
+    if (auto R = self->ref->recorder.get())
+        R->put(Recorder::batched, uint8_t(b));
+
+    self->ref->batched = b;
+    return 0;
+}
+
+static PyObject * PyEngineGetSeed(PyEngine * self, void *)
+{ return PyEncode<unsigned long long>(self->ref->seed()); }
+
+static int PyEngineSetSeed(PyEngine * self, PyObject * o, void *) {
+    auto value = PyLong_AsUnsignedLongLong(o); RETERRIFERR();
+
+    if (auto R = self->ref->recorder.get())
+        R->put(Recorder::seed, uint64_t(value));
+
+    self->ref->seed(value);
+    return 0;
+}
+
+static PyObject * PyEngineRecording(PyEngine * self, void *)
+{ return PyEncode<bool>(self->ref->recorder != nullptr); }
+
+static PyObject * PyEngineGetStats(PyEngine * self, void *) {
+    auto & stats = self->ref->stats; auto & H = stats.steps;
+
+    return Py_BuildValue(
+        "{s:K,s:K,s:K,s:K,s:K,s:d,s:{s:K,s:K,s:K,s:K},s:K,s:{s:d,s:d,s:d,s:d,s:d}}",
+        "substeps",     (unsigned long long) stats.substeps,
+        "tests",        (unsigned long long) stats.tests,
+        "ricochets",    (unsigned long long) stats.ricochets,
+        "penetrations", (unsigned long long) stats.penetrations,
+        "callbacks",    (unsigned long long) stats.callbacks,
+        "elapsed",      stats.elapsed / 1e+3,
+        "retired",
+            "stopped",  (unsigned long long) stats.stopped,
+            "outside",  (unsigned long long) stats.outside,
+            "slow",     (unsigned long long) stats.slow,
+            "timeout",  (unsigned long long) stats.timeout,
+        "steps",        (unsigned long long) H.count(),
+        "step",
+            "p50",      H.percentile(0.50) / 1e+3,
+            "p90",      H.percentile(0.90) / 1e+3,
+            "p99",      H.percentile(0.99) / 1e+3,
+            "p999",     H.percentile(0.999) / 1e+3,
+            "max",      H.max() / 1e+3
+    );
+}
+
+// Counters can only be reset.
+static int PyEngineSetStats(PyEngine * self, PyObject * o, void *) {
+    if (o != nullptr && o != Py_None) {
+        PyErr_SetString(PyExc_TypeError, "can only be reset with None");
+        return -1;
+    }
+
+    self->ref->stats.reset();
+    return 0;
+}
+
+static PyObject * PyEngineFormat(PyEngine * self, void *)
+{ return PyUnicode_FromString(Record::format); }
+
 static PyObject * PyEngineGetDefault(PyEngine * self, void *) {
     return self->ref->vxlData.defaultMaterial.incref();
 }
@@ -375,6 +848,9 @@ static int PyEngineSetDefault(PyEngine * self, PyObject * o, void *) {
         return -1;
     }
 
+    if (auto R = self->ref->recorder.get())
+        { auto m = R->intern(o); R->put(Recorder::defaultMaterial, m); }
+
     self->ref->vxlData.defaultMaterial.retain(o);
     return 0;
 }
@@ -389,6 +865,9 @@ static int PyEngineSetWater(PyEngine * self, PyObject * o, void *) {
         return -1;
     }
 
+    if (auto R = self->ref->recorder.get())
+        { auto m = R->intern(o); R->put(Recorder::waterMaterial, m); }
+
     self->ref->vxlData.waterMaterial().retain(o);
     return 0;
 }
@@ -402,35 +881,50 @@ static PyMappingMethods PyEngineMapping = {
 static PyMethodDef PyEngineMethods[] = {
     {"step",          PyCFunction(PyEngineStep),         METH_VARARGS, NULL},
     {"add",           PyCFunction(PyEngineAdd),          METH_VARARGS, NULL},
+    {"register",      PyCFunction(PyEngineRegister),     METH_O,       NULL},
+    {"fire",          PyCFunction(PyEngineFire),         METH_VARARGS, NULL},
     {"update",        PyCFunction(PyEngineUpdate),       METH_O,       NULL},
     {"dig",           PyCFunction(PyEngineDig),          METH_VARARGS, NULL},
     {"smash",         PyCFunction(PyEngineSmash),        METH_VARARGS, NULL},
     {"apply",         PyCFunction(PyEngineApply),        METH_O,       NULL},
     {"clear",         PyCFunction(PyEngineClearMeth),    METH_NOARGS,  NULL},
     {"flush",         PyCFunction(PyEngineFlush),        METH_NOARGS,  NULL},
+    {"remove",        PyCFunction(PyEngineRemove),       METH_O,       NULL},
+    {"drain",         PyCFunction(PyEngineDrain),        METH_NOARGS,  NULL},
     {"on_spawn",      PyCFunction(PyEngineOnSpawn),      METH_VARARGS, NULL},
     {"on_despawn",    PyCFunction(PyEngineOnDespawn),    METH_VARARGS, NULL},
     {"set_animation", PyCFunction(PyEngineSetAnimation), METH_VARARGS, NULL},
+    {"record",        PyCFunction(PyEngineRecord),       METH_O,       NULL},
+    {"assign",        PyCFunction(PyEngineAssign),       METH_VARARGS, NULL},
+    {"fill",          PyCFunction(PyEngineFill),         METH_VARARGS, NULL},
     {NULL                                                                  }
 };
 
 static PyGetSetDef PyEngineGetset[] = {
-    {"lag",         getter(PyEngineLag),         nullptr,                    "Average time elapsed in `Engine.step` (μs)", NULL},
-    {"peak",        getter(PyEnginePeak),        nullptr,                    "Peak time elapsed in `Engine.lag` (μs)",     NULL},
-    {"alive",       getter(PyEngineAlive),       nullptr,                    "Number of alive objects",                    NULL},
-    {"total",       getter(PyEngineTotal),       nullptr,                    "Total number of registered objects",         NULL},
-    {"usage",       getter(PyEngineUsage),       nullptr,                    "Approximate memory usage (byte)",            NULL},
-    {"temperature", getter(PyEngineTemperature), nullptr,                    "Ambient temperature (°C)",                   NULL},
-    {"pressure",    getter(PyEnginePressure),    nullptr,                    "Ambient pressure (Pa)",                      NULL},
-    {"humidity",    getter(PyEngineHumidity),    nullptr,                    "Ambient relative humidity",                  NULL},
-    {"wind",        getter(PyEngineWind),        nullptr,                    "Wind velocity (m/s)",                        NULL},
-    {"density",     getter(PyEngineDensity),     nullptr,                    "Air density (kg/m³)",                        NULL},
-    {"mach",        getter(PyEngineMach),        nullptr,                    "Speed of sound (m/s)",                       NULL},
-    {"ppo2",        getter(PyEnginePPO2),        nullptr,                    "Partial pressure of oxygen (Pa)",            NULL},
-    {"on_trace",    getter(PyEngineGetOnTrace),  setter(PyEngineSetOnTrace), "Object position update callback",            NULL},
-    {"default",     getter(PyEngineGetDefault),  setter(PyEngineSetDefault), "Default material",                           NULL},
-    {"water",       getter(PyEngineGetWater),    setter(PyEngineSetWater),   "Water material",                             NULL},
-    {NULL                                                                                                                      }
+    {"lag",         getter(PyEngineLag),           nullptr,                       "Average time elapsed in `Engine.step` (μs)",                            NULL},
+    {"peak",        getter(PyEnginePeak),          nullptr,                       "Peak time elapsed in `Engine.lag` (μs)",                                NULL},
+    {"alive",       getter(PyEngineAlive),         nullptr,                       "Number of alive objects",                                               NULL},
+    {"total",       getter(PyEngineTotal),         nullptr,                       "Total number of registered objects",                                    NULL},
+    {"substeps",    getter(PyEngineSubsteps),      nullptr,                       "Number of sub-steps made since `Engine.clear`",                         NULL},
+    {"usage",       getter(PyEngineUsage),         nullptr,                       "Approximate memory usage (byte)",                                       NULL},
+    {"temperature", getter(PyEngineTemperature),   nullptr,                       "Ambient temperature (°C)",                                              NULL},
+    {"pressure",    getter(PyEnginePressure),      nullptr,                       "Ambient pressure (Pa)",                                                 NULL},
+    {"humidity",    getter(PyEngineHumidity),      nullptr,                       "Ambient relative humidity",                                             NULL},
+    {"wind",        getter(PyEngineWind),          nullptr,                       "Wind velocity (m/s)",                                                   NULL},
+    {"density",     getter(PyEngineDensity),       nullptr,                       "Air density (kg/m³)",                                                   NULL},
+    {"mach",        getter(PyEngineMach),          nullptr,                       "Speed of sound (m/s)",                                                  NULL},
+    {"ppo2",        getter(PyEnginePPO2),          nullptr,                       "Partial pressure of oxygen (Pa)",                                       NULL},
+    {"on_trace",    getter(PyEngineGetOnTrace),    setter(PyEngineSetOnTrace),    "Object position update callback",                                       NULL},
+    {"default",     getter(PyEngineGetDefault),    setter(PyEngineSetDefault),    "Default material",                                                      NULL},
+    {"water",       getter(PyEngineGetWater),      setter(PyEngineSetWater),      "Water material",                                                        NULL},
+    {"workers",     getter(PyEngineGetWorkers),    setter(PyEngineSetWorkers),    "Number of worker threads used by `step`",                               NULL},
+    {"batched",     getter(PyEngineGetBatched),    setter(PyEngineSetBatched),    "Whether trace and hit events are buffered until `Engine.drain`",        NULL},
+    {"format",      getter(PyEngineFormat),        nullptr,                       "Layout of the records returned by `Engine.drain` (see `struct`)",       NULL},
+    {"seed",        getter(PyEngineGetSeed),       setter(PyEngineSetSeed),       "Seed of the random number generator, setting it restarts the sequence", NULL},
+    {"integrator",  getter(PyEngineGetIntegrator), setter(PyEngineSetIntegrator), "Free flight integrator (“euler”, “rk4” or “rk45”)",                     NULL},
+    {"stats",       getter(PyEngineGetStats),      setter(PyEngineSetStats),      "Counters and step duration percentiles (μs), assigning None resets",    NULL},
+    {"recording",   getter(PyEngineRecording),     nullptr,                       "Whether the inputs are logged (see `Engine.record`)",                   NULL},
+    {NULL                                                                                                                                                       }
 };
 
 PyTypeObject PyEngineType = {
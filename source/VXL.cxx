@@ -1,85 +1,299 @@
 #include <VXL.hxx>
 
 // https://github.com/piqueserver/piqueserver/blob/master/pyspades/vxl_c.cpp
-#include <unordered_set>
+#include <algorithm>
+#include <cstring>
+#include <atomic>
+#include <array>
 
-#include <mutex>
-#include <queue>
+// Single-producer single-consumer ring: the flood fills push, `deleteQueueDrain` pops.
+static constexpr size_t deleteQueueCapacity = 1 << 20;
 
-std::mutex onDeleteMutex; // do we really need this?
-std::queue<int> onDeleteQueue;
+static struct {
+    std::array<int, deleteQueueCapacity> buffer;
+    std::atomic<size_t> head {0}, tail {0}, overflow {0};
+} deleteQueue;
+
+static inline void deleteQueuePush(int i) {
+    size_t head = deleteQueue.head.load(std::memory_order_relaxed);
+
+    if (head - deleteQueue.tail.load(std::memory_order_acquire) >= deleteQueueCapacity)
+        { deleteQueue.overflow.fetch_add(1, std::memory_order_relaxed); return; }
+
+    deleteQueue.buffer[head % deleteQueueCapacity] = i;
+    deleteQueue.head.store(head + 1, std::memory_order_release);
+}
+
+size_t deleteQueueDrain(int * out, size_t n) {
+    size_t tail = deleteQueue.tail.load(std::memory_order_relaxed);
+    size_t k = std::min(n, deleteQueue.head.load(std::memory_order_acquire) - tail);
+
+    for (size_t j = 0; j < k; j++, out += 3)
+        get_xyz(deleteQueue.buffer[(tail + j) % deleteQueueCapacity], out, out + 1, out + 2);
+
+    deleteQueue.tail.store(tail + k, std::memory_order_release);
+
+    return k;
+}
+
+size_t deleteQueueSize()
+{ return deleteQueue.head.load(std::memory_order_acquire) - deleteQueue.tail.load(std::memory_order_relaxed); }
+
+size_t deleteQueueOverflow()
+{ return deleteQueue.overflow.exchange(0, std::memory_order_relaxed); }
 
 void deleteQueueClear() {
-    onDeleteMutex.lock();
-    onDeleteQueue = {};
-    onDeleteMutex.unlock();
+    deleteQueue.tail.store(deleteQueue.head.load(std::memory_order_acquire), std::memory_order_release);
+    deleteQueue.overflow.store(0, std::memory_order_relaxed);
+}
+
+// `std::bitset` keeps its bits in an array of words, so it is read and copied as is.
+static constexpr size_t geometrySize = MAP_X * MAP_Y * MAP_Z / 8;
+static_assert(sizeof(MapData::geometry) == geometrySize);
+
+Heightmap::Heightmap(const MapData * M) : columns(MAP_X * MAP_Y) {
+    auto w = reinterpret_cast<const uint64_t *>(&M->geometry);
+
+    for (size_t k = 0; k < geometrySize / sizeof(uint64_t); k++)
+        for (uint64_t m = w[k]; m != 0; m &= m - 1)
+            insert(64 * k + std::countr_zero(m));
+}
+
+void Heightmap::update(const MapData * M, int x, int y, int z) {
+    if (!is_valid_position(x, y, z)) return;
+
+    int i = get_pos(x, y, z);
+    if (M->geometry[i]) insert(i); else erase(i);
+}
+
+void Heightmap::update(const MapData * M, int x, int y) {
+    if (x < 0 || x >= MAP_X || y < 0 || y >= MAP_Y) return;
+
+    uint64_t m = 0;
+
+    for (int z = 0; z < MAP_Z; z++)
+        if (M->geometry[get_pos(x, y, z)]) m |= uint64_t(1) << z;
+
+    columns[get_pos(x, y, 0)] = m;
+}
+
+int traverseNode(int x, int y, int z, MapData * M, int destroy, Heightmap * H) {
+    // Nodes are marked when pushed, so the stack never holds one twice; `nodes` keeps them in the order of visiting.
+    static Visited visited; static std::vector<int> stack, nodes;
+
+    if (z >= 62) return 0;
+
+    visited.clear(); stack.clear(); nodes.clear();
+
+    auto push = [&](int i) { if (M->geometry[i] && visited.insert(i)) stack.push_back(i); };
+
+    int i = get_pos(x, y, z); visited.insert(i); stack.push_back(i);
+
+    while (!stack.empty()) {
+        int i = stack.back(); stack.pop_back(); nodes.push_back(i);
+        int x = i % MAP_X, y = (i / MAP_X) % MAP_Y, z = i / (MAP_X * MAP_Y);
+
+        // Same order as before: the voxel below is taken first.
+        if (z > 0)         push(i - MAP_X * MAP_Y);
+        if (y > 0)         push(i - MAP_X);
+        if (y < MAP_Y - 1) push(i + MAP_X);
+        if (x > 0)         push(i - 1);
+        if (x < MAP_X - 1) push(i + 1);
+
+        int j = i + MAP_X * MAP_Y;
+
+        if (M->geometry[j]) {
+            if (z + 1 >= 62) return 0;
+            push(j);
+        }
+    }
+
+    if (destroy) for (auto i : nodes) {
+        M->geometry[i] = 0;
+        M->colors.erase(i);
+        if (H) H->erase(i);
+        deleteQueuePush(i);
+    }
+
+    return nodes.size();
+}
+
+// Neighbours in the order of `traverseNode` (the flood fill takes the last one first, so the voxel below goes first).
+static constexpr int directions[6][3] = {{0, 0, -1}, {0, -1, 0}, {0, 1, 0}, {-1, 0, 0}, {1, 0, 0}, {0, 0, 1}};
+static constexpr int opposite[6] = {5, 2, 1, 4, 3, 0};
+
+static constexpr int groundLevel = 62 * MAP_X * MAP_Y; // positions from here on are at z ≥ 62
+
+static inline int neighbour(int i, int d) {
+    int x = i % MAP_X + directions[d][0], y = (i / MAP_X) % MAP_Y + directions[d][1], z = i / (MAP_X * MAP_Y) + directions[d][2];
+    return is_valid_position(x, y, z) ? get_pos(x, y, z) : -1;
 }
 
-int deleteQueuePop() {
-    onDeleteMutex.lock();
-    int retval = -1;
+// Scratch space shared by all maps. `proven` and `broken` hold the voxels whose chains were found valid or not
+// since the last removal, they stay valid until the next one, as removing detached voxels does not change that.
+struct SupportScratch { Visited proven, broken, walk, visited; std::vector<int> stack, nodes, path; };
 
-    if (!onDeleteQueue.empty()) {
-        retval = onDeleteQueue.front();
-        onDeleteQueue.pop();
+static SupportScratch & scratch() { static SupportScratch S; return S; }
+
+bool Support::grounded(MapData * M, int i) {
+    auto & S = scratch(); S.walk.clear(); S.path.clear(); bool retval;
+
+    for (;;) {
+        if (i >= 0 && S.proven.contains(i)) { retval = true; break; }
+        if (i < 0 || !M->geometry[i] || S.broken.contains(i) || !S.walk.insert(i)) { retval = false; break; }
+        if (i >= groundLevel) { retval = true; break; }
+
+        S.path.push_back(i); i = link[i] == 0 ? -1 : neighbour(i, link[i] - 1);
     }
 
-    onDeleteMutex.unlock();
+    for (auto j : S.path) (retval ? S.proven : S.broken).insert(j);
 
     return retval;
 }
 
-int traverseNode(int x, int y, int z, MapData * M, int destroy) {
-    constexpr size_t nodeReserveSize = 250000;
+int Support::check(MapData * M, Heightmap * H, int i) {
+    if (grounded(M, i)) return 0;
 
-    static std::vector<Vector3i> queue;
-    static std::unordered_set<int> marked;
+    auto & S = scratch(); S.visited.clear(); S.stack.clear(); S.nodes.clear();
 
-    if (queue.capacity() < nodeReserveSize)
-        queue.reserve(nodeReserveSize);
+    S.visited.insert(i); S.stack.push_back(i); int root = -1;
 
-    queue.emplace_back(x, y, z);
+    while (!S.stack.empty() && root < 0) {
+        int j = S.stack.back(); S.stack.pop_back(); S.nodes.push_back(j);
 
-    while (!queue.empty()) {
-        Vector3i & v = queue.back();
-        int x = v.x, y = v.y, z = v.z;
+        for (int d = 0; d < 6; d++) {
+            int k = neighbour(j, d);
+            if (k < 0 || !M->geometry[k] || !S.visited.insert(k)) continue;
 
-        if (z >= 62) {
-            queue.clear();
-            marked.clear();
-            return 0;
+            if (grounded(M, k)) { root = k; break; }
+            S.stack.push_back(k);
         }
+    }
 
-        queue.pop_back();
+    if (root >= 0) {
+        // Everything visited is connected to `root`, so it is relinked along a breadth-first tree rooted there.
+        S.walk.clear(); S.walk.insert(root); S.path.assign(1, root);
 
-        int i = get_pos(x, y, z);
+        for (size_t n = 0; n < S.path.size(); n++) {
+            int j = S.path[n];
 
-        auto [_, inserted] = marked.insert(i);
+            for (int d = 0; d < 6; d++) {
+                int k = neighbour(j, d);
+                if (k < 0 || !S.visited.contains(k) || !S.walk.insert(k)) continue;
 
-        if (inserted) { // already visited?
-            visit(queue, x, y, z - 1, M);
-            visit(queue, x, y - 1, z, M);
-            visit(queue, x, y + 1, z, M);
-            visit(queue, x - 1, y, z, M);
-            visit(queue, x + 1, y, z, M);
-            visit(queue, x, y, z + 1, M);
+                link[k] = 1 + opposite[d]; S.proven.insert(k); S.path.push_back(k);
+            }
         }
+
+        return 0;
     }
 
-    onDeleteMutex.lock();
+    for (auto j : S.nodes) {
+        M->geometry[j] = 0;
+        M->colors.erase(j);
+        if (H) H->erase(j);
+        link[j] = 0;
+        deleteQueuePush(j);
+    }
 
-    // destroy the node’s path!
-    if (destroy) for (auto i : marked) {
-        M->geometry[i] = 0;
-        M->colors.erase(i);
-        onDeleteQueue.push(i);
+    return S.nodes.size();
+}
+
+int Support::destroy(MapData * M, Heightmap * H, int x, int y, int z) {
+    if (!is_valid_position(x, y, z) || z >= 62) return 0;
+
+    int i = get_pos(x, y, z); if (!M->geometry[i]) return 0;
+
+    M->geometry[i] = 0; M->colors.erase(i); link[i] = 0; if (H) H->erase(i);
+
+    auto & S = scratch(); S.proven.clear(); S.broken.clear(); int count = 1;
+
+    for (int d = 0; d < 6; d++) {
+        int k = neighbour(i, d);
+        if (k >= 0 && k < groundLevel && M->geometry[k]) count += check(M, H, k);
+    }
+
+    return count;
+}
+
+// Makes room for `n` more colors, growing the table geometrically so that many small writes do not rehash it every time.
+static inline void reserve(MapData * M, size_t n) {
+    auto & colors = M->colors; size_t k = colors.size() + n;
+
+    if (k > colors.bucket_count() * colors.max_load_factor())
+        colors.reserve(std::max(k, 2 * colors.size()));
+}
+
+void fillBox(MapData * M, Heightmap * H, int x1, int y1, int z1, int x2, int y2, int z2, bool colored, int color) {
+    x1 = std::max(x1, 0); x2 = std::min(x2, MAP_X);
+    y1 = std::max(y1, 0); y2 = std::min(y2, MAP_Y);
+    z1 = std::max(z1, 0); z2 = std::min(z2, MAP_Z);
+
+    if (x2 <= x1 || y2 <= y1 || z2 <= z1) return;
+
+    if (colored) reserve(M, size_t(x2 - x1) * (y2 - y1) * (z2 - z1));
+
+    for (int z = z1; z < z2; z++)
+        for (int y = y1; y < y2; y++)
+            for (int x = x1; x < x2; x++) {
+                int i = get_pos(x, y, z);
+
+                M->geometry[i] = 1;
+                if (colored) M->colors[i] = color;
+                if (H) H->insert(i);
+            }
+}
+
+void stampPoints(MapData * M, Heightmap * H, const int * w, size_t n, const int * colors, int color, const int * offsets, size_t m) {
+    reserve(M, n * m);
+
+    for (size_t j = 0; j < m; j++)
+        for (size_t i = 0; i < n; i++) {
+            int x = w[3 * i] + offsets[3 * j], y = w[3 * i + 1] + offsets[3 * j + 1], z = w[3 * i + 2] + offsets[3 * j + 2];
+            if (!is_valid_position(x, y, z)) continue;
+
+            int k = get_pos(x, y, z);
+
+            M->geometry[k] = 1;
+            M->colors[k] = colors == nullptr ? color : colors[i];
+            if (H) H->insert(k);
+        }
+}
+
+size_t mapImageSize(const MapData * M)
+{ return geometrySize + M->colors.size() * 2 * sizeof(int); }
+
+void dumpMap(const MapData * M, char * out) {
+    memcpy(out, &M->geometry, geometrySize);
+
+    std::vector<std::pair<int, int>> colors(M->colors.begin(), M->colors.end());
+    std::sort(colors.begin(), colors.end());
+
+    auto w = out + geometrySize;
+
+    for (auto & [i, color] : colors) {
+        memcpy(w, &i, sizeof(int)); w += sizeof(int);
+        memcpy(w, &color, sizeof(int)); w += sizeof(int);
     }
+}
+
+bool loadMap(MapData * M, const char * in, size_t size) {
+    if (size < geometrySize || (size - geometrySize) % (2 * sizeof(int)) != 0) return false;
 
-    onDeleteMutex.unlock();
+    memcpy(&M->geometry, in, geometrySize);
 
-    int amount = marked.size();
-    queue.clear();
-    marked.clear();
+    size_t n = (size - geometrySize) / (2 * sizeof(int)); auto w = in + geometrySize;
+
+    M->colors.clear(); M->colors.reserve(n);
+
+    for (size_t k = 0; k < n; k++) {
+        int i, color;
+
+        memcpy(&i, w, sizeof(int)); w += sizeof(int);
+        memcpy(&color, w, sizeof(int)); w += sizeof(int);
+
+        M->colors.emplace(i, color);
+    }
 
-    return amount;
+    return true;
 }
@@ -1,10 +1,20 @@
 from libcpp cimport bool as bool_t
-from cpython.ref cimport PyTypeObject
+from cpython.ref cimport PyTypeObject, PyObject
 
 from pyspades.common cimport Vector, Vertex3
 from pyspades.vxl cimport VXLData, MapData
 from pyspades.common import Vertex3
 
+from time import sleep, thread_time
+
+cdef extern from "Python.h":
+    ctypedef struct PyFrameObject:
+        pass
+
+    ctypedef int (*Py_tracefunc)(PyObject *, PyFrameObject *, int, PyObject *) except -1
+
+    void PyEval_SetProfile(Py_tracefunc, PyObject *)
+
 cdef public class Material[object Material, type MaterialType]:
     cdef public str name
     "Material name"
@@ -34,6 +44,75 @@ cdef public class Material[object Material, type MaterialType]:
         for k, v in kw.items():
             setattr(self, k, v)
 
+class Cancelled(Exception):
+    pass
+
+cdef class Throttle:
+    """
+    Keeps the thread it is installed in within `budget` of a single CPU: after every `slice` (s) of CPU time
+    the thread sleeps (releasing the GIL) in proportion to it. The CPU time is checked every `period` calls and returns.
+    """
+
+    cdef public double budget
+    "Fraction of a single CPU, 1 or more disables the throttle"
+
+    cdef public double slice
+    "CPU time (s) between the sleeps"
+
+    cdef public int period
+    "Number of profile events between the checks"
+
+    cdef public bool_t cancelled
+    "Whether the next check raises `Cancelled` in the throttled thread"
+
+    cdef int count
+    cdef double T
+
+    def __init__(self, double budget, double slice = 0.01, int period = 1024):
+        self.budget    = budget
+        self.slice     = slice
+        self.period    = period
+        self.cancelled = False
+        self.count     = 0
+        self.T         = -1
+
+    def lift(self):
+        self.budget = 1
+
+    def cancel(self):
+        self.cancelled = True
+
+    def install(self):
+        "Installs the throttle in the current thread (as `sys.setprofile` does)"
+        PyEval_SetProfile(throttleHook, <PyObject *> self)
+
+cdef int throttleHook(PyObject * o, PyFrameObject * frame, int what, PyObject * arg) except -1:
+    cdef Throttle self = <Throttle> o
+
+    self.count += 1
+
+    if self.count < self.period:
+        return 0
+
+    self.count = 0
+
+    if self.cancelled:
+        raise Cancelled()
+
+    if self.budget >= 1:
+        PyEval_SetProfile(NULL, NULL)
+        return 0
+
+    cdef double T = thread_time()
+
+    if self.T < 0:
+        self.T = T
+    elif T - self.T >= self.slice:
+        sleep((T - self.T) * (1 - self.budget) / self.budget)
+        self.T = thread_time()
+
+    return 0
+
 cdef public MapData * mapDataRef(object o):
     assert isinstance(o, VXLData)
 
@@ -39,9 +39,45 @@ cdef class TracerPacket(Loader):
 
         writer.writeByte(0xFF if self.origin else 0x00, False)
 
+# Packets written one after another into `writer`, each ending at the corresponding offset.
+cdef list split(ByteWriter writer, list offsets):
+    cdef bytes data = bytes(writer)
+    cdef list retval = []
+    cdef size_t begin = 0, end
+
+    for end in offsets:
+        retval.append(data[begin:end]); begin = end
+
+    return retval
+
 def hasTraceExtension(player):
     return EXTENSION_TRACE_BULLETS in player.proto_extensions
 
+def tracers(const unsigned char[:] kind, unsigned char selected, const unsigned long long[:] index,
+            const double[:] x, const double[:] y, const double[:] z, const double[:] value, const unsigned char[:] origin):
+    """
+    Encodes a `TracerPacket` for every record of the kind `selected`, given the columns of the records.
+    """
+    cdef TracerPacket packet = TracerPacket.__new__(TracerPacket)
+    cdef ByteWriter writer = ByteWriter()
+    cdef list offsets = []
+    cdef Py_ssize_t i
+
+    for i in range(kind.shape[0]):
+        if kind[i] != selected: continue
+
+        packet.index  = <int> index[i]
+        packet.x      = x[i]
+        packet.y      = y[i]
+        packet.z      = z[i]
+        packet.value  = value[i]
+        packet.origin = origin[i]
+
+        packet.write(writer)
+        offsets.append(writer.tell())
+
+    return split(writer, offsets)
+
 cdef class HitEffectPacket(Loader):
     id = EXTENSION_BASE + EXTENSION_HIT_EFFECTS
 
@@ -74,3 +110,31 @@ cdef class HitEffectPacket(Loader):
 
 def hasHitEffects(player):
     return EXTENSION_HIT_EFFECTS in player.proto_extensions
+
+def hitEffects(const unsigned char[:] kind, unsigned char selected, int target,
+               const double[:] xf, const double[:] yf, const double[:] zf, const int[:] xi, const int[:] yi, const int[:] zi):
+    """
+    Encodes a `HitEffectPacket` with the given `target` for every record of the kind `selected`,
+    given the columns of the records.
+    """
+    cdef HitEffectPacket packet = HitEffectPacket.__new__(HitEffectPacket)
+    cdef ByteWriter writer = ByteWriter()
+    cdef list offsets = []
+    cdef Py_ssize_t i
+
+    packet.target = target
+
+    for i in range(kind.shape[0]):
+        if kind[i] != selected: continue
+
+        packet.xf = xf[i]
+        packet.yf = yf[i]
+        packet.zf = zf[i]
+        packet.xi = xi[i]
+        packet.yi = yi[i]
+        packet.zi = zi[i]
+
+        packet.write(writer)
+        offsets.append(writer.tell())
+
+    return split(writer, offsets)
@@ -1,23 +1,194 @@
-from pyspades.vxl cimport VXLData, MapData, get_solid
+from cpython.buffer cimport PyObject_CheckBuffer
+from cpython.bytes cimport PyBytes_FromStringAndSize, PyBytes_AS_STRING
+from cpython.array cimport array as carray, clone, resize
+from pyspades.vxl cimport VXLData, MapData
+
+from itertools import chain
+from array import array
 
 cdef extern from "VXL.hxx":
-    int traverseNode(int, int, int, MapData *, int)
-    int c_deleteQueuePop "deleteQueuePop"()
+    int traverseNode(int, int, int, MapData *, int, Heightmap *)
+    size_t c_deleteQueueDrain "deleteQueueDrain"(int *, size_t)
+    size_t c_deleteQueueSize "deleteQueueSize"()
+    size_t c_deleteQueueOverflow "deleteQueueOverflow"()
     void c_deleteQueueClear "deleteQueueClear"()
 
+    void fillBox(MapData *, Heightmap *, int, int, int, int, int, int, bint, int)
+    void stampPoints(MapData *, Heightmap *, const int *, size_t, const int *, int, const int *, size_t)
+
+    size_t mapImageSize(const MapData *)
+    void dumpMap(const MapData *, char *)
+    bint loadMap(MapData *, const char *, size_t) nogil
+
+    cdef cppclass Heightmap:
+        Heightmap(const MapData *) except +
+        void update(const MapData *, int, int, int)
+        void update(const MapData *, int, int)
+        int find(int, int, int, int, int)
+
+    cdef cppclass Support:
+        Support() except +
+        int destroy(MapData *, Heightmap *, int, int, int)
+
+# Same as `VXLData.set_point` stores: 0xRRGGBB with the alpha of 128.
+cdef inline int packed(unsigned int color):
+    return <int>((color & 0xFFFFFF) | (<unsigned int>128 << 24))
+
+cdef inline int rgb(tuple color):
+    r, g, b = color
+    return packed(b | (g << 8) | (r << 16))
+
+# Either a flat buffer of int32 (like `array('i')`) or a sequence of (x, y, z).
+cdef const int[::1] triples(object o) except *:
+    cdef const int[::1] w = o if PyObject_CheckBuffer(o) else array('i', chain.from_iterable(o))
+
+    if w.shape[0] % 3 != 0:
+        raise ValueError("expected (x, y, z) triples")
+
+    return w
+
 cdef class VxlData(VXLData):
+    cdef Support * support
+    cdef Heightmap * heightmap
+
+    def __dealloc__(self):
+        del self.support
+        del self.heightmap
+
+    # Built on the first query, so that maps that are never asked do not pay for it.
+    cdef Heightmap * heights(self) except NULL:
+        if self.heightmap == NULL:
+            self.heightmap = new Heightmap(self.map)
+
+        return self.heightmap
+
+    cdef inline void sync(self, int x, int y, int z):
+        if self.heightmap != NULL:
+            self.heightmap.update(self.map, x, y, z)
+
+    cdef inline void sync_column(self, int x, int y):
+        if self.heightmap != NULL:
+            self.heightmap.update(self.map, x, y)
+
+    cdef inline void reset(self):
+        del self.heightmap
+        self.heightmap = NULL
+
+    def load_vxl(self, c_data = None):
+        VXLData.load_vxl(self, c_data)
+        self.reset()
+
+    def set_overview(self, data_str, int z):
+        VXLData.set_overview(self, data_str, z)
+        self.reset()
+
+    def set_point(self, int x, int y, int z, tuple color):
+        VXLData.set_point(self, x, y, z, color)
+        self.sync(x, y, z)
+
+    def remove_point(self, int x, int y, int z):
+        VXLData.remove_point(self, x, y, z)
+        self.sync(x, y, z)
+
+    cpdef bint build_point(self, int x, int y, int z, tuple color):
+        cdef bint retval = VXLData.build_point(self, x, y, z, color)
+        self.sync(x, y, z)
+
+        return retval
+
+    cpdef bint set_column_fast(self, int x, int y, int z_start, int z_end, int z_color_end, int color):
+        cdef bint retval = VXLData.set_column_fast(self, x, y, z_start, z_end, z_color_end, color)
+        self.sync_column(x, y)
+
+        return retval
+
     cpdef int check_node(self, int x, int y, int z, bint destroy = False):
-        return traverseNode(x, y, z, self.map, destroy)
+        return traverseNode(x, y, z, self.map, destroy, self.heightmap)
+
+    def destroy_point(self, int x, int y, int z):
+        """
+        Same as `VXLData.destroy_point`, but the voxels left without support are found using the links
+        between the voxels kept since the first call (see `Support`), mostly without a flood fill of the whole structure.
+        """
+        if self.support == NULL:
+            self.support = new Support()
+
+        return self.support.destroy(self.map, self.heightmap, x, y, z)
 
     cpdef int get_z(self, int x, int y, int zmin = 0, int zmax = 64, int zerr = 0):
-        for z in range(zmin, zmax):
-            if get_solid(x, y, z, self.map):
-                return z
+        """
+        First solid z in [zmin, zmax) of the column (x, y) or `zerr` if there is none,
+        so `get_z(x, y, z + 1)` is the next solid voxel below (x, y, z). O(1), see `Heightmap`.
+        """
+        return self.heights().find(x, y, zmin, zmax, zerr)
+
+    def dumps(self):
+        """
+        Returns the raw image of the map (unlike `generate` it keeps the colors of the inner voxels).
+        """
+        retval = PyBytes_FromStringAndSize(NULL, mapImageSize(self.map))
+        dumpMap(self.map, PyBytes_AS_STRING(retval))
+
+        return retval
+
+    @staticmethod
+    def loads(const unsigned char[::1] data):
+        """
+        Inverse of `dumps`, `data` may be any buffer (like `mmap`). The GIL is released meanwhile.
+        """
+        cdef VxlData retval = VxlData()
+        cdef bint ok = False
+
+        if data.shape[0] > 0:
+            with nogil: ok = loadMap(retval.map, <const char *> &data[0], data.shape[0])
+
+        if not ok:
+            raise ValueError("not a map image")
+
+        return retval
+
+    def fill_box(self, int x1, int y1, int z1, int x2, int y2, int z2, tuple color):
+        """
+        Fills the box [x1, x2) × [y1, y2) × [z1, z2) with the color (r, g, b),
+        None makes it solid leaving the colors as they are (like `set_column_fast`).
+        """
+        fillBox(self.map, self.heightmap, x1, y1, z1, x2, y2, z2, color is not None, 0 if color is None else rgb(color))
+
+    def fill_layer(self, int z, tuple color):
+        fillBox(self.map, self.heightmap, 0, 0, z, 512, 512, z + 1, color is not None, 0 if color is None else rgb(color))
+
+    def fill_column(self, int x, int y, int z1, int z2, tuple color):
+        fillBox(self.map, self.heightmap, x, y, z1, x + 1, y + 1, z2, color is not None, 0 if color is None else rgb(color))
+
+    def set_points(self, coords, colors):
+        """
+        Same as `set_point` for every voxel in `coords`, see `stamp`.
+        """
+        self.stamp(coords, colors, [(0, 0, 0)])
+
+    def stamp(self, coords, colors, offsets):
+        """
+        Sets the voxels `coords` shifted by each of `offsets` (both are flat int32 buffers or sequences of (x, y, z)).
+        `colors` is either a single (r, g, b) or a color (0xRRGGBB, as from `make_color`) for every voxel.
+        """
+        cdef const int[::1] w = triples(coords)
+        cdef const int[::1] o = triples(offsets)
+        cdef int[::1] c
+
+        cdef size_t n = w.shape[0] // 3, m = o.shape[0] // 3
+
+        if n == 0 or m == 0:
+            return
+
+        if isinstance(colors, tuple):
+            stampPoints(self.map, self.heightmap, &w[0], n, NULL, rgb(colors), &o[0], m)
+        else:
+            c = array('i', [packed(color) for color in colors])
 
-        return zerr
+            if c.shape[0] != n:
+                raise ValueError("expected a color for every voxel")
 
-cdef extern from "vxl_c.h":
-    void get_xyz(int, int *, int *, int *)
+            stampPoints(self.map, self.heightmap, &w[0], n, &c[0], 0, &o[0], m)
 
 cdef extern from "world_c.cpp":
     MapData * global_map
@@ -53,14 +224,26 @@ def cast_ray(VXLData data, float x0, float y0, float z0, float x1, float y1, flo
 def deleteQueueClear():
     c_deleteQueueClear()
 
-def onDeleteQueue():
-    cdef int x, y, z, index
+def deleteQueueSize():
+    return c_deleteQueueSize()
 
-    while True:
-        index = c_deleteQueuePop()
+def deleteQueueOverflow():
+    """
+    Number of the removed voxels dropped since the last call because the delete queue was full.
+    """
+    return c_deleteQueueOverflow()
 
-        if index < 0:
-            return
+def deleteQueueDrain(size_t n = -1):
+    """
+    Takes at most `n` removed voxels from the delete queue, returns them as `array('i')` of (x, y, z) triples.
+    """
+    cdef carray retval = clone(array('i'), 3 * min(n, c_deleteQueueSize()), False)
+    resize(retval, 3 * c_deleteQueueDrain(retval.data.as_ints, len(retval) // 3))
+
+    return retval
+
+def onDeleteQueue():
+    w = deleteQueueDrain()
+    it = iter(w)
 
-        get_xyz(index, &x, &y, &z)
-        yield x, y, z
+    return zip(it, it, it)